@@ -0,0 +1,103 @@
+# benchmarks/fixtures.py
+#
+# Small, deterministic datasets for the offline benchmarks: a product
+# catalog in the Product_Information_Dataset.csv schema and an order table
+# in the Order_Data_Dataset.csv schema. Same seed, same files.
+
+import csv
+import json
+import random
+import datetime
+from typing import Dict, List
+
+# (category, product nouns, descriptive words)
+CATALOG_THEMES = [
+    ("Musical Instruments", ["guitar strings", "acoustic guitar", "electric guitar", "bass guitar",
+                             "ukulele", "mandolin", "violin", "cello", "piano keyboard", "drum kit",
+                             "trumpet", "guitar pedal", "capo", "guitar tuner"],
+     ["nickel", "phosphor bronze", "beginner", "professional", "vintage", "compact", "studio"]),
+    ("Audio", ["microphone", "condenser microphone", "headphones", "wireless headphones",
+               "studio monitor speakers", "audio interface", "pop filter", "mic stand"],
+     ["USB", "XLR", "noise cancelling", "over-ear", "portable", "low latency", "cardioid"]),
+    ("Accessories", ["instrument cable", "gig bag", "guitar strap", "music stand", "sheet music light",
+                     "keyboard stand", "humidifier pack"],
+     ["padded", "adjustable", "foldable", "heavy duty", "braided", "lightweight"]),
+]
+
+ORDER_CATEGORIES = {
+    "Auto & Accessories": ["Car Seat Covers", "Tyre", "Car Pillow & Neck Rest", "Car Body Covers",
+                           "Car Mat", "Car Speakers"],
+    "Electronic": ["Mobile Phone", "Cell-Phone Cases", "Headphones", "Speakers", "Smart Watch"],
+    "Fashion": ["T-Shirts", "Sports Wear", "Running Shoes", "Jeans", "Watches"],
+    "Home & Furniture": ["Sofa Covers", "Bed Sheets", "Curtains", "Table Lamp", "Towels"],
+}
+
+ORDER_COLUMNS = ["Order_Date", "Time", "Aging", "Customer_Id", "Gender", "Device_Type",
+                 "Customer_Login_type", "Product_Category", "Product", "Sales", "Quantity",
+                 "Discount", "Profit", "Shipping_Cost", "Order_Priority", "Payment_method"]
+
+PRODUCT_COLUMNS = ["main_category", "title", "average_rating", "rating_number", "features",
+                   "description", "price", "store", "categories", "details", "parent_asin"]
+
+
+def write_catalog(path: str, count: int, seed: int = 0) -> Dict[str, List[str]]:
+    """
+    Writes `count` products; returns the ASINs and the product nouns used
+    (handy search queries).
+    """
+    rng = random.Random(seed)
+    asins, nouns = [], sorted({n for _, ns, _ in CATALOG_THEMES for n in ns})
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(PRODUCT_COLUMNS)
+        for i in range(count):
+            category, names, words = rng.choice(CATALOG_THEMES)
+            noun = rng.choice(names)
+            adjectives = rng.sample(words, 2)
+            title = f"{rng.choice(['Acme', 'Harmon', 'Sonora', 'Vox Lab', 'Keystone'])} {' '.join(adjectives)} {noun}".title()
+            features = [f"{adj.capitalize()} design" for adj in adjectives] + [f"Ideal for {noun}s at home or on stage"]
+            asin = f"B{i:09d}"
+            asins.append(asin)
+            writer.writerow([
+                category, title, round(min(5.0, max(1.0, rng.gauss(4.3, 0.5))), 1), rng.randint(1, 5000),
+                json.dumps(features), json.dumps([f"A {' '.join(adjectives)} {noun} for every player."]),
+                round(rng.uniform(5, 400), 2), "Bench Store", json.dumps([category, noun.title()]),
+                "{}", asin,
+            ])
+    return {"asins": asins, "queries": nouns}
+
+
+def write_orders(path: str, count: int, customers: int = 500, seed: int = 0) -> Dict[str, List]:
+    """
+    Writes `count` orders across `customers` customer IDs (a few of them
+    heavy buyers); returns the customer IDs and order categories.
+    """
+    rng = random.Random(seed)
+    customer_ids = [10000 + i for i in range(customers)]
+    weights = [20 if i < customers // 20 else 1 for i in range(customers)]
+    start = datetime.date(2018, 1, 1)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(ORDER_COLUMNS)
+        for _ in range(count):
+            category = rng.choice(list(ORDER_CATEGORIES))
+            sales = round(rng.uniform(20, 250), 0)
+            writer.writerow([
+                (start + datetime.timedelta(days=rng.randint(0, 364))).isoformat(),
+                f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+                float(rng.randint(1, 10)),
+                rng.choices(customer_ids, weights)[0],
+                rng.choice(["Male", "Female"]),
+                rng.choice(["Web", "Mobile"]),
+                rng.choice(["Member", "Guest", "First SignUp", "New"]),
+                category,
+                rng.choice(ORDER_CATEGORIES[category]),
+                sales,
+                float(rng.randint(1, 5)),
+                round(rng.choice([0.1, 0.2, 0.3, 0.4, 0.5]), 1),
+                round(sales * rng.uniform(-0.1, 0.7), 1),
+                round(rng.uniform(1, 20), 1),
+                rng.choices(["Critical", "High", "Medium", "Low"], [1, 3, 10, 2])[0],
+                rng.choice(["credit_card", "money_order", "e_wallet", "debit_card"]),
+            ])
+    return {"customer_ids": customer_ids[: max(1, customers // 20)], "categories": list(ORDER_CATEGORIES)}
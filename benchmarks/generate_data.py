@@ -0,0 +1,275 @@
+# benchmarks/generate_data.py
+#
+# Generates Product_Information_Dataset.csv and Order_Data_Dataset.csv at
+# any scale, in the same schemas as the real data, for scaling tests of
+# ProductRetriever, the FAISS index and the order store / query engine.
+#
+#   python benchmarks/generate_data.py --products 1000000 --orders 50000000 --out /data/scale
+#   python benchmarks/generate_data.py --products 1000000 --orders 0 --embeddings --faiss-index
+#
+# Distributions are skewed the way retail data is: category, product, brand
+# and customer popularity follow a power law (--skew), ratings pile up
+# between 4 and 5 with a tail of poor products, review counts are
+# long-tailed, and orders rise towards the end of the year.
+#
+# Rows are generated and written in chunks, so memory stays flat however
+# many rows are requested. Output is deterministic for a given --seed and
+# --chunk-size.
+#
+# --embeddings writes product_embeddings.npy (one unit vector per product,
+# row-aligned with the CSV, clustered by product type so nearest-neighbour
+# search behaves like it does on real embeddings). --faiss-index builds an
+# index directory that ProductRetriever loads from FAISS_INDEX_PATH, without
+# running the embedding model; it needs faiss and langchain installed.
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import CATALOG_THEMES, ORDER_CATEGORIES, ORDER_COLUMNS, PRODUCT_COLUMNS  # noqa: E402
+
+PRODUCT_FILE = "Product_Information_Dataset.csv"
+ORDER_FILE = "Order_Data_Dataset.csv"
+EMBEDDING_FILE = "product_embeddings.npy"
+
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+FIRST_CUSTOMER_ID = 10000  # the chat service recognises 5-digit Customer IDs
+
+BRAND_PREFIXES = ["Acme", "Harmon", "Sonora", "Vox", "Keystone", "Cedar", "Orbit", "Nova", "Summit", "Atlas",
+                  "Echo", "Pioneer", "Crest", "Lumen", "Forte", "Halo"]
+BRAND_SUFFIXES = ["", " Lab", " Audio", " Works", " Music", " Pro"]
+PRIORITIES = ["Medium", "High", "Low", "Critical"]
+PAYMENTS = ["credit_card", "money_order", "e_wallet", "debit_card"]
+LOGIN_TYPES = ["Member", "Guest", "First SignUp", "New"]
+
+
+def zipf_weights(n: int, skew: float) -> np.ndarray:
+    """Probabilities for ranks 1..n proportional to 1 / rank**skew."""
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def _chunks(total: int, size: int):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def _progress(label: str, done: int, total: int, started: float):
+    elapsed = time.perf_counter() - started
+    rate = done / elapsed if elapsed else 0.0
+    print(f"\r{label}: {done:,}/{total:,} rows ({rate:,.0f} rows/s)", end="", file=sys.stderr, flush=True)
+
+
+# ─── Products ─────────────────────────────────────────────────────────────────
+def _product_types(rng, skew: float):
+    """Every (theme, noun) pair, with a power-law popularity in shuffled order."""
+    types = [(theme, noun, words) for theme, nouns, words in CATALOG_THEMES for noun in nouns]
+    return types, rng.permutation(zipf_weights(len(types), skew))
+
+
+def write_products(path: str, count: int, seed: int = 0, skew: float = 1.1,
+                   chunk_size: int = 100_000, embeddings_path: str = None, dim: int = EMBEDDING_DIM):
+    """
+    Writes `count` products. When embeddings_path is set, also writes a
+    (count, dim) float32 .npy of unit vectors: each product type gets a
+    random centroid and each product a noisy copy of it.
+    """
+    rng = np.random.default_rng(seed)
+    types, type_p = _product_types(rng, skew)
+    brands = [p + s for s in BRAND_SUFFIXES for p in BRAND_PREFIXES]
+    brand_p = zipf_weights(len(brands), skew)
+    base_price = {theme: price for (theme, _, _), price in
+                  zip(CATALOG_THEMES, [120.0, 80.0, 25.0])}
+
+    vectors = centroids = None
+    if embeddings_path:
+        vectors = np.lib.format.open_memmap(embeddings_path, mode="w+", dtype=np.float32, shape=(count, dim))
+        centroids = rng.standard_normal((len(types), dim)).astype(np.float32)
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+
+    started = time.perf_counter()
+    for chunk_no, (start, n) in enumerate(_chunks(count, chunk_size)):
+        t = rng.choice(len(types), size=n, p=type_p)
+        b = rng.choice(len(brands), size=n, p=brand_p)
+        adjective_picks = rng.integers(0, 1 << 30, size=(n, 2))
+        # J-shaped ratings: most products 4-5 stars, a tail of poor ones
+        ratings = np.clip(np.round(5.0 - rng.gamma(1.5, 0.35, size=n), 1), 1.0, 5.0)
+        reviews = np.minimum(rng.lognormal(3.0, 1.6, size=n).astype(np.int64) + 1, 500_000)
+        price_noise = rng.lognormal(0.0, 0.6, size=n)
+        no_price = rng.random(n) < 0.05
+
+        rows = []
+        for i in range(n):
+            theme, noun, words = types[t[i]]
+            first = words[adjective_picks[i, 0] % len(words)]
+            second = words[adjective_picks[i, 1] % len(words)]
+            adjectives = f"{first} {second}" if first != second else first
+            brand = brands[b[i]]
+            asin = f"B{start + i:09d}"
+            features = [f"{first.capitalize()} design", "Made for home and stage use"]
+            rows.append((
+                theme,
+                f"{brand} {adjectives} {noun}".title(),
+                ratings[i],
+                reviews[i],
+                str(features),
+                str([f"A {adjectives} {noun} from {brand}."]),
+                "" if no_price[i] else round(float(base_price[theme] * price_noise[i]), 2),
+                brand,
+                str([theme, noun.title()]),
+                "{}",
+                asin,
+            ))
+        pd.DataFrame(rows, columns=PRODUCT_COLUMNS).to_csv(
+            path, mode="w" if chunk_no == 0 else "a", header=chunk_no == 0, index=False)
+
+        if vectors is not None:
+            block = centroids[t] + rng.standard_normal((n, dim)).astype(np.float32) * 0.35
+            block /= np.linalg.norm(block, axis=1, keepdims=True)
+            vectors[start:start + n] = block
+        _progress("products", start + n, count, started)
+
+    if vectors is not None:
+        vectors.flush()
+    print(file=sys.stderr)
+
+
+# ─── Orders ───────────────────────────────────────────────────────────────────
+def write_orders(path: str, count: int, customers: int = 80_000, seed: int = 0, skew: float = 1.1,
+                 chunk_size: int = 1_000_000, year: int = 2018):
+    """
+    Writes `count` orders for `customers` customer IDs. Customer activity,
+    category and product popularity follow a power law; daily volume grows
+    through the year with a peak in the last six weeks.
+    """
+    rng = np.random.default_rng(seed + 1)
+    categories = list(ORDER_CATEGORIES)
+    category_p = zipf_weights(len(categories), skew * 0.5)
+    product_p = {c: zipf_weights(len(ORDER_CATEGORIES[c]), skew) for c in categories}
+    # shuffle which customer IDs are the heavy buyers
+    customer_ids = rng.permutation(customers).astype(np.int64) + FIRST_CUSTOMER_ID
+    customer_p = zipf_weights(customers, skew * 0.8)
+    gender_of = rng.random(customers) < 0.55  # fixed per customer
+
+    days = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq="D")
+    day_p = 1.0 + np.linspace(0.0, 0.5, len(days))
+    day_p[-45:] *= 1.8
+    day_p /= day_p.sum()
+    day_text = np.array(days.strftime("%Y-%m-%d"))
+    time_text = np.array([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400)])
+
+    started = time.perf_counter()
+    for chunk_no, (start, n) in enumerate(_chunks(count, chunk_size)):
+        cat = rng.choice(len(categories), size=n, p=category_p)
+        product = np.empty(n, dtype=object)
+        for c, name in enumerate(categories):
+            mask = cat == c
+            names = np.array(ORDER_CATEGORIES[name], dtype=object)
+            product[mask] = names[rng.choice(len(names), size=int(mask.sum()), p=product_p[name])]
+        customer = rng.choice(customers, size=n, p=customer_p)
+        sales = np.round(rng.lognormal(4.4, 0.6, size=n))
+        frame = pd.DataFrame({
+            "Order_Date": day_text[rng.choice(len(days), size=n, p=day_p)],
+            "Time": time_text[rng.integers(0, 86400, size=n)],
+            "Aging": rng.integers(1, 11, size=n).astype(np.float64),
+            "Customer_Id": customer_ids[customer],
+            "Gender": np.where(gender_of[customer], "Male", "Female"),
+            "Device_Type": np.where(rng.random(n) < 0.92, "Web", "Mobile"),
+            "Customer_Login_type": np.array(LOGIN_TYPES)[rng.choice(4, size=n, p=[0.9, 0.06, 0.03, 0.01])],
+            "Product_Category": np.array(categories, dtype=object)[cat],
+            "Product": product,
+            "Sales": sales,
+            "Quantity": rng.integers(1, 6, size=n).astype(np.float64),
+            "Discount": rng.integers(1, 6, size=n) / 10,
+            "Profit": np.round(sales * rng.uniform(-0.1, 0.7, size=n), 1),
+            "Shipping_Cost": np.round(rng.uniform(1, 20, size=n), 1),
+            "Order_Priority": np.array(PRIORITIES)[rng.choice(4, size=n, p=[0.55, 0.3, 0.1, 0.05])],
+            "Payment_method": np.array(PAYMENTS)[rng.choice(4, size=n, p=[0.75, 0.1, 0.1, 0.05])],
+        }, columns=ORDER_COLUMNS)
+        frame.to_csv(path, mode="w" if chunk_no == 0 else "a", header=chunk_no == 0, index=False)
+        _progress("orders", start + n, count, started)
+    print(file=sys.stderr)
+
+
+# ─── FAISS index ──────────────────────────────────────────────────────────────
+def build_faiss_index(products_path: str, embeddings_path: str, index_path: str, chunk_size: int = 100_000):
+    """
+    Saves a LangChain FAISS index (index.faiss + index.pkl) over precomputed
+    embeddings, with the same document text and metadata as
+    ProductRetriever._create_index.
+    """
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores.faiss import FAISS
+    from langchain_core.documents import Document
+
+    vectors = np.load(embeddings_path, mmap_mode="r")
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    documents, ids = {}, {}
+    started = time.perf_counter()
+    done = 0
+    columns = ["title", "description", "features", "parent_asin"]
+    for frame in pd.read_csv(products_path, usecols=columns, chunksize=chunk_size):
+        index.add(np.ascontiguousarray(vectors[done:done + len(frame)]))
+        for title, desc, features, asin in frame.itertuples(index=False):
+            text = " ".join(json.loads(features.replace("'", '"'))) if isinstance(features, str) else ""
+            doc_id = str(done)
+            documents[doc_id] = Document(
+                page_content=f"{title if isinstance(title, str) else ''} "
+                             f"{desc if isinstance(desc, str) else ''} {text}",
+                metadata={"asin": asin},
+            )
+            ids[done] = doc_id
+            done += 1
+        _progress("index", done, len(vectors), started)
+    print(file=sys.stderr)
+    FAISS(None, index, InMemoryDocstore(documents), ids).save_local(index_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate product and order datasets at scale")
+    parser.add_argument("--out", default=".", help="output directory")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--customers", type=int, default=80_000,
+                        help="distinct customer IDs, from 10000 (keep under 90000 for 5-digit IDs)")
+    parser.add_argument("--skew", type=float, default=1.1, help="power-law exponent for popularity")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=None, help="rows generated per batch")
+    parser.add_argument("--embeddings", action="store_true", help=f"also write {EMBEDDING_FILE}")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM, help="embedding dimension")
+    parser.add_argument("--faiss-index", nargs="?", const="faiss_index", default=None, metavar="DIR",
+                        help="build a FAISS index from the embeddings (default DIR: <out>/faiss_index)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    products_path = os.path.join(args.out, PRODUCT_FILE)
+    orders_path = os.path.join(args.out, ORDER_FILE)
+    embeddings_path = os.path.join(args.out, EMBEDDING_FILE)
+    if args.faiss_index and not args.embeddings and not os.path.exists(embeddings_path):
+        args.embeddings = True
+
+    if args.products:
+        write_products(products_path, args.products, args.seed, args.skew, args.chunk_size or 100_000,
+                       embeddings_path if args.embeddings else None, args.dim)
+        print(f"Wrote {products_path}")
+        if args.embeddings:
+            print(f"Wrote {embeddings_path}")
+    if args.faiss_index:
+        index_path = os.path.join(args.out, args.faiss_index)
+        build_faiss_index(products_path, embeddings_path, index_path)
+        print(f"Wrote {index_path}")
+    if args.orders:
+        write_orders(orders_path, args.orders, args.customers, args.seed, args.skew, args.chunk_size or 1_000_000)
+        print(f"Wrote {orders_path}")
+
+
+if __name__ == "__main__":
+    main()
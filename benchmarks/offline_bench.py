@@ -0,0 +1,379 @@
+# benchmarks/offline_bench.py
+#
+# Reproducible, in-process benchmarks for the product, order and chat
+# services. No running services and no network: the Flask apps are loaded
+# from their directories and driven with test clients over synthetic
+# fixtures (fixtures.py), and Perplexity is replaced by a local stub with a
+# fixed latency. The chat service reaches the product and order apps over
+# loopback, exactly as it would in production.
+#
+#   python benchmarks/offline_bench.py --out bench.json
+#   python benchmarks/offline_bench.py --only order --concurrency 1 8 32
+#   python benchmarks/offline_bench.py --out new.json --baseline bench.json
+#
+# Results are written as JSON (one record per endpoint and concurrency
+# level). With --baseline, p95 latency or throughput that got worse by more
+# than --tolerance is reported and the exit status is 1.
+#
+# The real models (MiniLM, the CrossEncoder) are used, so the product and
+# chat runs need the same packages as the services and the models in the
+# local Hugging Face cache.
+
+import os
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import platform
+import tempfile
+import importlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fixtures import write_catalog, write_orders  # noqa: E402
+
+SERVICES = ("product", "order", "chat")
+
+# endpoints that serialize the whole order table, or a whole category of it:
+# a request costs ~100x a lookup, so they run --bulk-requests per level
+BULK_ENDPOINTS = ("order:/data", "order:/data/product-category/<category>")
+
+
+# ─── Service loading ──────────────────────────────────────────────────────────
+def load_service(directory: str, env: Dict[str, str], module: str = "app"):
+    """
+    Imports <directory>/<module>.py with the given environment. The service's own
+    modules, and the common/ modules it imported, are then detached from
+    sys.modules, so the next service's same-named modules (app,
+    single_flight) and its own tracing state load fresh, as they would in
+    a separate process; the loaded app keeps references to its own.
+    """
+    path = os.path.join(ROOT, directory)
+    owned = (path + os.sep, os.path.join(ROOT, "common") + os.sep)
+    os.environ.update(env)
+    before = set(sys.modules)
+    sys.path.insert(0, path)
+    try:
+        return importlib.import_module(module)
+    finally:
+        sys.path.remove(path)
+        for name in set(sys.modules) - before:
+            module_file = getattr(sys.modules[name], "__file__", None) or ""
+            if module_file.startswith(owned):
+                del sys.modules[name]
+
+
+def serve(app) -> str:
+    """Serves a WSGI app on a loopback port in a background thread; returns its URL."""
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+class _PerplexityStub(BaseHTTPRequestHandler):
+    """Answers chat-completion requests after a fixed delay, streamed or not."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.server.latency)
+        prompt = body.get("messages", [{}])[-1].get("content", "")
+        answer = f"Benchmark answer to: {prompt[:80]}"
+        if body.get("stream"):
+            # two chunks, so clients see text arrive in parts
+            chunks = [answer[:len(answer) // 2], answer[len(answer) // 2:]]
+            payload = "".join(f"data: {json.dumps({'choices': [{'delta': {'content': c}}]})}\n\n"
+                              for c in chunks).encode() + b"data: [DONE]\n\n"
+            content_type = "text/event-stream"
+        else:
+            payload = json.dumps({"choices": [{"message": {"content": answer}}]}).encode()
+            content_type = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_perplexity_stub(latency: float) -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _PerplexityStub)
+    server.daemon_threads = True
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/chat/completions"
+
+
+# ─── Measurement ──────────────────────────────────────────────────────────────
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run_level(make_call: Callable[[], Callable[[int], bool]], requests: int, concurrency: int) -> Dict:
+    """
+    Issues `requests` calls from `concurrency` threads. make_call() is run
+    once per thread (to give it its own test client) and returns call(i),
+    which performs request i and reports success.
+    """
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        nonlocal errors
+        call = make_call()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            try:
+                ok = call(i)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    ms = lambda s: round(s * 1000, 3)  # noqa: E731
+    return {
+        "requests": requests,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(requests / wall, 2) if wall else 0.0,
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        "p50_ms": ms(_percentile(ordered, 0.50)) if ordered else 0.0,
+        "p95_ms": ms(_percentile(ordered, 0.95)) if ordered else 0.0,
+        "p99_ms": ms(_percentile(ordered, 0.99)) if ordered else 0.0,
+        "max_ms": ms(ordered[-1]) if ordered else 0.0,
+    }
+
+
+def _get(client, url: str) -> bool:
+    return client.get(url).status_code == 200
+
+
+def _post(client, url: str, body: dict) -> bool:
+    return client.post(url, json=body).status_code == 200
+
+
+# ─── Scenarios ────────────────────────────────────────────────────────────────
+def product_scenarios(app, catalog) -> List[Tuple[str, Callable, Callable]]:
+    """(name, make_call, reset) per product endpoint; reset runs before each level."""
+    queries, asins = catalog["queries"], catalog["asins"]
+    rng = random.Random(1)
+    adjectives = ["cheap", "best", "professional", "beginner", "wireless", "vintage", "compact", "studio"]
+
+    def clear_cache():
+        with app.cache_lock:
+            app.cache.clear()
+
+    def search_uncached():
+        client = app.app.test_client()
+        # distinct query text per request, so every call runs FAISS + the CrossEncoder
+        return lambda i: _post(client, "/search", {"query": f"{adjectives[i % len(adjectives)]} "
+                                                            f"{queries[i % len(queries)]} {i}", "top_k": 5})
+
+    def search_cached():
+        client = app.app.test_client()
+        return lambda i: _post(client, "/search", {"query": queries[0], "top_k": 5})
+
+    def by_asin():
+        client = app.app.test_client()
+        return lambda i: _get(client, f"/product/{rng.choice(asins)}")
+
+    return [
+        ("product:/search", search_uncached, clear_cache),
+        ("product:/search (cached)", search_cached, lambda: None),
+        ("product:/product/<asin>", by_asin, lambda: None),
+    ]
+
+
+def order_scenarios(app, orders) -> List[Tuple[str, Callable, Callable]]:
+    customers, categories = orders["customer_ids"], orders["categories"]
+    rng = random.Random(2)
+    paths = {
+        "/data": lambda i: "/data",
+        "/data/customer/<id>": lambda i: f"/data/customer/{customers[i % len(customers)]}",
+        "/data/customer/<id>/latest": lambda i: f"/data/customer/{customers[i % len(customers)]}/latest?n=1",
+        "/data/product-category/<category>": lambda i: f"/data/product-category/{categories[i % len(categories)]}",
+        "/data/order-priority/<priority>": lambda i: "/data/order-priority/High?sort=recent&limit=5",
+        "/data/orders/by-id": lambda i: f"/data/orders/by-id?ids={rng.randrange(orders['count'])}",
+        "/data/orders/date-range": lambda i: "/data/orders/date-range?start=2018-03-01&end=2018-03-31&limit=50",
+        "/data/sales/<period>": lambda i: f"/data/sales/{['daily', 'monthly'][i % 2]}",
+        "/data/total-sales-by-category": lambda i: "/data/total-sales-by-category",
+        "/data/high-profit-products": lambda i: "/data/high-profit-products?limit=5",
+        "/data/shipping-cost-summary": lambda i: "/data/shipping-cost-summary",
+        "/data/profit-by-gender": lambda i: "/data/profit-by-gender",
+    }
+
+    def scenario(build_path):
+        def make_call():
+            client = app.app.test_client()
+            return lambda i: _get(client, build_path(i))
+        return make_call
+
+    return [(f"order:{name}", scenario(build), lambda: None) for name, build in paths.items()]
+
+
+def chat_scenarios(app, catalog, orders) -> List[Tuple[str, Callable, Callable]]:
+    queries, customers = catalog["queries"], orders["customer_ids"]
+
+    def single(message_for):
+        def make_call():
+            client = app.app.test_client()
+            return lambda i: _post(client, "/chat", {"message": message_for(i)})
+        return make_call
+
+    def last_order():
+        # two turns in one session: ask, then give the Customer ID
+        client = app.app.test_client()
+
+        def call(i):
+            first = client.post("/chat", json={"message": "What's my last order?"})
+            sid = first.get_json().get("session_id")
+            second = client.post("/chat", json={"message": str(customers[i % len(customers)]), "session_id": sid})
+            return first.status_code == 200 and second.status_code == 200
+        return call
+
+    return [
+        ("chat:small_talk", single(lambda i: "hello"), lambda: None),
+        ("chat:product_search", single(lambda i: f"Show me {queries[i % len(queries)]} under $200"), lambda: None),
+        ("chat:analytics", single(lambda i: ["sales by category", "profit by gender",
+                                             "shipping cost summary"][i % 3]), lambda: None),
+        ("chat:last_order (2 turns)", last_order, lambda: None),
+    ]
+
+
+# ─── Comparison ───────────────────────────────────────────────────────────────
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Lines describing endpoints/levels whose p95 or throughput regressed."""
+    base = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        old = base.get((r["endpoint"], r["concurrency"]))
+        if old is None:
+            continue
+        if old["p95_ms"] and r["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{r['endpoint']} @{r['concurrency']}: p95 {old['p95_ms']} -> {r['p95_ms']} ms")
+        if old["throughput_rps"] and r["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{r['endpoint']} @{r['concurrency']}: "
+                               f"throughput {old['throughput_rps']} -> {r['throughput_rps']} rps")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the product, order and chat services")
+    parser.add_argument("--only", nargs="+", choices=SERVICES, default=list(SERVICES))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and level")
+    parser.add_argument("--bulk-requests", type=int, default=20,
+                        help="requests per level for the full-table endpoints (BULK_ENDPOINTS)")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per endpoint")
+    parser.add_argument("--products", type=int, default=2000, help="synthetic catalog size")
+    parser.add_argument("--orders", type=int, default=20000, help="synthetic order count")
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--perplexity-latency", type=float, default=0.2, help="stub Perplexity delay (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="where fixtures and indexes go (default: a temp dir)")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ecom-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    catalog_path = os.path.join(workdir, "Product_Information_Dataset.csv")
+    orders_path = os.path.join(workdir, "Order_Data_Dataset.csv")
+    catalog = write_catalog(catalog_path, args.products, args.seed)
+    orders = write_orders(orders_path, args.orders, args.customers, args.seed)
+    orders["count"] = args.orders
+    print(f"Fixtures in {workdir}: {args.products} products, {args.orders} orders", flush=True)
+
+    os.environ.update({"TRACE_EXPORT": "off", "PERPLEXITY_CACHE": "off"})
+    needs_product = {"product", "chat"} & set(args.only)
+    needs_order = {"order", "chat"} & set(args.only)
+    scenarios = []
+    product_app = order_app = None
+    if needs_order:
+        order_app = load_service("order_service", {"DATA_PATH": orders_path})
+        if "order" in args.only:
+            scenarios += order_scenarios(order_app, orders)
+    if needs_product:
+        product_app = load_service("product_service", {
+            "DATA_PATH": catalog_path, "FAISS_INDEX_PATH": os.path.join(workdir, "faiss_index")})
+        if "product" in args.only:
+            scenarios += product_scenarios(product_app, catalog)
+    if "chat" in args.only:
+        chat_app = load_service("chat_service", {
+            "PRODUCT_SERVICE_URL": serve(product_app.app),
+            "ORDER_SERVICE_URL": serve(order_app.app),
+            "PERPLEXITY_API_KEY": "benchmark",
+            "PERPLEXITY_BASE_URL": start_perplexity_stub(args.perplexity_latency),
+        })
+        scenarios += chat_scenarios(chat_app, catalog, orders)
+
+    results = []
+    for name, make_call, reset in scenarios:
+        reset()
+        warm = make_call()
+        for i in range(args.warmup):
+            warm(i)
+        requests = min(args.requests, args.bulk_requests) if name in BULK_ENDPOINTS else args.requests
+        for level in args.concurrency:
+            reset()
+            record = {"endpoint": name, "concurrency": level, **run_level(make_call, requests, level)}
+            results.append(record)
+            print(f"{name:<42} c={level:<3} {record['throughput_rps']:>9.1f} rps  "
+                  f"p50 {record['p50_ms']:>8.2f}  p95 {record['p95_ms']:>8.2f}  p99 {record['p99_ms']:>8.2f} ms"
+                  f"  errors {record['errors']}", flush=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "host": socket.gethostname(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "workdir")},
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}", flush=True)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", flush=True)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,472 @@
+# benchmarks/replay.py
+#
+# Replays chat conversations against the chat service under load. Each
+# conversation keeps its session_id across turns and answers the service's
+# follow-up questions (a Customer ID when asked for one, "the more recent
+# one" when asked to pick an order), so multi-turn flows run end to end.
+#
+# Conversations come from samples.json (one per question, labelled by its
+# section) and from JSONL files with one conversation per line:
+#   {"turns": ["What's my last order?", "37077"], "label": "order"}
+#   {"message": "show me guitar strings"}
+#
+# Load is either closed loop (--concurrency N users, each starting the next
+# conversation when the last one ends, with optional --think-time) or open
+# loop (--rate R new conversations per second, Poisson arrivals, however
+# slowly the service answers). Several levels can be given to find the
+# throughput ceiling.
+#
+#   python benchmarks/replay.py --url http://localhost:8002 --concurrency 1 4 16 --duration 30
+#   python benchmarks/replay.py --local --rate 2 5 10 --duration 20 --out replay.json
+#
+# Every turn is sent with "timing": true, and the handler span in the reply
+# (intent:<name>, slot:<name>, eval, fallback, or none for small talk)
+# labels its latency, so results are broken down per intent.
+#
+# --local starts the chat service in-process with a stubbed Perplexity, the
+# order service over synthetic orders and a canned product search stub, or
+# real services given by --product-url / --order-url. The chat service's
+# intent model is real, so sentence-transformers is needed.
+
+import os
+import re
+import csv
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fixtures import write_catalog, write_orders  # noqa: E402
+from offline_bench import load_service, serve, start_perplexity_stub  # noqa: E402
+
+# customers with orders in data/Order_Data_Dataset.csv
+DEFAULT_CUSTOMERS = [37077, 36086, 35081, 26306, 50454, 41577, 53639, 41066, 39242, 44741]
+
+ASKS_CUSTOMER_ID = re.compile(r"customer id", re.IGNORECASE)
+ASKS_WHICH_ORDER = re.compile(r"which one would you like|choose a number", re.IGNORECASE)
+MAX_FOLLOW_UPS = 3
+
+HANDLER_SPAN_RE = re.compile(r"^(intent:|slot:|eval$|fallback$)")
+
+
+class Conversation(NamedTuple):
+    label: str
+    turns: Tuple[str, ...]
+
+
+# ─── Conversations ────────────────────────────────────────────────────────────
+def load_samples(path: str) -> List[Conversation]:
+    """One single-question conversation per samples.json entry."""
+    with open(path, encoding="utf-8") as f:
+        sections = json.load(f)
+    return [
+        Conversation(section.split()[0].lower(), (item["question"],))
+        for section, items in sections.items() for item in items if item.get("question")
+    ]
+
+
+def load_jsonl(path: str) -> Tuple[List[Conversation], int]:
+    """Conversations from a JSONL file, plus the number of lines that held none."""
+    conversations, skipped = [], 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            turns = obj.get("turns") or [obj.get("message") or obj.get("question")]
+            turns = tuple(t for t in turns if isinstance(t, str) and t.strip())
+            if not turns:
+                skipped += 1
+                continue
+            conversations.append(Conversation(obj.get("label", "jsonl"), turns))
+    return conversations, skipped
+
+
+def load_conversations(paths: Sequence[str]) -> List[Conversation]:
+    conversations = []
+    for path in paths:
+        if path.endswith(".json"):
+            conversations += load_samples(path)
+            continue
+        found, skipped = load_jsonl(path)
+        if skipped:
+            print(f"{path}: skipped {skipped} lines without chat turns", file=sys.stderr)
+        conversations += found
+    return conversations
+
+
+# ─── Recording ────────────────────────────────────────────────────────────────
+def _handler_stage(payload: dict) -> str:
+    """The turn's handler span name, or "command" for small talk and control phrases."""
+    for span in (payload.get("timing") or {}).get("spans", []):
+        if span.get("parent") is None and HANDLER_SPAN_RE.match(span.get("name", "")):
+            return span["name"]
+    return "command"
+
+
+def _summarize(seconds: List[float], errors: int, elapsed: float) -> Dict:
+    ms = np.array(seconds) * 1000
+    return {
+        "requests": len(seconds),
+        "errors": errors,
+        "error_rate": round(errors / len(seconds), 4) if seconds else 0.0,
+        "rps": round(len(seconds) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if len(ms) else 0.0,
+        "p95_ms": round(float(np.percentile(ms, 95)), 2) if len(ms) else 0.0,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if len(ms) else 0.0,
+        "max_ms": round(float(ms.max()), 2) if len(ms) else 0.0,
+    }
+
+
+class Recorder:
+    """Turn latencies by handler stage, conversation latencies by label, and arrival lag."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns: Dict[str, List[float]] = defaultdict(list)
+        self.turn_errors: Dict[str, int] = defaultdict(int)
+        self.conversations: Dict[str, List[float]] = defaultdict(list)
+        self.conversation_errors: Dict[str, int] = defaultdict(int)
+        self.lag: List[float] = []
+
+    def turn(self, stage: str, seconds: float, ok: bool):
+        with self._lock:
+            self.turns[stage].append(seconds)
+            self.turn_errors[stage] += not ok
+
+    def conversation(self, label: str, seconds: float, ok: bool, lag: Optional[float] = None):
+        with self._lock:
+            self.conversations[label].append(seconds)
+            self.conversation_errors[label] += not ok
+            if lag is not None:
+                self.lag.append(lag)
+
+    def summary(self, elapsed: float) -> Dict:
+        with self._lock:
+            all_turns = [s for v in self.turns.values() for s in v]
+            all_convs = [s for v in self.conversations.values() for s in v]
+            report = {
+                "elapsed_seconds": round(elapsed, 3),
+                "turns": _summarize(all_turns, sum(self.turn_errors.values()), elapsed),
+                "conversations": _summarize(all_convs, sum(self.conversation_errors.values()), elapsed),
+                "by_intent": {k: _summarize(v, self.turn_errors[k], elapsed) for k, v in sorted(self.turns.items())},
+                "by_label": {k: _summarize(v, self.conversation_errors[k], elapsed)
+                             for k, v in sorted(self.conversations.items())},
+            }
+            if self.lag:
+                lag = np.array(self.lag) * 1000
+                report["arrival_lag_ms"] = {"p50": round(float(np.percentile(lag, 50)), 2),
+                                            "p95": round(float(np.percentile(lag, 95)), 2),
+                                            "max": round(float(lag.max()), 2)}
+        return report
+
+
+# ─── Replay ───────────────────────────────────────────────────────────────────
+_local = threading.local()
+
+
+def _http() -> requests.Session:
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def run_conversation(url: str, conversation: Conversation, rng: random.Random, customers: Sequence[int],
+                     recorder: Recorder, think_time: float = 0.0, lag: Optional[float] = None):
+    """Plays one conversation, answering up to MAX_FOLLOW_UPS follow-up questions."""
+    started = time.perf_counter()
+    session_id, ok, follow_ups = None, True, 0
+    pending = list(conversation.turns)
+    while pending:
+        message = pending.pop(0)
+        body = {"message": message, "timing": True}
+        if session_id:
+            body["session_id"] = session_id
+        sent = time.perf_counter()
+        try:
+            resp = _http().post(f"{url}/chat", json=body, timeout=60)
+            payload = resp.json() if resp.headers.get("Content-Type", "").startswith("application/json") else {}
+            turn_ok = resp.status_code == 200
+        except (requests.RequestException, ValueError):
+            payload, turn_ok = {}, False
+        recorder.turn(_handler_stage(payload), time.perf_counter() - sent, turn_ok)
+        if not turn_ok:
+            ok = False
+            break
+        session_id = payload.get("session_id", session_id)
+
+        reply = payload.get("response", "")
+        if not pending and follow_ups < MAX_FOLLOW_UPS:
+            if ASKS_WHICH_ORDER.search(reply):
+                pending.append("the more recent one")
+                follow_ups += 1
+            elif ASKS_CUSTOMER_ID.search(reply) and any(w in reply for w in ("?", "need", "provide")):
+                pending.append(str(rng.choice(customers)))
+                follow_ups += 1
+        if pending and think_time:
+            time.sleep(rng.expovariate(1 / think_time))
+    recorder.conversation(conversation.label, time.perf_counter() - started, ok, lag)
+
+
+def closed_loop(url: str, conversations: Sequence[Conversation], users: int, duration: float,
+                customers: Sequence[int], think_time: float = 0.0, seed: int = 0) -> Dict:
+    """`users` concurrent users, each replaying conversations back to back for `duration` seconds."""
+    recorder = Recorder()
+    stop_at = time.perf_counter() + duration
+
+    def user(n: int):
+        rng = random.Random(seed * 100003 + n)
+        while time.perf_counter() < stop_at:
+            run_conversation(url, rng.choice(conversations), rng, customers, recorder, think_time)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user, range(users)))
+    return recorder.summary(time.perf_counter() - started)
+
+
+def open_loop(url: str, conversations: Sequence[Conversation], rate: float, duration: float,
+              customers: Sequence[int], max_inflight: int = 256, think_time: float = 0.0,
+              poisson: bool = True, seed: int = 0) -> Dict:
+    """
+    Starts conversations at `rate` per second for `duration` seconds, whether
+    or not earlier ones have finished. A conversation waiting for a free
+    worker counts towards its latency, and the wait is reported as arrival lag.
+    """
+    recorder = Recorder()
+    rng = random.Random(seed)
+
+    def job(conversation: Conversation, scheduled: float, n: int):
+        lag = time.perf_counter() - scheduled
+        run_conversation(url, conversation, random.Random(seed * 100003 + n), customers,
+                         recorder, think_time, lag)
+
+    started = time.perf_counter()
+    next_at, n = started, 0
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        while True:
+            next_at += rng.expovariate(rate) if poisson else 1 / rate
+            if next_at - started >= duration:
+                break
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+            pool.submit(job, rng.choice(conversations), next_at, n)
+            n += 1
+    return recorder.summary(time.perf_counter() - started)
+
+
+def ceiling(levels: List[Dict], max_error_rate: float) -> Optional[Dict]:
+    """The level with the highest turn throughput whose error rate stayed within bounds."""
+    healthy = [lv for lv in levels if lv["turns"]["error_rate"] <= max_error_rate]
+    if not healthy:
+        return None
+    best = max(healthy, key=lambda lv: lv["turns"]["rps"])
+    return {"mode": best["mode"], "level": best["level"], "turns_per_second": best["turns"]["rps"],
+            "p95_ms": best["turns"]["p95_ms"]}
+
+
+# ─── Local services ───────────────────────────────────────────────────────────
+class _ProductStub(BaseHTTPRequestHandler):
+    """Canned product search: catalog rows whose title shares a word with the query."""
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _search(self, query: str, top_k: int):
+        time.sleep(self.server.latency)
+        words = {w for w in re.findall(r"[a-z]+", query.lower()) if len(w) > 2}
+        hits = [p for p in self.server.products if words & p["words"]]
+        return [{k: v for k, v in p.items() if k != "words"} for p in hits[:top_k]]
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        top_k = int(body.get("top_k", 5))
+        if urlparse(self.path).path == "/search/batch":
+            self._send(200, {"results": [self._search(q, top_k) for q in body.get("queries", [])]})
+        else:
+            self._send(200, self._search(body.get("query", ""), top_k))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/search":
+            args = parse_qs(url.query)
+            self._send(200, self._search(args.get("q", [""])[0], int(args.get("top_k", [5])[0])))
+        elif url.path.startswith("/product/"):
+            asin = url.path.rsplit("/", 1)[-1]
+            match = [p for p in self.server.products if p["asin"] == asin]
+            if match:
+                self._send(200, {k: v for k, v in match[0].items() if k != "words"})
+            else:
+                self._send(404, {"error": "Product not found"})
+        else:
+            self._send(200, {"status": "healthy"})
+
+    def log_message(self, *args):
+        pass
+
+
+def start_product_stub(catalog_path: str, latency: float) -> str:
+    products = []
+    with open(catalog_path, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            products.append({
+                "asin": row["parent_asin"],
+                "title": row["title"],
+                "price": float(row["price"]) if row["price"] else "N/A",
+                "rating": float(row["average_rating"]),
+                "categories": json.loads(row["categories"]),
+                "features": json.loads(row["features"])[:3],
+                "description": json.loads(row["description"])[0],
+                "words": set(re.findall(r"[a-z]+", row["title"].lower())),
+            })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ProductStub)
+    server.daemon_threads = True
+    server.products, server.latency = products, latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def start_local(args) -> Tuple[str, List[int]]:
+    """Starts the chat service and its downstreams in-process; returns (chat URL, customer IDs)."""
+    workdir = tempfile.mkdtemp(prefix="ecom-replay-")
+    customers = DEFAULT_CUSTOMERS
+    order_url = args.order_url
+    if not order_url:
+        orders_path = os.path.join(workdir, "Order_Data_Dataset.csv")
+        customers = write_orders(orders_path, args.orders, customers=2000, seed=args.seed)["customer_ids"]
+        order_url = serve(load_service("order_service", {"DATA_PATH": orders_path}).app)
+    product_url = args.product_url
+    if not product_url:
+        catalog_path = os.path.join(workdir, "Product_Information_Dataset.csv")
+        write_catalog(catalog_path, args.products, seed=args.seed)
+        product_url = start_product_stub(catalog_path, args.stub_latency)
+
+    os.environ.setdefault("TRACE_EXPORT", "off")
+    env = {
+        "PRODUCT_SERVICE_URL": product_url,
+        "ORDER_SERVICE_URL": order_url,
+        "PERPLEXITY_API_KEY": "replay",
+        "PERPLEXITY_BASE_URL": start_perplexity_stub(args.perplexity_latency),
+    }
+    if args.server == "flask":
+        return serve(load_service("chat_service", env).app), customers
+
+    import uvicorn
+    app = load_service("chat_service", env, module="asgi_app").app
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 60
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("chat service did not start within 60s")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", customers
+
+
+def print_level(level: Dict):
+    print(f"\n{level['mode']} loop, {level['level']} {'users' if level['mode'] == 'closed' else 'conv/s'}")
+    print(f"{'':<40}{'reqs':>7}{'err%':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    rows = [("TURNS", level["turns"]), ("CONVERSATIONS", level["conversations"])]
+    rows += [(f"  {k}", v) for k, v in level["by_intent"].items()]
+    rows += [(f"  conversation:{k}", v) for k, v in level["by_label"].items()]
+    for name, r in rows:
+        print(f"{name:<40}{r['requests']:>7}{r['error_rate'] * 100:>7.1f}{r['rps']:>8}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}")
+    if "arrival_lag_ms" in level:
+        lag = level["arrival_lag_ms"]
+        print(f"arrival lag: p50 {lag['p50']} ms, p95 {lag['p95']} ms, max {lag['max']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay chat conversations against the chat service")
+    parser.add_argument("--url", help="chat service to target (default with --local: start one in-process)")
+    parser.add_argument("--local", action="store_true", help="start the chat service and stubs in-process")
+    parser.add_argument("--conversations", nargs="+", default=[os.path.join(ROOT, "samples.json")],
+                        help="samples.json-style .json files and/or JSONL conversation files")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, nargs="+", help="closed loop: concurrent users per level")
+    load.add_argument("--rate", type=float, nargs="+", help="open loop: new conversations per second per level")
+    parser.add_argument("--uniform", action="store_true", help="open loop: evenly spaced instead of Poisson arrivals")
+    parser.add_argument("--max-inflight", type=int, default=256, help="open loop: concurrent conversations cap")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per level")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between turns (s)")
+    parser.add_argument("--customers", type=int, nargs="+", help="Customer IDs to answer with")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="for the throughput ceiling")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the report as JSON")
+    local = parser.add_argument_group("--local")
+    local.add_argument("--server", choices=["asgi", "flask"], default="asgi")
+    local.add_argument("--product-url", help="real product service instead of the search stub")
+    local.add_argument("--order-url", help="real order service instead of one over synthetic orders")
+    local.add_argument("--products", type=int, default=2000)
+    local.add_argument("--orders", type=int, default=50000)
+    local.add_argument("--stub-latency", type=float, default=0.05, help="product stub delay (s)")
+    local.add_argument("--perplexity-latency", type=float, default=0.5, help="Perplexity stub delay (s)")
+    args = parser.parse_args()
+    if not args.url and not args.local:
+        parser.error("give --url or --local")
+
+    conversations = load_conversations(args.conversations)
+    if not conversations:
+        parser.error("no conversations found")
+    if args.local:
+        url, customers = start_local(args)
+    else:
+        url, customers = args.url.rstrip("/"), DEFAULT_CUSTOMERS
+    customers = args.customers or customers
+    print(f"Replaying {len(conversations)} conversations against {url}")
+
+    levels = []
+    if args.rate:
+        for rate in args.rate:
+            result = open_loop(url, conversations, rate, args.duration, customers, args.max_inflight,
+                               args.think_time, not args.uniform, args.seed)
+            levels.append({"mode": "open", "level": rate, **result})
+            print_level(levels[-1])
+    else:
+        for users in args.concurrency or [1, 4, 16]:
+            result = closed_loop(url, conversations, users, args.duration, customers, args.think_time, args.seed)
+            levels.append({"mode": "closed", "level": users, **result})
+            print_level(levels[-1])
+
+    best = ceiling(levels, args.max_error_rate)
+    if best:
+        print(f"\nThroughput ceiling: {best['turns_per_second']} turns/s at {best['mode']} loop level "
+              f"{best['level']} (p95 {best['p95_ms']} ms)")
+    else:
+        print(f"\nEvery level exceeded a {args.max_error_rate:.0%} error rate")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"target": url, "args": vars(args), "levels": levels, "ceiling": best}, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# chat_service/asgi_app.py
+#
+# ASGI variant of the chat service. Serves the same ChatFlow as app.py, but
+# awaits it on the server's own event loop, so a single worker can hold many
+# conversations that are waiting on product, order or Perplexity calls.
+#
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+#   gunicorn -k uvicorn.workers.UvicornWorker asgi_app:app --bind 0.0.0.0:8080
+
+import os
+import sys
+import time
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from fastapi.staticfiles import StaticFiles
+from jinja2 import Environment, FileSystemLoader
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path: sys.path.insert(0, ROOT)  # for common/
+
+from http_client import default_client
+from chat_flow import build_flow, sse
+from response_cache import default_cache
+from common import tracing
+from common import metrics
+import chat_metrics
+from common import profiling
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────────────────────────────────────
+# App setup
+# ────────────────────────────────────────────────────────────────────────────────
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await FLOW.http.aclose()
+
+app = FastAPI(title="E-Commerce Chat Service", lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
+
+# index.html is a Flask template; give it a url_for that resolves static files
+templates = Environment(loader=FileSystemLoader(os.path.join(BASE_DIR, "templates")))
+templates.globals["url_for"] = lambda endpoint, filename="": f"/{endpoint}/{filename}"
+
+FLOW = build_flow()
+chat_metrics.register_flow(FLOW, sync_http=default_client())
+
+@app.middleware("http")
+async def observe_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.observe_request(request.method, getattr(route, "path", "unmatched"),
+                            response.status_code, time.perf_counter() - started)
+    return response
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Endpoints
+# ────────────────────────────────────────────────────────────────────────────────
+@app.get("/", response_class=HTMLResponse)
+async def index():
+    return templates.get_template("index.html").render()
+
+@app.get("/health")
+async def health_check():
+    return {"status": "healthy"}
+
+@app.get("/stats/http")
+async def http_stats():
+    return {"sync": default_client().stats(), "async": FLOW.http.stats(),
+            "single_flight": FLOW.flight.stats()}
+
+@app.get("/stats/cache")
+async def cache_stats():
+    cache = default_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+@app.get("/stats/intent")
+async def intent_stats():
+    return FLOW.intent_cls.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/stats/router")
+async def router_stats():
+    return FLOW.timings.stats()
+
+def _profile_response(status, result):
+    if isinstance(result, profiling.Artifact):
+        return Response(result.body, status_code=status, media_type=result.mimetype,
+                        headers=profiling.download_headers(result))
+    return JSONResponse(result, status_code=status)
+
+@app.get("/debug/profile/{kind}")
+async def profile(kind: str, request: Request):
+    # profiling blocks for its duration, so keep it off the event loop (which it samples)
+    return _profile_response(*await run_in_threadpool(
+        profiling.handle, "chat_service", kind, request.query_params, request.headers))
+
+@app.get("/debug/profile/artifacts/{name}")
+async def profile_artifact(name: str, request: Request):
+    # reads the artifact from PROFILING_DIR
+    return _profile_response(*await run_in_threadpool(profiling.handle_artifact, name, request.headers))
+
+@app.post("/chat")
+async def chat(request: Request):
+    try:
+        body = await request.json()
+    except Exception:
+        body = {}
+    request_id = request.headers.get(tracing.REQUEST_ID_HEADER) or tracing.new_request_id()
+    payload, status = await FLOW.handle(body or {}, request_id)
+    return JSONResponse(payload, status_code=status, headers={tracing.REQUEST_ID_HEADER: request_id})
+
+@app.post("/chat/batch")
+async def chat_batch(request: Request):
+    try:
+        body = await request.json()
+    except Exception:
+        body = {}
+    request_id = request.headers.get(tracing.REQUEST_ID_HEADER) or tracing.new_request_id()
+    payload, status = await FLOW.handle_batch(body or {}, request_id)
+    return JSONResponse(payload, status_code=status, headers={tracing.REQUEST_ID_HEADER: request_id})
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    try:
+        body = await request.json()
+    except Exception:
+        body = {}
+    request_id = request.headers.get(tracing.REQUEST_ID_HEADER) or tracing.new_request_id()
+
+    async def events():
+        async for event, data in FLOW.stream(body or {}, request_id):
+            yield sse(event, data)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache", "X-Accel-Buffering": "no", tracing.REQUEST_ID_HEADER: request_id,
+    })
@@ -0,0 +1,939 @@
+# chat_service/chat_flow.py
+#
+# The chat pipeline, written once as a coroutine so it can be served by the
+# ASGI app (asgi_app.py) directly and by the Flask app (app.py) through a
+# per-process event loop. Product, order and Perplexity calls are awaited on
+# a pooled async client; the CPU-bound intent model and the (blocking)
+# RAG formatting run in a thread pool so they never stall the loop.
+
+import os
+import json
+import time
+import asyncio
+import logging
+import functools
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from rag_handler import ChatHandler
+from session_manager import SessionManager, Session
+from session_store import SessionConflict, store_from_env
+from intent_classifier import IntentClassifier
+from perplexity_client import PerplexityClient
+from http_client import AsyncHttpClient, default_async_client
+from response_cache import default_cache
+from single_flight import AsyncSingleFlight
+from common import tracing
+from chat_router import (
+    COMMANDS, CUSTOMER_ID_RE, EVAL_RE, ORDER_ITEM_RE, PUNCT_RE, WHICH_ORDER_RE,
+    Routes, StageTimings, Turn,
+)
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_SERVICE_URL = os.getenv("PRODUCT_SERVICE_URL", "http://product-service:8080")
+ORDER_SERVICE_URL   = os.getenv("ORDER_SERVICE_URL",   "http://order-service:8080")
+
+# how long a product answer may wait for its market insight, counted from
+# the start of the (concurrent) product search
+INSIGHT_BUDGET_SECONDS = float(os.getenv("INSIGHT_BUDGET_SECONDS", 2.0))
+
+# /chat/batch: messages per request, and how many of them run their handlers at once
+CHAT_BATCH_MAX_MESSAGES = int(os.getenv("CHAT_BATCH_MAX_MESSAGES", 1000))
+CHAT_BATCH_CONCURRENCY  = int(os.getenv("CHAT_BATCH_CONCURRENCY", 32))
+# product_service's per-call /search/batch cap; bigger groups are split
+SEARCH_BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", 256))
+
+# order-service analytics intents: intent -> (path, params, label, renderer)
+ANALYTICS = {
+    "high_priority": (
+        "/data/order-priority/High", {"sort": "recent", "limit": 5}, "high‑priority orders",
+        lambda h, data: h.generate_priority_orders_response(data, "High"),
+    ),
+    "sales_by_category": (
+        "/data/total-sales-by-category", None, "sales‑by‑category",
+        lambda h, data: h.generate_sales_by_category(data),
+    ),
+    "profit_by_gender": (
+        "/data/profit-by-gender", None, "profit‑by‑gender",
+        lambda h, data: h.generate_profit_by_gender(data),
+    ),
+    "shipping_summary": (
+        "/data/shipping-cost-summary", None, "shipping summary",
+        lambda h, data: h.generate_shipping_summary(data),
+    ),
+    "high_profit": (
+        "/data/high-profit-products", {"limit": 5, "sort": "desc"}, "high‑profit products",
+        lambda h, data: h.generate_high_profit_products(data),
+    ),
+}
+
+# slot and intent handlers, registered on ChatFlow below
+ROUTES = Routes()
+
+# events that carry part of the answer; the first one is timed as "first_content"
+CONTENT_EVENTS = {"products", "insight", "delta"}
+
+# the event sink of a turn served by ChatFlow.stream(); None for a plain /chat request
+_events: contextvars.ContextVar = contextvars.ContextVar("chat_events", default=None)
+
+# the shared state of a ChatFlow.handle_batch() request: prefetched downstream
+# results and whether to request market insights; None outside a batch
+_batch: contextvars.ContextVar = contextvars.ContextVar("chat_batch", default=None)
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Helpers
+# ────────────────────────────────────────────────────────────────────────────────
+def sse(event: str, data: Dict[str, Any]) -> str:
+    """One server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _format_date(d: str) -> str:
+    try:
+        return datetime.strptime(d, "%Y-%m-%d").strftime("%B %d, %Y")
+    except:
+        return d
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Pipeline
+# ────────────────────────────────────────────────────────────────────────────────
+class ChatFlow:
+    """
+    Transport-independent chat pipeline: takes a request body, returns a
+    (payload, status) pair.
+    """
+
+    def __init__(
+        self,
+        chat_handler: ChatHandler,
+        session_mgr: SessionManager,
+        intent_cls: IntentClassifier,
+        perplexity: PerplexityClient,
+        http: Optional[AsyncHttpClient] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+        product_url: str = PRODUCT_SERVICE_URL,
+        order_url: str = ORDER_SERVICE_URL,
+        insight_budget: float = INSIGHT_BUDGET_SECONDS,
+        batch_max: int = CHAT_BATCH_MAX_MESSAGES,
+        batch_concurrency: int = CHAT_BATCH_CONCURRENCY,
+    ):
+        self.chat_handler = chat_handler
+        self.session_mgr  = session_mgr
+        self.intent_cls   = intent_cls
+        self.perplexity   = perplexity
+        self.http         = http or default_async_client()
+        self.executor     = executor or ThreadPoolExecutor(
+            max_workers=int(os.getenv("CHAT_EXECUTOR_WORKERS", os.cpu_count() or 4)),
+            thread_name_prefix="chat-cpu",
+        )
+        self.product_url  = product_url
+        self.order_url    = order_url
+        self.insight_budget = insight_budget
+        self.batch_max = batch_max
+        self.batch_concurrency = batch_concurrency
+        # identical product searches / order aggregates in flight share one request
+        self.flight = AsyncSingleFlight()
+        self.timings = StageTimings()
+
+    # ─── I/O helpers ────────────────────────────────────────────────────────────
+    async def _offload(self, fn, *args):
+        """Runs blocking / CPU-bound work in the executor (inside the current trace)."""
+        call = functools.partial(contextvars.copy_context().run, fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def _downstream(self, service: str, method: str, url: str, **kwargs):
+        """
+        Calls product_service / order_service with the request ID attached,
+        as a span that includes the stages the service reports back.
+        """
+        with tracing.span(f"{service}.call", method=method, url=url) as span:
+            started = time.perf_counter()
+            resp = await self.http.request(method, url, headers=tracing.outgoing_headers(), **kwargs)
+            span["status"] = resp.status_code
+            tracing.record_server_timing(resp.headers.get(tracing.SERVER_TIMING_HEADER), started, service)
+        return resp
+
+    def _prefetched(self, key: Tuple):
+        """A downstream result fetched ahead by the current batch, or None."""
+        batch = _batch.get()
+        return batch["prefetched"].get(key) if batch is not None else None
+
+    async def _search_products(self, query: str, top_k: int):
+        prefetched = self._prefetched(("search", query, top_k))
+        if prefetched is not None:
+            return prefetched
+        return await self.flight.do(
+            ("search", query, top_k), lambda: self._request_products(query, top_k)
+        )
+
+    async def _request_products(self, query: str, top_k: int):
+        # hit product‑service, with POST→GET fallback
+        resp = await self._downstream(
+            "product_service", "POST", f"{self.product_url}/search",
+            json={"query": query, "top_k": top_k},
+            timeout=10,
+            idempotent=True
+        )
+        if resp.status_code == 405:
+            resp = await self._downstream(
+                "product_service", "GET", f"{self.product_url}/search",
+                params={"q": query, "top_k": top_k},
+                timeout=10
+            )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def _search_products_batch(self, queries: List[str], top_k: int) -> Dict[str, list]:
+        """Searches several queries in one product-service call: {query: products}."""
+        resp = await self._downstream(
+            "product_service", "POST", f"{self.product_url}/search/batch",
+            json={"queries": queries, "top_k": top_k},
+            timeout=30,
+            idempotent=True
+        )
+        resp.raise_for_status()
+        return dict(zip(queries, resp.json()["results"]))
+
+    async def _market_insights(self, query: str) -> str:
+        prompt = self.chat_handler.market_insights_prompt(query)
+        with tracing.span("insight"):
+            return (await self.chat_handler.perplexity.asearch(prompt)).get("content", "")
+
+    async def _search_with_insights(self, query: str, top_k: int):
+        """
+        Runs the product search and the market-insight request concurrently,
+        so a product answer costs max(search, insight) rather than their sum.
+        The insight gets insight_budget seconds from the start of the search;
+        if it is late, fails, or there are fewer than two products to
+        summarise, it is dropped and (products, None) is returned.
+        """
+        batch = _batch.get()
+        if not self.chat_handler.perplexity or (batch is not None and not batch["insights"]):
+            return await self._search_products(query, top_k), None
+
+        started = time.monotonic()
+        insight_task = asyncio.ensure_future(self._market_insights(query))
+        try:
+            products = await self._search_products(query, top_k)
+        except BaseException:
+            insight_task.cancel()
+            raise
+        if len(products) < 2:
+            insight_task.cancel()
+            return products, None
+
+        remaining = self.insight_budget - (time.monotonic() - started)
+        try:
+            # wait_for cancels the insight request if the budget runs out
+            return products, await asyncio.wait_for(insight_task, timeout=max(remaining, 0))
+        except asyncio.TimeoutError:
+            logger.info(f"Market insight missed its {self.insight_budget:.1f}s budget; answering without it")
+        except Exception as e:
+            logger.error(f"Market insight error: {e}")
+        return products, None
+
+    async def _get_orders_json(self, path: str, params: Dict[str, Any] = None):
+        async def fetch():
+            resp = await self._downstream("order_service", "GET", f"{self.order_url}{path}", params=params, timeout=5)
+            resp.raise_for_status()
+            return resp.json()
+        return await self.flight.do(("GET", path, tuple(sorted((params or {}).items()))), fetch)
+
+    async def _fetch_customer_orders(self, customer_id: str, latest: int = None):
+        """
+        Returns the customer's orders newest first, or an error string. With
+        latest=N only the N most recent orders are fetched, plus the total count.
+        """
+        prefetched = self._prefetched(("customer", customer_id, latest))
+        if prefetched is not None:
+            return prefetched
+        url = f"{self.order_url}/data/customer/{customer_id}"
+        params = None
+        if latest:
+            url, params = f"{url}/latest", {"n": latest}
+        try:
+            resp = await self._downstream("order_service", "GET", url, params=params, timeout=5)
+            if resp.status_code == 404:
+                return f"No orders found for Customer ID {customer_id}."
+            resp.raise_for_status()
+            orders = resp.json()
+            if latest:
+                return orders, int(resp.headers.get("X-Total-Count", len(orders)))
+            return orders
+        except Exception as e:
+            logger.error(f"Order service error: {e}")
+            return f"Sorry, I couldn’t fetch your orders right now. Customer ID: {customer_id} not found!"
+
+    async def _fetch_customers_orders(self, customer_ids: List[str], latest: int = None) -> Dict[str, Any]:
+        """
+        Looks up several customers in one order-service call. Returns what
+        _fetch_customer_orders would for each customer that has orders;
+        unknown customers are left out.
+        """
+        params = {"ids": ",".join(customer_ids)}
+        if latest:
+            params["n"] = latest
+        resp = await self._downstream("order_service", "GET", f"{self.order_url}/data/customers",
+                                      params=params, timeout=10)
+        resp.raise_for_status()
+        found = resp.json()
+        results = {}
+        for cid in customer_ids:
+            entry = found.get(str(int(cid)))
+            if entry is not None:
+                results[cid] = (entry["orders"], entry["total"]) if latest else entry["orders"]
+        return results
+
+    def _emit(self, event: str, data: Dict[str, Any]):
+        """Sends part of the answer to a streaming client; a no-op for plain /chat."""
+        sink = _events.get()
+        if sink is None:
+            return
+        if event in CONTENT_EVENTS and not sink["content_sent"]:
+            sink["content_sent"] = True
+            trace = tracing.current()
+            if trace is not None:
+                elapsed = time.perf_counter() - trace.started
+                self.timings.record("first_content", elapsed)
+                tracing.record("first_content", trace.started, elapsed)
+        sink["queue"].put_nowait((event, data))
+
+    def _reply(self, session: Session, text: str, sources=None) -> Tuple[Dict[str, Any], int]:
+        session.add_to_history("bot", text)
+        payload = {"response": text, "session_id": session.session_id}
+        if sources:
+            payload["sources"] = sources
+        return payload, 200
+
+    # ─── Entry point ────────────────────────────────────────────────────────────
+    async def handle(self, body: Dict[str, Any], request_id: Optional[str] = None) -> Tuple[Dict[str, Any], int]:
+        """
+        Handles one chat turn as a traced request. With "timing": true in
+        the body, the response carries the turn's span breakdown.
+        """
+        trace = tracing.start("chat_service", request_id)
+        try:
+            payload, status = await self._turn(body)
+        finally:
+            tracing.finish(trace)
+        if body.get("timing"):
+            payload["timing"] = trace.to_dict()
+        return payload, status
+
+    async def stream(self, body: Dict[str, Any], request_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Handles one chat turn like handle(), yielding (event, data) pairs as
+        the answer is put together: "session" once the session is loaded,
+        "products" as soon as the search returns, then "insight" chunks of
+        the market insight, or "delta" chunks of a Perplexity answer. It ends
+        with "done" (the same payload /chat returns) or "error". If the
+        consumer stops early, the turn is cancelled.
+        """
+        sink = {"queue": asyncio.Queue(), "content_sent": False}
+        token = _events.set(sink)
+        try:
+            task = asyncio.ensure_future(self.handle(body, request_id))
+        finally:
+            _events.reset(token)
+        task.add_done_callback(lambda _: sink["queue"].put_nowait(None))
+        try:
+            while True:
+                item = await sink["queue"].get()
+                if item is None:
+                    break
+                yield item
+            payload, status = task.result()
+        except Exception as e:
+            logger.error(f"Streamed chat turn failed: {e}")
+            payload, status = {"error": "Sorry, something went wrong. Please try again."}, 500
+        finally:
+            task.cancel()
+        yield ("done" if status == 200 else "error"), payload
+
+    async def handle_batch(self, body: Dict[str, Any], request_id: Optional[str] = None) -> Tuple[Dict[str, Any], int]:
+        """
+        Handles many chat turns in one traced request, for offline evaluation
+        and bulk processing. body["messages"] is a list of {"message",
+        "session_id"}; messages sharing a session_id form one conversation
+        and run in order, one round per turn. In each round the messages
+        that need classifying go through one predict_batch() call, their
+        product searches through one /search/batch call and customer-ID
+        answers through one grouped /data/customers lookup; then every
+        message runs its usual handler on the prefetched results.
+
+        Returns {"results": [...]} in input order, each the /chat payload
+        plus its "status" and the "route" it took. "insights": false skips
+        the market insight of product answers.
+        """
+        messages = body.get("messages")
+        if not isinstance(messages, list) or not messages:
+            return {"error": "Expected a non-empty list of messages"}, 400
+        if len(messages) > self.batch_max:
+            return {"error": f"Too many messages, at most {self.batch_max} per batch"}, 413
+
+        trace = tracing.start("chat_service", request_id)
+        token = _batch.set({"prefetched": {}, "insights": bool(body.get("insights", True))})
+        try:
+            results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+            sessions: Dict[str, str] = {}  # the caller's session_id -> the session's ID
+            for number, indices in enumerate(self._batch_rounds(messages), start=1):
+                with tracing.span("batch.round", round=number, messages=len(indices)):
+                    await self._batch_round(messages, indices, sessions, results)
+        finally:
+            _batch.reset(token)
+            tracing.finish(trace)
+        payload = {"results": results}
+        if body.get("timing"):
+            payload["timing"] = trace.to_dict()
+        return payload, 200
+
+    @staticmethod
+    def _batch_rounds(messages: List[Any]) -> List[List[int]]:
+        """
+        Splits a batch into rounds: round n holds the n-th message of every
+        conversation, so no session is used twice in one round. Messages
+        without a session_id start a conversation of their own.
+        """
+        rounds: List[List[int]] = []
+        turns: Dict[str, int] = {}
+        for i, item in enumerate(messages):
+            label = item.get("session_id") if isinstance(item, dict) else None
+            n = turns.get(label, 0) if label else 0
+            if label:
+                turns[label] = n + 1
+            if n == len(rounds):
+                rounds.append([])
+            rounds[n].append(i)
+        return rounds
+
+    async def _batch_round(self, messages: List[Any], indices: List[int],
+                           sessions: Dict[str, str], results: List[Optional[Dict[str, Any]]]):
+        """Runs one round of a batch, storing each message's result in results."""
+        pending = []
+        for i in indices:
+            item = messages[i] if isinstance(messages[i], dict) else {}
+            text = str(item.get("message") or "").strip()
+            if not text:
+                results[i] = {"error": "Empty message", "status": 400, "route": None}
+            else:
+                pending.append((i, text, item.get("session_id")))
+
+        with tracing.span("session.load", shared=self.session_mgr.store.shared, sessions=len(pending)):
+            loaded = await asyncio.gather(*(
+                self._load_session(sessions.get(label, label)) for _, _, label in pending
+            ))
+
+        # routes that don't need the model, then one classifier pass for the rest
+        routes = []
+        for (_, text, label), session in zip(pending, loaded):
+            if label:
+                sessions[label] = session.session_id
+            expected = session.get_expected_input()
+            kind, arg = self._route(expected, text.lower())
+            routes.append((kind, arg, expected))
+        unrouted = [k for k, (kind, _, _) in enumerate(routes) if kind is None]
+        intents: Dict[int, str] = {}
+        if unrouted:
+            started = time.perf_counter()
+            with tracing.span("classify", queries=len(unrouted)):
+                predicted = await self._offload(self.intent_cls.predict_batch, [pending[k][1] for k in unrouted])
+            self.timings.record("batch.classify", time.perf_counter() - started)
+            intents = dict(zip(unrouted, predicted))
+
+        # group the downstream lookups the handlers are about to make
+        searches: Dict[int, set] = {}
+        customers: Dict[Optional[int], set] = {}
+        for k, (kind, arg, expected) in enumerate(routes):
+            if intents.get(k) == "product_search":
+                searches.setdefault(5, set()).add(pending[k][1])
+            elif kind == "eval":
+                searches.setdefault(3, set()).add(arg.group("prod").strip())
+            elif expected in ("customer_id_for_last_order", "customer_id_for_specific_order"):
+                m = CUSTOMER_ID_RE.search(pending[k][1].lower())
+                if m:
+                    latest = 1 if expected == "customer_id_for_last_order" else None
+                    customers.setdefault(latest, set()).add(m.group(1))
+        await self._prefetch(searches, customers)
+
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def run(k: int):
+            i, text, _ = pending[k]
+            session = loaded[k]
+            kind, _, expected = routes[k]
+            intent = intents.get(k)
+            if kind == "slot":
+                route = f"slot:{expected}"
+            elif kind is None:
+                route = f"intent:{intent}" if intent in ROUTES.intents else "fallback"
+            else:
+                route = kind
+            async with semaphore:
+                try:
+                    with tracing.span("batch.message", index=i):
+                        payload, status = await self._respond(session, session.session_id, text, intent)
+                    payload, status = await self._save_session(session) or (payload, status)
+                except Exception as e:
+                    logger.error(f"Batched chat turn {i} failed: {e}")
+                    payload, status = {"error": "Sorry, something went wrong. Please try again.",
+                                       "session_id": session.session_id}, 500
+            results[i] = {**payload, "status": status, "route": route}
+
+        await asyncio.gather(*(run(k) for k in range(len(pending))))
+
+    async def _prefetch(self, searches: Dict[int, set], customers: Dict[Optional[int], set]):
+        """
+        Fetches a round's product searches ({top_k: queries}) and customer
+        lookups ({latest: customer IDs}) in one call per group, for
+        _search_products and _fetch_customer_orders to pick up. Anything
+        that fails here is fetched by the handler itself, one by one.
+        """
+        prefetched = _batch.get()["prefetched"]
+
+        async def products(top_k: int, queries: List[str]):
+            try:
+                chunks = await asyncio.gather(*(
+                    self._search_products_batch(queries[n:n + SEARCH_BATCH_MAX], top_k)
+                    for n in range(0, len(queries), SEARCH_BATCH_MAX)
+                ))
+                found = {query: result for chunk in chunks for query, result in chunk.items()}
+            except Exception as e:
+                logger.warning(f"Batched product search failed, searching one by one: {e}")
+                return
+            prefetched.update((("search", query, top_k), result) for query, result in found.items())
+
+        async def orders(latest: Optional[int], customer_ids: List[str]):
+            try:
+                found = await self._fetch_customers_orders(customer_ids, latest)
+            except Exception as e:
+                logger.warning(f"Grouped customer lookup failed, fetching one by one: {e}")
+                return
+            prefetched.update((("customer", cid, latest), result) for cid, result in found.items())
+
+        calls = []
+        for top_k, queries in searches.items():
+            missing = sorted(q for q in queries if ("search", q, top_k) not in prefetched)
+            if missing:
+                calls.append(products(top_k, missing))
+        for latest, customer_ids in customers.items():
+            missing = sorted(c for c in customer_ids if ("customer", c, latest) not in prefetched)
+            if missing:
+                calls.append(orders(latest, missing))
+        if calls:
+            with tracing.span("batch.prefetch", calls=len(calls)):
+                await asyncio.gather(*calls)
+
+    async def _turn(self, body: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        user_input = (body.get("message") or "").strip()
+        if not user_input:
+            return {"error":"Empty message"}, 400
+
+        sid     = body.get("session_id")
+        with tracing.span("session.load", shared=self.session_mgr.store.shared):
+            session = await self._load_session(sid)
+        self._emit("session", {"session_id": session.session_id})
+
+        payload, status = await self._respond(session, sid, user_input)
+        return await self._save_session(session) or (payload, status)
+
+    async def _load_session(self, sid: Optional[str]) -> Session:
+        # a shared store is network / disk I/O, so keep it off the loop
+        if self.session_mgr.store.shared:
+            return await self._offload(self.session_mgr.get_session, sid)
+        return self.session_mgr.get_session(sid)
+
+    async def _save_session(self, session: Session) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Writes the session back to the store; returns a 409 reply if it changed meanwhile."""
+        try:
+            with tracing.span("session.save"):
+                if self.session_mgr.store.shared:
+                    await self._offload(self.session_mgr.save_session, session)
+                else:
+                    self.session_mgr.save_session(session)
+        except SessionConflict as e:
+            logger.warning(str(e))
+            return {"error": "This conversation was updated by another request. Please resend your message.",
+                    "session_id": session.session_id}, 409
+        return None
+
+    @staticmethod
+    def _route(expected: Optional[str], lower: str) -> Tuple[Optional[str], Any]:
+        """
+        The routes taken before classification: ("command", name) for control
+        phrases and small talk, ("eval", match) for "Is X good for Y?",
+        ("slot", handler) when the session expects an answer, and
+        (None, None) when the message has to be classified.
+        """
+        # normalize punctuation for small‑talk & commands
+        command = COMMANDS.get(PUNCT_RE.sub("", lower).strip())
+        if command == "cancel" or (command and expected is None):
+            return "command", command
+        if expected is None:
+            eval_match = EVAL_RE.match(lower)
+            if eval_match:
+                return "eval", eval_match
+        handler = ROUTES.slots.get(expected)
+        if handler:
+            return "slot", handler
+        return None, None
+
+    async def _respond(self, session: Session, sid: Optional[str], user_input: str,
+                       intent: Optional[str] = None) -> Tuple[Dict[str, Any], int]:
+        """
+        Runs the turn's logic against a loaded session: control phrases and
+        small talk, "Is X good for Y?", the pending slot's handler, and
+        otherwise the classified intent's handler (intent, if already
+        classified by the caller). The matching itself is timed as the
+        "route" stage, each handler under its own name.
+        """
+        session.add_to_history("user", user_input)
+
+        expected = session.get_expected_input()
+        logger.info(f"[Session {session.session_id}] Expected={expected!r}, Got={user_input!r}")
+
+        started = time.perf_counter()
+        lower   = user_input.lower()
+        kind, arg = self._route(expected, lower)
+        if kind == "command":
+            reply = self._command(session, sid, arg)
+            self._record("route", started)
+            return reply
+
+        turn = Turn(user_input, lower)
+        self._record("route", started)
+
+        if kind == "eval":
+            return await self._timed("eval", self._evaluate(session, turn, arg))
+        if kind == "slot":
+            return await self._timed(f"slot:{expected}", arg(self, session, turn))
+
+        # keyword phrases (incl. price queries like "under $30") are matched
+        # lexically inside the classifier before the embedding model runs
+        if intent is None:
+            started = time.perf_counter()
+            with tracing.span("classify"):
+                intent = await self._offload(self.intent_cls.predict, user_input)
+            self.timings.record("classify", time.perf_counter() - started)
+        logger.info(f"[Session {session.session_id}] Detected intent: {intent}")
+
+        handler = ROUTES.intents.get(intent)
+        if handler is None:
+            return await self._timed("fallback", self._fallback(session, turn))
+        return await self._timed(f"intent:{intent}", handler(self, session, turn._replace(intent=intent)))
+
+    def _record(self, stage: str, started: float):
+        elapsed = time.perf_counter() - started
+        self.timings.record(stage, elapsed)
+        tracing.record(stage, started, elapsed)
+
+    async def _timed(self, stage: str, coro):
+        started = time.perf_counter()
+        try:
+            with tracing.span(stage):
+                return await coro
+        finally:
+            self.timings.record(stage, time.perf_counter() - started)
+
+    # ─── Control & small talk ───────────────────────────────────────────────────
+    def _command(self, session: Session, sid: Optional[str], command: str) -> Tuple[Dict[str, Any], int]:
+        if command == "cancel":
+            self.session_mgr.end_session(sid)
+            session.ended = True  # don't write the ended session back to the store
+            return self._reply(session, "No problem—let’s start fresh. What can I help with?")
+        if command == "greeting":
+            return self._reply(session, "Hello! 👋 I'm your E‑Commerce Assistant. How can I help?")
+        if command == "farewell":
+            return self._reply(session, "Goodbye! Come back anytime.")
+        return self._reply(session, "You’re welcome! Anything else I can do?")
+
+    # ─── Eval query: “Is X good for Y?” ─────────────────────────────────────────
+    async def _evaluate(self, session: Session, turn: Turn, eval_match) -> Tuple[Dict[str, Any], int]:
+        keyword = eval_match.group("prod").strip()
+        # try product-service first
+        candidates = []
+        try:
+            candidates = await self._search_products(keyword, 3)
+        except Exception as e:
+            logger.error(f"Product service error on eval fetch: {e}")
+
+        if candidates:
+            # use our RAG handler for a nuanced answer
+            answer = await self._offload(self.chat_handler.generate_product_response, candidates, turn.text)
+            return self._reply(session, answer)
+
+        # final fallback: Perplexity
+        prompt = f"Is the {keyword} good for {eval_match.group('target').strip()}? Explain why or why not in two sentences."
+        perp = await self.perplexity.asearch(prompt) if self.perplexity.api_key else {}
+        content = perp.get("content") or (
+            f"That device is optimized for speech/video use; it likely won’t capture all the nuances of {eval_match.group('target')}."
+        )
+        return self._reply(session, content, sources=perp.get("sources"))
+
+    # ─── Slot-fill handlers (by session.expected_input) ─────────────────────────
+    @ROUTES.slot("which_specific_order")
+    async def _which_specific_order(self, session: Session, turn: Turn):
+        # the session keeps Order_Ids only; fetch the chosen order's details
+        choices = session.get_data("specific_orders") or []
+        m = WHICH_ORDER_RE.search(turn.lower)
+        if m and m.lastgroup == "recent":
+            pick_id = choices[0] if choices else None
+        else:
+            idx = int(m.group("number"))-1 if m else None
+            if idx is None or idx<0 or idx>=len(choices):
+                return self._reply(session, f"Please choose a number between 1 and {len(choices)} or say 'the more recent one'.")
+            pick_id = choices[idx]
+        try:
+            pick = (await self._get_orders_json("/data/orders/by-id", params={"ids": pick_id}))[0]
+        except Exception as e:
+            logger.error(f"Order lookup error: {e}")
+            return self._reply(session, "Sorry, I couldn’t fetch that order right now. Please try again.")
+        date     = _format_date(pick["Order_Date"])
+        prod     = pick.get("Product") or pick.get("Product_Category","item")
+        sales    = pick.get("Sales",0.0)
+        shipping = pick.get("Shipping_Cost",0.0)
+        prio     = pick.get("Order_Priority","N/A")
+        session.set_expected_input(None)
+        return self._reply(session,
+            f"Your {prod} order on {date} has priority {prio}, costing ${sales:.2f} plus ${shipping:.2f} shipping."
+        )
+
+    @ROUTES.slot("customer_id_for_specific_order")
+    async def _customer_id_for_specific_order(self, session: Session, turn: Turn):
+        m = CUSTOMER_ID_RE.search(turn.lower)
+        if not m:
+            return self._reply(session, "I still need your 5‑digit Customer ID to proceed.")
+        cid      = m.group(1)
+        raw_item = session.get_data("order_item","")
+        keyword  = raw_item.replace("-", " ").lower()
+
+        session.set_data("customer_id", cid)
+        session.set_expected_input(None)
+
+        orders = await self._fetch_customer_orders(cid)
+        if isinstance(orders, str):
+            return self._reply(session, orders)
+
+        # filter by normalized keyword tokens (orders arrive newest first)
+        norm_tokens = keyword.split()
+        filtered = [
+            o for o in orders
+            if all(tok in (o.get("Product","")+" "+o.get("Product_Category","")).lower() for tok in norm_tokens)
+        ]
+        if not filtered:
+            # no match, show most recent few
+            filtered = orders[:3]
+            lines = [f"{_format_date(o['Order_Date'])} — {o.get('Product') or o.get('Product_Category')}" for o in filtered]
+            session.set_expected_input(None)
+            return self._reply(session,
+                "I couldn’t find exactly that, but here are your most recent orders:\n" +
+                "\n".join(lines)
+            )
+
+        if len(filtered) == 1:
+            o = filtered[0]
+            date = _format_date(o["Order_Date"])
+            prod = o.get("Product") or o.get("Product_Category","item")
+            prio = o.get("Order_Priority","N/A")
+            session.set_expected_input(None)
+            return self._reply(session,
+                f"You placed an order for {prod} on {date} with priority {prio}. "
+                "If you'd like more info on shipping or delivery, please check your confirmation or contact support."
+            )
+
+        # multiple matches → ask which
+        session.set_data("specific_orders", [o["Order_Id"] for o in filtered])
+        session.set_expected_input("which_specific_order")
+        lines = [
+            f"{i}. {_format_date(o['Order_Date'])} — {o.get('Product') or o.get('Product_Category')}"
+            for i,o in enumerate(filtered, start=1)
+        ]
+        return self._reply(session,
+            "I found multiple matching orders:\n" +
+            "\n".join(lines) +
+            "\nWhich one would you like details for?"
+        )
+
+    @ROUTES.slot("customer_id_for_last_order")
+    async def _customer_id_for_last_order(self, session: Session, turn: Turn):
+        m = CUSTOMER_ID_RE.search(turn.lower)
+        if not m:
+            return self._reply(session, "I still need your 5‑digit Customer ID.")
+        cid = m.group(1)
+        session.set_data("customer_id", cid)
+        session.set_expected_input(None)
+
+        result = await self._fetch_customer_orders(cid, latest=1)
+        if isinstance(result, str):
+            return self._reply(session, result)
+        orders, total = result
+
+        text = self.chat_handler.generate_order_response(
+            {"customer_id": cid, "orders": orders, "total": total},
+            "last order"
+        )
+        return self._reply(session, text)
+
+    # ─── Intent handlers ────────────────────────────────────────────────────────
+    @ROUTES.intent("last_order")
+    async def _last_order(self, session: Session, turn: Turn):
+        session.set_expected_input("customer_id_for_last_order")
+        return self._reply(session,
+            "Sure—what’s your 5‑digit Customer ID so I can look up your most recent order?"
+        )
+
+    @ROUTES.intent("specific_order")
+    async def _specific_order(self, session: Session, turn: Turn):
+        m = ORDER_ITEM_RE.search(turn.lower)
+        raw_item = m.group(1).strip() if m else "order"
+        session.set_data("order_item", raw_item)
+        session.set_expected_input("customer_id_for_specific_order")
+        return self._reply(session,
+            f"Please provide your Customer ID to check the status of your {raw_item} order."
+        )
+
+    @ROUTES.intent(*ANALYTICS)
+    async def _analytics(self, session: Session, turn: Turn):
+        path, params, label, render = ANALYTICS[turn.intent]
+        try:
+            data = await self._get_orders_json(path, params=params)
+        except Exception as e:
+            logger.error(f"{label.capitalize()} fetch error: {e}")
+            return self._reply(session, f"I couldn’t fetch {label} right now.")
+        return self._reply(session, render(self.chat_handler, data))
+
+    @ROUTES.intent("product_search")
+    async def _product_search(self, session: Session, turn: Turn):
+        if _events.get() is not None:
+            return await self._stream_product_search(session, turn)
+        try:
+            prods, insight = await self._search_with_insights(turn.text, 5)
+            text = await self._offload(
+                self.chat_handler.generate_product_response, prods, turn.text, insight, False
+            )
+            return self._reply(session, text)
+        except Exception as e:
+            logger.error(f"Product search error: {e}")
+            return self._reply(session, "Sorry, I can’t reach the product service right now.")
+
+    async def _stream_product_search(self, session: Session, turn: Turn):
+        """
+        Streaming variant: the product list is sent as soon as the search
+        returns, then the market insight, which was requested alongside the
+        search, as it is generated.
+        """
+        perplexity = self.chat_handler.perplexity
+        chunks: asyncio.Queue = asyncio.Queue()
+
+        async def insight():
+            try:
+                async for text in perplexity.astream(self.chat_handler.market_insights_prompt(turn.text)):
+                    chunks.put_nowait(text)
+            finally:
+                chunks.put_nowait(None)
+
+        insight_task = asyncio.ensure_future(insight()) if perplexity else None
+        try:
+            try:
+                prods = await self._search_products(turn.text, 5)
+            except Exception as e:
+                logger.error(f"Product search error: {e}")
+                return self._reply(session, "Sorry, I can’t reach the product service right now.")
+            text = await self._offload(
+                self.chat_handler.generate_product_response, prods, turn.text, None, False
+            )
+            self._emit("products", {"products": prods, "text": text})
+            if insight_task is None or len(prods) < 2:
+                return self._reply(session, text)
+
+            parts = []
+            with tracing.span("insight"):
+                while True:
+                    chunk = await chunks.get()
+                    if chunk is None:
+                        break
+                    parts.append(chunk)
+                    self._emit("insight", {"text": chunk})
+            if parts:
+                text += f"\n\nMarket Insights: {''.join(parts)}"
+            return self._reply(session, text)
+        finally:
+            if insight_task is not None:
+                insight_task.cancel()
+
+    async def _fallback(self, session: Session, turn: Turn):
+        """Anything unrouted goes to Perplexity."""
+        if _events.get() is not None:
+            parts = []
+            async for chunk in self.perplexity.astream(turn.text):
+                parts.append(chunk)
+                self._emit("delta", {"text": chunk})
+            return self._reply(session, "".join(parts) or "Sorry, I’m not sure how to help with that.")
+        try:
+            perp = await self.perplexity.asearch(turn.text)
+            return self._reply(session,
+                               perp.get("content", "Sorry, I’m not sure how to help."),
+                               sources=perp.get("sources"))
+        except Exception as e:
+            logger.error(f"Perplexity fallback failed: {e}")
+            return self._reply(session, "Sorry, I’m not sure how to help with that.")
+
+
+def build_flow() -> ChatFlow:
+    """Builds the pipeline and its components from the environment."""
+    api_key = os.getenv("PERPLEXITY_API_KEY")
+    intent_cls = IntentClassifier(api_key=api_key, threshold=0.5)
+
+    # near-duplicate prompt matching reuses the intent model's sentence embeddings
+    cache = default_cache()
+    if cache is not None and cache.similarity_threshold is not None and cache.embedder is None:
+        cache.embedder = intent_cls.embed
+
+    return ChatFlow(
+        chat_handler=ChatHandler(perplexity_api_key=api_key),
+        session_mgr=SessionManager(session_expiry_seconds=1800, store=store_from_env()),
+        intent_cls=intent_cls,
+        perplexity=PerplexityClient(api_key=api_key),
+    )
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Sync bridge (used by the Flask app)
+# ────────────────────────────────────────────────────────────────────────────────
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """
+    One event loop per process, running in a daemon thread. Started lazily
+    (and again after a fork) so each gunicorn worker gets its own.
+    """
+    global _loop, _loop_pid
+    if _loop is None or _loop_pid != os.getpid():
+        with _loop_lock:
+            if _loop is None or _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="chat-loop", daemon=True).start()
+                _loop, _loop_pid = loop, os.getpid()
+    return _loop
+
+
+def run_sync(coro, timeout: float = None):
+    """Runs a coroutine on the background loop and blocks for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result(timeout)
+
+
+def iter_sync(agen, timeout: float = None):
+    """Iterates an async generator on the background loop (e.g. for a streamed Flask response)."""
+    loop = _background_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result(timeout)
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result(timeout)
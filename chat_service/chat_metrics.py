@@ -0,0 +1,48 @@
+# chat_service/chat_metrics.py
+#
+# The chat pipeline's own counters, read from its stats() methods at scrape
+# time and served with the shared request and span metrics (common/metrics.py).
+
+from common.metrics import Collected
+
+
+def register_flow(flow, sync_http=None):
+    """
+    Exposes the chat pipeline's own counters: intent classification paths,
+    the Perplexity response cache, single-flight and downstream HTTP pools.
+    """
+    intent_stats = flow.intent_cls.stats
+    Collected("intent_classifications_total", "Chat messages classified, by method.", "counter",
+              lambda: [((method,), intent_stats()[method]) for method in ("lexical", "embedding", "fallback")],
+              ["method"])
+    Collected("intent_embedding_cache_entries", "Query embeddings held in the intent LRU cache.", "gauge",
+              lambda: [((), intent_stats()["cached_embeddings"])])
+
+    cache = flow.perplexity.cache
+    if cache is not None:
+        Collected("perplexity_cache_lookups_total", "Perplexity cache lookups, by result.", "counter",
+                  lambda: [((result,), cache.stats()[key]) for result, key in
+                           (("hit", "hits"), ("semantic_hit", "semantic_hits"), ("miss", "misses"))],
+                  ["result"])
+        Collected("perplexity_cache_hit_ratio", "Share of Perplexity lookups answered from the cache.", "gauge",
+                  lambda: [((), cache.stats()["hit_rate"])])
+        Collected("perplexity_cache_saved_seconds_total", "Perplexity latency avoided by cache hits.", "counter",
+                  lambda: [((), cache.stats()["saved_seconds"])])
+
+    Collected("single_flight_calls_total", "Downstream calls through single-flight, by outcome.", "counter",
+              lambda: [((outcome,), flow.flight.stats()[outcome]) for outcome in ("executions", "collapsed")],
+              ["outcome"])
+
+    clients = [("async", flow.http)] + ([("sync", sync_http)] if sync_http is not None else [])
+
+    def downstream(counter):
+        for client_name, client in clients:
+            for host, counters in client.stats()["hosts"].items():
+                if counter in counters:
+                    yield (client_name, host), counters[counter]
+
+    for counter, help in (("requests", "Downstream HTTP attempts, including retries."),
+                          ("errors", "Downstream HTTP connection errors and 5xx responses."),
+                          ("retries", "Downstream HTTP retries.")):
+        Collected(f"downstream_{counter}_total", help, "counter",
+                  lambda counter=counter: downstream(counter), ["client", "host"])
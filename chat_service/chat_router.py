@@ -0,0 +1,109 @@
+# chat_service/chat_router.py
+#
+# Routing tables for ChatFlow. Every pattern a turn is matched against is
+# compiled once here; the pipeline looks handlers up by slot state and by
+# intent instead of walking an if/else chain, and StageTimings records
+# how long each stage takes.
+
+import re
+import threading
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+# ─── Patterns ──────────────────────────────────────────────────────────────────
+PUNCT_RE = re.compile(r"[^\w\s]")
+
+# "Is X good for Y?" (also used by ChatHandler.generate_product_response)
+EVAL_RE = re.compile(r"is (?:the )?(?P<prod>.+?) good for (?P<target>.+?)(?:\?|$)", re.IGNORECASE)
+
+# which_specific_order answers, dispatched on m.lastgroup: "the more recent
+# one" anywhere in the answer wins (the lookahead is tried first, at the
+# start), otherwise the first list number
+WHICH_ORDER_RE = re.compile(
+    r"^(?=.*?\b(?P<recent>more recent|most recent|recent)\b)"
+    r"|\b(?P<number>\d+)\b",
+    re.DOTALL,
+)
+
+CUSTOMER_ID_RE = re.compile(r"\b(\d{5})\b")
+
+# the item in "status of my <item> order", "where is my <item>", ...
+ORDER_ITEM_RE = re.compile(
+    r"\b(?:status|track|where\s+is|check(?:\s+the)?\s+status)\s+"
+    r"(?:of\s+)?(?:my\s+)?(.+?)(?:\s+(?:order|purchase|package))?\b"
+)
+
+# ─── Control & small-talk phrases (one lookup for the whole stage) ─────────────
+GREETINGS = {"hi","hello","hey","hiya","good morning","good afternoon","good evening"}
+FAREWELLS = {"bye","goodbye","see you","farewell"}
+THANKS    = {"thanks","thank you","thx","ty", "no thanks", "no thank you"}
+CANCELS   = {"cancel","nevermind","never mind","stop"}
+
+COMMANDS: Dict[str, str] = {
+    **{p: "greeting" for p in GREETINGS},
+    **{p: "farewell" for p in FAREWELLS},
+    **{p: "thanks" for p in THANKS},
+    **{p: "cancel" for p in CANCELS},
+}
+
+
+class Turn(NamedTuple):
+    """One user message as the handlers see it."""
+    text: str
+    lower: str
+    intent: Optional[str] = None
+
+
+class Routes:
+    """
+    Handler tables. Handlers are registered with the decorators while the
+    pipeline class is defined and called as handler(flow, session, turn).
+    """
+    def __init__(self):
+        self.slots:   Dict[str, Callable] = {}
+        self.intents: Dict[str, Callable] = {}
+
+    def slot(self, expected: str):
+        """Registers the handler for turns where the session expects `expected`."""
+        def register(fn):
+            self.slots[expected] = fn
+            return fn
+        return register
+
+    def intent(self, *names: str):
+        """Registers the handler for one or more classified intents."""
+        def register(fn):
+            for name in names:
+                self.intents[name] = fn
+            return fn
+        return register
+
+
+class StageTimings:
+    """Per-stage call counts and latencies, shared by all requests in the process."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, list] = {}
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                self._stages[stage] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """{stage: {count, total_ms, mean_ms, max_ms}}."""
+        with self._lock:
+            stages = {k: list(v) for k, v in self._stages.items()}
+        return {
+            stage: {
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total * 1000 / count, 3),
+                "max_ms": round(worst * 1000, 3),
+            }
+            for stage, (count, total, worst) in sorted(stages.items())
+        }
@@ -0,0 +1,333 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES     = {502, 503, 504}
+DEFAULT_PORTS      = {"http": 80, "https": 443}
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.hostname}:{parts.port or DEFAULT_PORTS.get(parts.scheme, 80)}"
+
+
+def _configure(client, pool_connections, pool_maxsize, connect_timeout,
+               read_timeout, max_retries, backoff):
+    """Resolves client settings, falling back to the HTTP_* environment."""
+    env = os.environ.get
+    client.pool_connections = pool_connections or int(env("HTTP_POOL_CONNECTIONS", 10))
+    client.pool_maxsize     = pool_maxsize     or int(env("HTTP_POOL_MAXSIZE", 20))
+    client.connect_timeout  = connect_timeout  or float(env("HTTP_CONNECT_TIMEOUT", 2.0))
+    client.read_timeout     = read_timeout     or float(env("HTTP_READ_TIMEOUT", 10.0))
+    client.max_retries      = max_retries if max_retries is not None else int(env("HTTP_MAX_RETRIES", 2))
+    client.backoff          = backoff if backoff is not None else float(env("HTTP_BACKOFF", 0.1))
+
+
+class HttpClient:
+    """
+    Shared, keep-alive HTTP client for downstream calls.
+
+    One requests.Session holds a urllib3 pool per host, so repeated calls to
+    product-service, order-service and Perplexity reuse warm TCP connections
+    instead of paying connection setup on every request. Timeouts are split
+    into connect and read; idempotent calls are retried on connection errors
+    and 502/503/504 with full-jitter exponential backoff.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = None,
+        pool_maxsize: int = None,
+        connect_timeout: float = None,
+        read_timeout: float = None,
+        max_retries: int = None,
+        backoff: float = None,
+    ):
+        """
+        Initializes the client. Any argument left as None is read from the
+        environment (HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE,
+        HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_MAX_RETRIES,
+        HTTP_BACKOFF).
+
+        Args:
+            pool_connections (int): Number of per-host pools to keep.
+            pool_maxsize (int): Connections kept alive per host.
+            connect_timeout (float): Seconds to establish a connection.
+            read_timeout (float): Default seconds to wait for a response.
+            max_retries (int): Retries for idempotent calls.
+            backoff (float): Base backoff in seconds; attempt n sleeps up to backoff * 2**n.
+        """
+        _configure(self, pool_connections, pool_maxsize, connect_timeout,
+                   read_timeout, max_retries, backoff)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0,  # retries are handled here so they can be counted
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._adapter = adapter
+
+        self._lock  = threading.Lock()
+        self._stats = defaultdict(lambda: {"requests": 0, "errors": 0, "retries": 0, "in_flight": 0})
+
+    def _timeout(self, timeout) -> tuple:
+        if isinstance(timeout, tuple):
+            return timeout
+        return (self.connect_timeout, timeout if timeout is not None else self.read_timeout)
+
+    def _count(self, host: str, key: str, delta: int = 1):
+        with self._lock:
+            self._stats[host][key] += delta
+
+    def request(self, method: str, url: str, timeout=None, idempotent: Optional[bool] = None, **kwargs) -> requests.Response:
+        """
+        Sends a request through the shared pool.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Absolute URL.
+            timeout: Read timeout in seconds, or a (connect, read) tuple. Defaults to read_timeout.
+            idempotent (Optional[bool]): Whether the call may be retried. Defaults to True for
+                GET/HEAD/OPTIONS/PUT/DELETE; pass True for side-effect-free POSTs such as searches.
+            **kwargs: Passed to requests.Session.request.
+
+        Returns:
+            requests.Response: The final response (after retries).
+        """
+        method = method.upper()
+        host = _host_key(url)
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempts = 1 + (self.max_retries if idempotent else 0)
+
+        self._count(host, "in_flight")
+        try:
+            for attempt in range(attempts):
+                last = attempt == attempts - 1
+                self._count(host, "requests")
+                try:
+                    resp = self.session.request(method, url, timeout=self._timeout(timeout), **kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    self._count(host, "errors")
+                    if last:
+                        raise
+                else:
+                    if resp.status_code not in RETRY_STATUSES or last:
+                        if resp.status_code >= 500:
+                            self._count(host, "errors")
+                        return resp
+                    self._count(host, "errors")
+                    resp.close()
+                self._count(host, "retries")
+                delay = random.uniform(0, self.backoff * (2 ** attempt))
+                logger.warning(f"Retrying {method} {url} in {delay:.2f}s (attempt {attempt + 2}/{attempts})")
+                time.sleep(delay)
+        finally:
+            self._count(host, "in_flight", -1)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Per-host call counters plus urllib3 pool usage: connections opened,
+        requests served and how many of those reused a pooled connection.
+        """
+        with self._lock:
+            hosts = {host: dict(counters) for host, counters in self._stats.items()}
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            # the pool queue is pre-filled with None placeholders up to maxsize
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+            entry = hosts.setdefault(f"{key.key_host}:{key.key_port}", {})
+            entry.update({
+                "connections_opened": pool.num_connections,
+                "pool_requests":      pool.num_requests,
+                "reused":             max(pool.num_requests - pool.num_connections, 0),
+                "idle_connections":   idle,
+            })
+        return {
+            "pool_connections": self.pool_connections,
+            "pool_maxsize":     self.pool_maxsize,
+            "timeouts":         {"connect": self.connect_timeout, "read": self.read_timeout},
+            "hosts":            hosts,
+        }
+
+
+class AsyncHttpClient:
+    """
+    asyncio counterpart of HttpClient, built on httpx.AsyncClient.
+
+    Same pool sizing, timeout split, retry policy and counters as HttpClient
+    (read from the same HTTP_* environment variables), but calls are awaited
+    so a slow downstream never parks a thread. The underlying httpx client is
+    created lazily on first use so it binds to the event loop that uses it.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = None,
+        pool_maxsize: int = None,
+        connect_timeout: float = None,
+        read_timeout: float = None,
+        max_retries: int = None,
+        backoff: float = None,
+    ):
+        """
+        Initializes the client; arguments are the same as for HttpClient.
+        """
+        _configure(self, pool_connections, pool_maxsize, connect_timeout,
+                   read_timeout, max_retries, backoff)
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock  = threading.Lock()
+        self._stats = defaultdict(lambda: {"requests": 0, "errors": 0, "retries": 0, "in_flight": 0})
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_maxsize * self.pool_connections,
+                    max_keepalive_connections=self.pool_maxsize,
+                ),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+        return self._client
+
+    def _timeout(self, timeout) -> httpx.Timeout:
+        if isinstance(timeout, tuple):
+            return httpx.Timeout(timeout[1], connect=timeout[0])
+        return httpx.Timeout(timeout if timeout is not None else self.read_timeout,
+                             connect=self.connect_timeout)
+
+    def _count(self, host: str, key: str, delta: int = 1):
+        with self._lock:
+            self._stats[host][key] += delta
+
+    async def request(self, method: str, url: str, timeout=None, idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """
+        Sends a request through the shared async pool; see HttpClient.request.
+        """
+        method = method.upper()
+        host = _host_key(url)
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempts = 1 + (self.max_retries if idempotent else 0)
+
+        self._count(host, "in_flight")
+        try:
+            for attempt in range(attempts):
+                last = attempt == attempts - 1
+                self._count(host, "requests")
+                try:
+                    resp = await self.client.request(method, url, timeout=self._timeout(timeout), **kwargs)
+                except httpx.TransportError:
+                    self._count(host, "errors")
+                    if last:
+                        raise
+                else:
+                    if resp.status_code not in RETRY_STATUSES or last:
+                        if resp.status_code >= 500:
+                            self._count(host, "errors")
+                        return resp
+                    self._count(host, "errors")
+                self._count(host, "retries")
+                delay = random.uniform(0, self.backoff * (2 ** attempt))
+                logger.warning(f"Retrying {method} {url} in {delay:.2f}s (attempt {attempt + 2}/{attempts})")
+                await asyncio.sleep(delay)
+        finally:
+            self._count(host, "in_flight", -1)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, timeout=None, **kwargs):
+        """
+        Sends a request whose response body is read as it arrives (e.g.
+        server-sent events); use as `async with client.stream(...) as resp`.
+        Not retried, since part of the body may already have been consumed.
+        """
+        host = _host_key(url)
+        self._count(host, "in_flight")
+        self._count(host, "requests")
+        try:
+            async with self.client.stream(method.upper(), url, timeout=self._timeout(timeout), **kwargs) as resp:
+                if resp.status_code >= 500:
+                    self._count(host, "errors")
+                yield resp
+        except httpx.TransportError:
+            self._count(host, "errors")
+            raise
+        finally:
+            self._count(host, "in_flight", -1)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-host call counters (httpx does not expose pool internals)."""
+        with self._lock:
+            hosts = {host: dict(counters) for host, counters in self._stats.items()}
+        return {
+            "pool_connections": self.pool_connections,
+            "pool_maxsize":     self.pool_maxsize,
+            "timeouts":         {"connect": self.connect_timeout, "read": self.read_timeout},
+            "hosts":            hosts,
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_default_client: Optional[HttpClient] = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> HttpClient:
+    """The process-wide client shared by the chat app and PerplexityClient."""
+    global _default_client
+    if _default_client is None:
+        with _default_lock:
+            if _default_client is None:
+                _default_client = HttpClient()
+    return _default_client
+
+
+_default_async_client: Optional[AsyncHttpClient] = None
+
+
+def default_async_client() -> AsyncHttpClient:
+    """The process-wide async client used by the chat pipeline."""
+    global _default_async_client
+    if _default_async_client is None:
+        with _default_lock:
+            if _default_async_client is None:
+                _default_async_client = AsyncHttpClient()
+    return _default_async_client
@@ -1,16 +1,40 @@
 # chat_service/intent_classifier.py
 
+import os
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from typing import Dict, List
+
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 from perplexity_client import PerplexityClient  # your existing client
+from lexicon import LexicalIntentMatcher
+from common import tracing
+
+logger = logging.getLogger(__name__)
+
+# trained softmax head written by train_intent.py; used instead of the
+# prototypes when present
+DEFAULT_HEAD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_head.npz")
+
+# Perplexity fallbacks run concurrently, at most this many at a time per classifier
+FALLBACK_CONCURRENCY = int(os.getenv("INTENT_FALLBACK_CONCURRENCY", 8))
 
 class IntentClassifier:
-    def __init__(self, api_key: str = None, threshold: float = 0.5):
+    def __init__(self, api_key: str = None, threshold: float = 0.5, cache_size: int = None,
+                 head_path: str = None):
         # Use the same MiniLM model you already have
         self.model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
         self.threshold = threshold
 
+        # LRU cache of normalized query embeddings (repeat messages skip the model)
+        self.cache_size = cache_size if cache_size is not None else int(os.getenv("INTENT_EMBED_CACHE_SIZE", 2048))
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
         # Define prototypes for each intent
         self.intents = {
             'product_search': [
@@ -50,50 +74,217 @@ class IntentClassifier:
                 'shipping summary',
                 'shipping cost summary'
             ],
+            'high_profit': [
+                'high profit products',
+                'most profitable products',
+                'top products by profit'
+            ],
         }
 
-        # Pre-embed all prototypes
-        self.intent_embeddings = {
-            intent: self.model.encode(protos, convert_to_tensor=True)
-            for intent, protos in self.intents.items()
-        }
+        # Pre-embed all prototypes into one L2-normalized matrix. Rows are grouped
+        # by intent, so a query's per-intent score is a segmented max over
+        # the similarity vector (np.maximum.reduceat at each intent's first row).
+        self.intent_names = list(self.intents)
+        protos = [p for intent in self.intent_names for p in self.intents[intent]]
+        self.proto_intent = np.repeat(
+            np.arange(len(self.intent_names)), [len(self.intents[i]) for i in self.intent_names]
+        )
+        self._segments = np.flatnonzero(np.r_[True, np.diff(self.proto_intent) != 0])
+        self.proto_matrix = self._encode(protos)
+
+        # Optional trained head: softmax(embedding @ W + b) over intent_names.
+        # Its scores are probabilities, so it carries its own fallback threshold.
+        self.head = None
+        self.head_threshold = threshold
+        if head_path is None:
+            head_path = os.getenv("INTENT_HEAD_PATH", DEFAULT_HEAD_PATH)
+        if head_path and os.path.exists(head_path):
+            self.load_head(head_path)
+
+        # Keyword pre-classifier: unambiguous phrases skip the model entirely
+        self.lexicon = LexicalIntentMatcher()
+        self._stats = {"queries": 0, "lexical": 0, "embedding": 0, "fallback": 0}
+        self._stats_lock = threading.Lock()
 
         # Set up Perplexity for fallback classification
         self.perplexity = PerplexityClient(api_key=api_key) if api_key else None
+        # one bounded pool for every batch's fallbacks; threads start on first use.
+        # Not the chat flow's executor: predict_batch already runs on it and
+        # would wait on its own queue.
+        self._fallback_pool = ThreadPoolExecutor(max_workers=FALLBACK_CONCURRENCY,
+                                                 thread_name_prefix="intent-fallback")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts, convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32, copy=False)
+
+    @staticmethod
+    def _key(query: str) -> str:
+        # MiniLM is uncased, so case and spacing don't change the embedding
+        return " ".join(query.lower().split())
+
+    def embed(self, queries: List[str]) -> np.ndarray:
+        """
+        Returns normalized embeddings for the queries (one row each), encoding
+        only the ones not already in the LRU cache, in a single batch.
+        """
+        keys = [self._key(q) for q in queries]
+        out = [None] * len(keys)
+        missing = {}
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                vec = self._cache.get(key)
+                if vec is not None:
+                    self._cache.move_to_end(key)
+                    out[i] = vec
+                else:
+                    missing.setdefault(key, []).append(i)
+        if missing:
+            vecs = self._encode(list(missing))
+            with self._cache_lock:
+                for (key, rows), vec in zip(missing.items(), vecs):
+                    for i in rows:
+                        out[i] = vec
+                    if self.cache_size:
+                        self._cache[key] = vec
+                        self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return np.stack(out) if out else np.empty((0, self.proto_matrix.shape[1]), np.float32)
+
+    def load_head(self, path: str):
+        """
+        Loads a head trained by train_intent.py. Its columns are reordered to
+        intent_names; a head for a different embedding size or intent set
+        is rejected and the prototypes stay in use. The fallback threshold
+        saved with the head, if any, replaces head_threshold.
+        """
+        try:
+            with np.load(path, allow_pickle=False) as art:
+                W, b, names = art["W"], art["b"], [str(n) for n in art["intents"]]
+                threshold = float(art["threshold"]) if "threshold" in art.files else None
+            if W.shape[0] != self.proto_matrix.shape[1] or set(names) != set(self.intent_names):
+                raise ValueError(f"head was trained for {W.shape[0]}-d embeddings over {names}")
+            order = [names.index(name) for name in self.intent_names]
+            self.head = (W[:, order].astype(np.float32), b[order].astype(np.float32))
+            if threshold is not None:
+                self.head_threshold = threshold
+            logger.info(f"Loaded intent head from {path}")
+        except Exception as e:
+            logger.error(f"Could not load intent head {path}: {e}")
+            self.head = None
+
+    def prototype_scores(self, emb: np.ndarray) -> np.ndarray:
+        """Max cosine similarity to each intent's prototypes."""
+        return np.maximum.reduceat(emb @ self.proto_matrix.T, self._segments, axis=1)
+
+    def head_scores(self, emb: np.ndarray) -> np.ndarray:
+        """Softmax probabilities from the trained head."""
+        W, b = self.head
+        logits = emb @ W + b
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def score_batch(self, queries: List[str]) -> np.ndarray:
+        """
+        Per-intent scores, shape (len(queries), len(intent_names)): head
+        probabilities when a trained head is loaded, otherwise the max
+        cosine similarity to each intent's prototypes. Scores below
+        `head_threshold` or `threshold` respectively trigger the Perplexity
+        fallback.
+        """
+        emb = self.embed(queries)
+        return self.head_scores(emb) if self.head is not None else self.prototype_scores(emb)
+
+    def scores(self, query: str) -> Dict[str, float]:
+        return dict(zip(self.intent_names, self.score_batch([query])[0].tolist()))
+
+    def _fallback(self, query: str):
+        """Asks Perplexity to classify a query the prototypes are unsure about."""
+        intent_list = list(self.intents.keys())
+        prompt = (
+            f"Classify this request into one of {intent_list}: \"{query}\""
+        )
+        try:
+            if self.perplexity.api_key is None:
+                raise ValueError("Perplexity API key is missing.")
+            result = self.perplexity.search(prompt)
+            content = result.get('content', '').lower()
+            # map back if possible
+            for intent in self.intents:
+                if intent in content:
+                    return intent
+        except Exception as e:
+            print(f"Perplexity API error: {e}")
+            # fallback to semantic if Perplexity fails
+            pass
+        return None
+
+    def _traced_fallback(self, query: str):
+        with tracing.span("intent.fallback"):
+            return self._fallback(query)
+
+    def _fallbacks(self, queries: List[str]) -> List[str]:
+        """Runs _fallback() for several queries at once, each in the caller's trace."""
+        if len(queries) == 1:
+            return [self._traced_fallback(queries[0])]
+        futures = [self._fallback_pool.submit(contextvars.copy_context().run, self._traced_fallback, q)
+                   for q in queries]
+        return [f.result() for f in futures]
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                self._stats[key] += delta
+
+    def predict_batch(self, queries: List[str]) -> List[str]:
+        """
+        Returns the best-matching intent for each query. Queries with an
+        unambiguous intent phrase are answered by the lexical matcher; the
+        rest are embedded together in one forward pass, and uncertain ones
+        fall back to Perplexity (concurrently, so a batch waits for roughly
+        one round trip rather than one per uncertain query).
+        """
+        with tracing.span("intent.lexicon"):
+            intents = [self.lexicon.match(q) for q in queries]
+        pending = [i for i, intent in enumerate(intents) if intent is None]
+        uncertain = []
+        threshold = self.head_threshold if self.head is not None else self.threshold
+        if pending:
+            with tracing.span("intent.model", queries=len(pending), head=self.head is not None):
+                scores = self.score_batch([queries[i] for i in pending])
+            for i, row in zip(pending, scores):
+                idx = int(row.argmax())
+                intents[i] = self.intent_names[idx]
+                # If uncertain, ask Perplexity
+                if row[idx] < threshold and self.perplexity:
+                    uncertain.append(i)
+        if uncertain:
+            for i, intent in zip(uncertain, self._fallbacks([queries[i] for i in uncertain])):
+                intents[i] = intent or intents[i]
+        self._count(queries=len(queries), lexical=len(queries) - len(pending),
+                    embedding=len(pending), fallback=len(uncertain))
+        return intents
+
+    def stats(self) -> Dict[str, float]:
+        """
+        How queries were classified: by the lexical matcher, by embeddings,
+        and how many of those needed the Perplexity fallback.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+            cached = len(self._cache)
+        total = stats["queries"]
+        stats["lexical_share"] = round(stats["lexical"] / total, 4) if total else 0.0
+        stats["fallback_rate"] = round(stats["fallback"] / total, 4) if total else 0.0
+        stats["cached_embeddings"] = cached
+        return stats
 
     def predict(self, query: str) -> str:
         """
         Returns the best-matching intent name for the given user query.
         Falls back to Perplexity classification if top score < threshold.
         """
-        q_emb = self.model.encode([query], convert_to_tensor=True)
-        # compute max cosine similarity for each intent
-        scores = {}
-        for intent, emb in self.intent_embeddings.items():
-            sim = cosine_similarity(q_emb.cpu(), emb.cpu()).max()
-            scores[intent] = float(sim)
-
-        # pick best
-        best_intent, best_score = max(scores.items(), key=lambda x: x[1])
-
-        # If uncertain, ask Perplexity
-        if best_score < self.threshold and self.perplexity:
-            intent_list = list(self.intents.keys())
-            prompt = (
-                f"Classify this request into one of {intent_list}: \"{query}\""
-            )
-            try:
-                if self.perplexity.api_key is None:
-                    raise ValueError("Perplexity API key is missing.")
-                result = self.perplexity.search(prompt)
-                content = result.get('content', '').lower()
-                # map back if possible
-                for intent in self.intents:
-                    if intent in content:
-                        return intent
-            except Exception as e:
-                print(f"Perplexity API error: {e}")
-                # fallback to semantic if Perplexity fails
-                pass
-
-        return best_intent
+        return self.predict_batch([query])[0]
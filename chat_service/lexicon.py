@@ -0,0 +1,113 @@
+# chat_service/lexicon.py
+
+import re
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Phrases that identify an intent on their own. Matching is on whole words,
+# case-insensitive; "$#" stands for any dollar amount ("under $30").
+INTENT_PHRASES: Dict[str, List[str]] = {
+    'product_search': [
+        'under $#', 'over $#', 'below $#', 'above $#', 'less than $#', 'cheaper than $#',
+        'search for',
+    ],
+    'last_order': [
+        'my last order', 'my latest order', 'my most recent order', 'most recent order',
+        'my last purchase', 'my latest purchase',
+    ],
+    'specific_order': [
+        'status of my', 'track my', 'where is my', 'order status',
+    ],
+    'high_priority': [
+        'high priority orders', 'urgent orders', 'priority orders',
+    ],
+    'sales_by_category': [
+        'sales by category', 'sales per category', 'category sales',
+    ],
+    'profit_by_gender': [
+        'profit by gender', 'profit per gender', 'gender profit',
+    ],
+    'shipping_summary': [
+        'shipping summary', 'shipping cost summary', 'shipping costs',
+    ],
+    'high_profit': [
+        'high profit products', 'most profitable products', 'top products by profit',
+    ],
+}
+
+_MONEY  = re.compile(r"\$\s*\d[\d,]*(?:\.\d+)?")
+_TOKENS = re.compile(r"\$#|[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens, with dollar amounts collapsed to '$#'."""
+    return _TOKENS.findall(_MONEY.sub(" $# ", text.lower()))
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over word tokens: finds every occurrence of every
+    phrase in one left-to-right pass, independent of the number of phrases.
+    """
+    def __init__(self, phrases: Iterable[Tuple[List[str], str]]):
+        """
+        Builds the automaton.
+
+        Args:
+            phrases: (tokens, label) pairs.
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out:  List[List[str]] = [[]]
+
+        for tokens, label in phrases:
+            node = 0
+            for tok in tokens:
+                nxt = self._goto[node].get(tok)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][tok] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(label)
+
+        # breadth-first failure links; outputs inherit their suffix's outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for tok, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and tok not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(tok, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def labels(self, tokens: List[str]) -> Iterator[str]:
+        """Yields the label of every phrase occurrence in the token list."""
+        node = 0
+        for tok in tokens:
+            while node and tok not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(tok, 0)
+            yield from self._out[node]
+
+
+class LexicalIntentMatcher:
+    """
+    Keyword pre-classifier run before the embedding model. Returns an intent
+    only when every phrase found in the message points to the same intent;
+    messages with no phrase, or phrases from several intents, return None
+    and go to the model.
+    """
+    def __init__(self, phrases: Dict[str, List[str]] = None):
+        phrases = phrases or INTENT_PHRASES
+        self.automaton = AhoCorasick(
+            (tokenize(p), intent) for intent, plist in phrases.items() for p in plist
+        )
+
+    def match(self, text: str) -> Optional[str]:
+        found = set(self.automaton.labels(tokenize(text)))
+        return found.pop() if len(found) == 1 else None
@@ -1,71 +1,213 @@
 import os
-import requests
+import json
+import time
+import asyncio
 import logging
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Dict, List, Any, Optional
+
+from http_client import HttpClient, AsyncHttpClient, default_client, default_async_client
+from response_cache import ResponseCache, default_cache
+from common import tracing
+
+_DEFAULT = object()
 
 logger = logging.getLogger(__name__)
 
 class PerplexityClient:
     """Client for Perplexity AI API integration"""
-    
-    def __init__(self, api_key: Optional[str] = None):
+
+    def __init__(self, api_key: Optional[str] = None, http: Optional[HttpClient] = None,
+                 async_http: Optional[AsyncHttpClient] = None, cache=_DEFAULT):
         self.api_key = api_key or os.environ.get('PERPLEXITY_API_KEY')
+        self.http = http or default_client()
+        self._async_http = async_http
+        # shared process-wide cache unless one is passed in (None disables caching)
+        self.cache: Optional[ResponseCache] = default_cache() if cache is _DEFAULT else cache
         if not self.api_key:
             logger.warning("No Perplexity API key provided. Some features will be limited.")
-        self.base_url = "https://api.perplexity.ai/chat/completions"
-        
+        self.base_url = os.environ.get('PERPLEXITY_BASE_URL', "https://api.perplexity.ai/chat/completions")
+
+    @property
+    def async_http(self) -> AsyncHttpClient:
+        if self._async_http is None:
+            self._async_http = default_async_client()
+        return self._async_http
+
+    def _request(self, query: str, model: str) -> Dict[str, Any]:
+        """Headers and JSON payload for a completion request"""
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": "You are a helpful e-commerce assistant. Provide concise, accurate information about products and shopping trends."},
+                {"role": "user", "content": query}
+            ],
+            "temperature": 0.2,
+            "max_tokens": 1024
+        }
+        return {"headers": headers, "json": payload, "timeout": 10}
+
+    def _parse(self, response) -> Dict[str, Any]:
+        """Turns an HTTP response (requests or httpx) into content + sources"""
+        if response.status_code != 200:
+            logger.error(f"Perplexity API error: {response.status_code} - {response.text}")
+            return {"error": f"API error: {response.status_code}"}
+
+        result = response.json()
+        return {
+            "content": result["choices"][0]["message"]["content"],
+            "sources": self._extract_sources(result)
+        }
+
+    def _remember(self, query: str, model: str, result: Dict[str, Any], started: float):
+        """Caches successful answers together with the time they took"""
+        if self.cache is not None and "error" not in result:
+            self.cache.put(query, model, result, elapsed=time.perf_counter() - started)
+
+    async def _acache(self, fn, *args):
+        """
+        Runs a cache call from a coroutine: in a worker thread when it can
+        block (SQLite I/O, embedding the prompt), inline when it is a dict lookup
+        """
+        if self.cache.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def _alookup(self, query: str, model: str) -> Optional[Dict[str, Any]]:
+        with tracing.span("perplexity.cache"):
+            return await self._acache(self.cache.lookup, query, model)
+
+    async def _aremember(self, query: str, model: str, result: Dict[str, Any], started: float):
+        """_remember() for the async paths"""
+        if self.cache is not None and "error" not in result:
+            await self._acache(self.cache.put, query, model, result, time.perf_counter() - started)
+
     def search(self, query: str, model: str = "sonar") -> Dict[str, Any]:
         """
         Perform a search using Perplexity API
-        
+
         Args:
             query: The search query
             model: The model to use
-            
+
         Returns:
             Dict containing the search results and sources
         """
         if not self.api_key:
             logger.error("Perplexity API key is required for search")
             return {"error": "API key not configured"}
-            
+
+        if self.cache is not None:
+            with tracing.span("perplexity.cache"):
+                cached = self.cache.lookup(query, model)
+            if cached is not None:
+                return cached
+
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": "You are a helpful e-commerce assistant. Provide concise, accurate information about products and shopping trends."},
-                    {"role": "user", "content": query}
-                ],
-                "temperature": 0.2,
-                "max_tokens": 1024
-            }
-            
-            response = requests.post(
-                self.base_url,
-                headers=headers,
-                json=payload,
-                timeout=10
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Perplexity API error: {response.status_code} - {response.text}")
-                return {"error": f"API error: {response.status_code}"}
-                
-            result = response.json()
-            return {
-                "content": result["choices"][0]["message"]["content"],
-                "sources": self._extract_sources(result)
-            }
-            
+            started = time.perf_counter()
+            with tracing.span("perplexity.request", model=model):
+                response = self.http.post(self.base_url, **self._request(query, model))
+            result = self._parse(response)
+            self._remember(query, model, result, started)
+            return result
         except Exception as e:
             logger.error(f"Error in Perplexity search: {str(e)}")
             return {"error": f"Search failed: {str(e)}"}
-    
+
+    async def asearch(self, query: str, model: str = "sonar") -> Dict[str, Any]:
+        """
+        Non-blocking variant of search() for the async chat pipeline
+
+        Args:
+            query: The search query
+            model: The model to use
+
+        Returns:
+            Dict containing the search results and sources
+        """
+        if not self.api_key:
+            logger.error("Perplexity API key is required for search")
+            return {"error": "API key not configured"}
+
+        if self.cache is not None:
+            cached = await self._alookup(query, model)
+            if cached is not None:
+                return cached
+
+        try:
+            started = time.perf_counter()
+            with tracing.span("perplexity.request", model=model):
+                response = await self.async_http.post(self.base_url, **self._request(query, model))
+            result = self._parse(response)
+            await self._aremember(query, model, result, started)
+            return result
+        except Exception as e:
+            logger.error(f"Error in Perplexity search: {str(e)}")
+            return {"error": f"Search failed: {str(e)}"}
+
+    async def astream(self, query: str, model: str = "sonar") -> AsyncIterator[str]:
+        """
+        Streams the answer text as it is generated (the API's stream mode)
+
+        A cached answer is yielded in one piece, and a completed stream is
+        cached like a search() result. On an error the stream just ends, so
+        callers keep whatever text arrived.
+
+        Args:
+            query: The search query
+            model: The model to use
+
+        Yields:
+            Chunks of the answer text
+        """
+        if not self.api_key:
+            logger.error("Perplexity API key is required for search")
+            return
+
+        if self.cache is not None:
+            cached = await self._alookup(query, model)
+            if cached is not None:
+                if cached.get("content"):
+                    yield cached["content"]
+                return
+
+        started = time.perf_counter()
+        request = self._request(query, model)
+        request["json"]["stream"] = True
+        parts: List[str] = []
+        sources: List[Dict[str, str]] = []
+        complete = False
+        try:
+            async with self.async_http.stream("POST", self.base_url, **request) as response:
+                if response.status_code != 200:
+                    logger.error(f"Perplexity API error: {response.status_code} - {(await response.aread())[:200]!r}")
+                    return
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    sources = self._extract_sources(chunk) or sources
+                    text = (chunk["choices"][0].get("delta") or {}).get("content")
+                    if text:
+                        if not parts:
+                            tracing.record("perplexity.first_token", started, time.perf_counter() - started)
+                        parts.append(text)
+                        yield text
+                complete = True
+        except Exception as e:
+            logger.error(f"Error in Perplexity stream: {str(e)}")
+        finally:
+            # recorded here rather than as a span: the generator is suspended between chunks
+            tracing.record("perplexity.stream", started, time.perf_counter() - started, model=model)
+        if complete and parts:
+            await self._aremember(query, model, {"content": "".join(parts), "sources": sources}, started)
+
     def _extract_sources(self, result: Dict[str, Any]) -> List[Dict[str, str]]:
         """Extract sources from the API response if available"""
         try:
@@ -1,8 +1,8 @@
 import logging
-import re
 from datetime import datetime
 
 from perplexity_client import PerplexityClient
+from chat_router import EVAL_RE
 
 logger = logging.getLogger(__name__)
 
@@ -67,12 +67,14 @@ class ChatHandler:
             lines.append(f"{i}. {d.get('Product') or d.get('Product_Category')} — Profit: ${d['Profit']:.2f}")
         return self.analytics_templates["high_profit"].format(lines="\n".join(lines))
 
-    def generate_product_response(self, products, query):
+    def generate_product_response(self, products, query, insight=None, fetch_insight=True):
+        """
+        insight: market insight fetched by the caller (e.g. concurrently with
+        the product search). With fetch_insight=False no Perplexity call is
+        made here for multi-result searches, so a missing insight is omitted.
+        """
         # Evaluate "Is X good for Y?" queries
-        eval_match = re.match(
-            r"is (?:the )?(?P<product>.+?) good for (?P<target>.+?)(?:\?|$)",
-            query, flags=re.IGNORECASE
-        )
+        eval_match = EVAL_RE.match(query)
         if eval_match and products:
             prod = products[0]
             target = eval_match.group('target').strip()
@@ -121,25 +123,29 @@ class ChatHandler:
             )
         resp = "Here are some products that match your search:\n\n" + "\n".join(lines)
         # Optional market insight
-        if self.perplexity:
+        if insight is None and fetch_insight and self.perplexity:
             try:
                 insight = self._market_insights(query)
-                if insight:
-                    resp += f"\n\nMarket Insights: {insight}"
             except Exception:
                 pass
+        if insight:
+            resp += f"\n\nMarket Insights: {insight}"
         return resp
 
-    def _market_insights(self, query):
-        prompt = (
+    def market_insights_prompt(self, query):
+        return (
             f"Provide a brief market overview for products matching '{query}', "
             "including trends and price ranges in two sentences."
         )
+
+    def _market_insights(self, query):
+        prompt = self.market_insights_prompt(query)
         return self.perplexity.search(prompt).get('content','') if self.perplexity else ''
 
     def generate_order_response(self, order_data, query):
         cid = order_data.get('customer_id')
-        orders = order_data.get('orders', [])
+        orders = order_data.get('orders', [])   # newest first
+        total = order_data.get('total', len(orders))
         if not orders:
             return f"I couldn't find any orders under Customer ID {cid}."
 
@@ -153,7 +159,7 @@ class ChatHandler:
         ship  = float(most_recent.get('Shipping_Cost',0))
         prod  = most_recent.get('Product','item')
 
-        if len(orders) == 1:
+        if total == 1:
             return (
                 f"Here’s what I found for your most recent order:\n"
                 f"• Date: {date_str}\n"
@@ -162,7 +168,7 @@ class ChatHandler:
                 f"Is there anything else you’d like to know?"
             )
         return (
-            f"You have {len(orders)} orders. Most recent:\n"
+            f"You have {total} orders. Most recent:\n"
             f"• Date: {date_str}\n"
             f"• Item: {prod}\n"
             f"• Total: ${sales:.2f} (Shipping: ${ship:.2f})\n"
@@ -0,0 +1,369 @@
+# chat_service/response_cache.py
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStore:
+    """
+    In-process LRU store for cache entries.
+    """
+    def __init__(self, maxsize: int = 1024):
+        """
+        Initializes the store.
+
+        Args:
+            maxsize (int): Entries kept before the least recently used is evicted.
+        """
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskStore:
+    """
+    SQLite-backed store, so cached answers survive restarts and are shared by
+    every worker on the host. Evicts least recently used rows past maxsize;
+    the row count is checked every evict_every inserts rather than on each one,
+    so the table can briefly overshoot maxsize by that many rows per worker.
+    """
+    def __init__(self, path: str, maxsize: int = 10000):
+        """
+        Initializes the store, creating the database if needed.
+
+        Args:
+            path (str): SQLite database file.
+            maxsize (int): Rows kept before the least recently used are evicted.
+        """
+        self.path = path
+        self.maxsize = maxsize
+        self.evict_every = max(1, maxsize // 20)
+        self._inserts = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(entry), time.time()),
+            )
+            self._inserts += 1
+            if self._inserts >= self.evict_every:
+                self._inserts = 0
+                self._evict()
+
+    def _evict(self):
+        excess = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.maxsize
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM entries WHERE key IN ("
+                " SELECT key FROM entries ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class _PromptIndex:
+    """
+    Unit vectors of recently cached prompts, kept in one preallocated matrix so
+    a semantic lookup is a single matrix-vector product. Rows are handed out
+    from a free list and, once full, reused least recently added first. Not
+    thread-safe; ResponseCache holds its lock around every call.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._vectors: Optional[np.ndarray] = None  # (capacity, dim), allocated on first add
+        self._models = np.full(capacity, -1, dtype=np.int32)  # model id per row, -1 = free
+        self._model_ids: Dict[str, int] = {}
+        self._rows: "OrderedDict[str, int]" = OrderedDict()  # key -> row
+        self._keys: List[Optional[str]] = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, key: str, model: str, vec: np.ndarray):
+        if self.capacity <= 0:
+            return
+        if self._vectors is None:
+            self._vectors = np.zeros((self.capacity, vec.shape[0]), dtype=np.float32)
+        row = self._rows.pop(key, None)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                _, row = self._rows.popitem(last=False)
+        self._rows[key] = row
+        self._keys[row] = key
+        self._vectors[row] = vec
+        self._models[row] = self._model_ids.setdefault(model, len(self._model_ids))
+
+    def remove(self, key: str):
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._keys[row] = None
+            self._models[row] = -1
+            self._free.append(row)
+
+    def nearest(self, query: np.ndarray, model: str) -> Tuple[Optional[str], float]:
+        model_id = self._model_ids.get(model)
+        if model_id is None or self._vectors is None:
+            return None, 0.0
+        sims = self._vectors @ query
+        sims[self._models != model_id] = -np.inf
+        best = int(np.argmax(sims))
+        if sims[best] == -np.inf:
+            return None, 0.0
+        return self._keys[best], float(sims[best])
+
+
+class ResponseCache:
+    """
+    Cache for external completion calls.
+
+    Lookups are exact first (same model, same prompt up to whitespace), with
+    a TTL. If an embedder and a similarity threshold are configured, a miss
+    falls back to the most similar cached prompt for the same model and reuses
+    its answer when the cosine similarity clears the threshold. Hit counts
+    and the wall-clock time the original calls took are tracked, so stats()
+    reports how much latency the cache saved.
+    """
+    def __init__(
+        self,
+        store=None,
+        ttl: float = 3600,
+        similarity_threshold: Optional[float] = None,
+        embedder: Optional[Callable[[List[str]], Any]] = None,
+        max_index: int = 1024,
+    ):
+        """
+        Initializes the cache.
+
+        Args:
+            store: MemoryStore or DiskStore (defaults to a MemoryStore).
+            ttl (float): Seconds an answer stays valid.
+            similarity_threshold (Optional[float]): Minimum cosine similarity for a
+                near-duplicate hit; None disables semantic lookup.
+            embedder (Optional[Callable]): Maps a list of texts to embedding vectors.
+            max_index (int): Prompts kept in the in-memory similarity index.
+        """
+        self.store = store if store is not None else MemoryStore()
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embedder = embedder
+        self.max_index = max_index
+
+        self._lock = threading.Lock()
+        self._index = _PromptIndex(max_index)
+        self._stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "saved_seconds": 0.0}
+
+    @staticmethod
+    def _normalize(prompt: str) -> str:
+        return re.sub(r"\s+", " ", prompt).strip()
+
+    def key(self, prompt: str, model: str) -> str:
+        raw = f"{model}\0{self._normalize(prompt)}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    @property
+    def semantic(self) -> bool:
+        return self.similarity_threshold is not None and self.embedder is not None
+
+    @property
+    def blocking(self) -> bool:
+        """Whether lookup()/put() may block: disk I/O, or embedding the prompt."""
+        return self.semantic or not isinstance(self.store, MemoryStore)
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        vec = np.asarray(self.embedder([self._normalize(prompt)]), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _count(self, name: str, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _live(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.store.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            self.store.delete(key)
+            with self._lock:
+                self._index.remove(key)
+            return None
+        return entry
+
+    def _nearest(self, prompt: str, model: str) -> Tuple[Optional[str], float]:
+        query = self._embed(prompt)
+        with self._lock:
+            return self._index.nearest(query, model)
+
+    def lookup(self, prompt: str, model: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached response for a prompt, or None on a miss.
+
+        Args:
+            prompt (str): The prompt sent to the API.
+            model (str): The model it was sent to.
+
+        Returns:
+            Optional[Dict[str, Any]]: The cached response.
+        """
+        entry = self._live(self.key(prompt, model))
+        if entry is not None:
+            self._count("hits")
+            self._count("saved_seconds", entry.get("elapsed", 0.0))
+            return entry["response"]
+
+        if self.semantic:
+            try:
+                near_key, score = self._nearest(prompt, model)
+                if near_key is not None and score >= self.similarity_threshold:
+                    entry = self._live(near_key)
+                    if entry is not None:
+                        logger.info(f"Semantic cache hit ({score:.3f}) for prompt {prompt[:60]!r}")
+                        self._count("semantic_hits")
+                        self._count("saved_seconds", entry.get("elapsed", 0.0))
+                        return entry["response"]
+            except Exception as e:
+                logger.error(f"Semantic cache lookup failed: {e}")
+
+        self._count("misses")
+        return None
+
+    def put(self, prompt: str, model: str, response: Dict[str, Any], elapsed: float = 0.0):
+        """
+        Stores a response.
+
+        Args:
+            prompt (str): The prompt sent to the API.
+            model (str): The model it was sent to.
+            response (Dict[str, Any]): The parsed response to reuse.
+            elapsed (float): Seconds the original call took.
+        """
+        key = self.key(prompt, model)
+        self.store.set(key, {"response": response, "created": time.time(), "elapsed": elapsed})
+        self._count("stores")
+        if self.semantic:
+            try:
+                vec = self._embed(prompt)
+                with self._lock:
+                    self._index.add(key, model, vec)
+            except Exception as e:
+                logger.error(f"Could not index prompt for semantic cache: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters, hit rate and saved wall-clock seconds.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            indexed = len(self._index)
+        lookups = stats["hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["semantic_hits"]) / lookups, 4) if lookups else 0.0
+        stats["saved_seconds"] = round(stats["saved_seconds"], 3)
+        stats.update({
+            "store": type(self.store).__name__,
+            "size": len(self.store),
+            "ttl": self.ttl,
+            "similarity_threshold": self.similarity_threshold if self.semantic else None,
+            "indexed_prompts": indexed,
+        })
+        return stats
+
+
+_UNSET = object()
+_default_cache = _UNSET
+_default_lock = threading.Lock()
+
+
+def cache_from_env() -> Optional[ResponseCache]:
+    """
+    Builds a cache from PERPLEXITY_CACHE ("memory", "disk" or "off"),
+    PERPLEXITY_CACHE_TTL, PERPLEXITY_CACHE_SIZE, PERPLEXITY_CACHE_PATH and
+    PERPLEXITY_CACHE_SIMILARITY.
+    """
+    env = os.environ.get
+    kind = env("PERPLEXITY_CACHE", "memory").lower()
+    if kind in ("off", "none", "0", "false"):
+        return None
+    size = int(env("PERPLEXITY_CACHE_SIZE", 1024))
+    if kind == "disk":
+        path = env("PERPLEXITY_CACHE_PATH", os.path.join(tempfile.gettempdir(), "perplexity_cache.sqlite3"))
+        store = DiskStore(path, maxsize=size)
+    else:
+        store = MemoryStore(maxsize=size)
+    similarity = env("PERPLEXITY_CACHE_SIMILARITY")
+    return ResponseCache(
+        store=store,
+        ttl=float(env("PERPLEXITY_CACHE_TTL", 3600)),
+        similarity_threshold=float(similarity) if similarity else None,
+        max_index=size,
+    )
+
+
+def default_cache() -> Optional[ResponseCache]:
+    """The process-wide cache shared by every PerplexityClient."""
+    global _default_cache
+    if _default_cache is _UNSET:
+        with _default_lock:
+            if _default_cache is _UNSET:
+                _default_cache = cache_from_env()
+    return _default_cache
@@ -0,0 +1,101 @@
+# chat_service/session_benchmark.py
+#
+# Memory per chat session, for sizing chat_service hosts.
+#
+#   python session_benchmark.py --sessions 5000 --turns 40
+#
+# Builds sessions that look like real conversations (user/bot turns plus a
+# pending multi-order choice) and measures the heap they occupy with
+# tracemalloc, next to the previous representation (a __dict__ object with
+# an unbounded list of history dicts and full order records copied in).
+
+import gc
+import json
+import argparse
+import tracemalloc
+
+from session_manager import Session, HISTORY_CAPACITY
+
+USER_MSG = "What is the status of my car body covers order?"
+BOT_MSG  = ("I found multiple matching orders:\n1. January 02, 2018 — Car Body Covers\n"
+            "2. March 14, 2018 — Car Body Covers\nWhich one would you like details for?")
+ORDER = {
+    "Order_Date": "2018-01-02", "Time": "10:56:33", "Aging": 8.0, "Customer_Id": 37077,
+    "Gender": "Female", "Device_Type": "Web", "Customer_Login_type": "Member",
+    "Product_Category": "Auto & Accessories", "Product": "Car Body Covers", "Sales": 140.0,
+    "Quantity": 1.0, "Discount": 0.3, "Profit": 46.0, "Shipping_Cost": 4.6,
+    "Order_Priority": "Medium", "Payment_method": "credit_card",
+}
+
+
+class LegacySession:
+    """The previous Session layout, kept here only as a baseline."""
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.created_at = 0.0
+        self.last_active = 0.0
+        self.data = {}
+        self.conversation_history = []
+        self.expected_input = None
+
+    def add_to_history(self, role, message):
+        self.conversation_history.append({"role": role, "message": message, "timestamp": 0.0})
+
+
+def _fill(session, turns: int, legacy: bool):
+    for t in range(turns):
+        # distinct strings per turn, as real messages would be
+        session.add_to_history("user", f"{USER_MSG} #{t}")
+        session.add_to_history("bot", f"{BOT_MSG} #{t}")
+    if legacy:
+        session.data["specific_orders"] = [dict(ORDER, Sales=140.0 + i) for i in range(3)]
+    else:
+        session.data["specific_orders"] = [1625 + i for i in range(3)]
+    session.data["customer_id"] = "37077"
+    session.expected_input = "which_specific_order"
+
+
+def measure(factory, sessions: int, turns: int, legacy: bool) -> float:
+    """Average bytes allocated per session."""
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    keep = []
+    for i in range(sessions):
+        s = factory(f"{i:08x}-0000-4000-8000-000000000000")
+        _fill(s, turns, legacy)
+        keep.append(s)
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (end - start) / sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory per chat session")
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=40, help="user+bot exchanges per session")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    current = measure(Session, args.sessions, args.turns, legacy=False)
+    legacy  = measure(LegacySession, args.sessions, args.turns, legacy=True)
+    report = {
+        "sessions": args.sessions,
+        "turns": args.turns,
+        "history_capacity": HISTORY_CAPACITY,
+        "bytes_per_session": {"current": round(current), "legacy": round(legacy)},
+        "sessions_per_gib":  {"current": int(2**30 // current), "legacy": int(2**30 // legacy)},
+        "reduction": round(1 - current / legacy, 3),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.sessions} sessions x {args.turns} exchanges (history capacity {HISTORY_CAPACITY})")
+    for name in ("current", "legacy"):
+        print(f"  {name:<8} {report['bytes_per_session'][name]:>9,} B/session"
+              f"  {report['sessions_per_gib'][name]:>10,} sessions/GiB")
+    print(f"  reduction {report['reduction']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,105 @@
+import os
 import time
-from typing import Dict, Any, Optional, List
+import threading
+from collections import deque
+from typing import Deque, Dict, Any, Optional, List, Tuple
 import logging
 import uuid
 
+from session_store import SessionStore, MemorySessionStore, SessionConflict, encode_state, decode_state
+
 logger = logging.getLogger(__name__)
 
+# conversation turns kept per session; older turns are overwritten
+HISTORY_CAPACITY = int(os.getenv("SESSION_HISTORY_SIZE", 50))
+
+# history stores a small int per message instead of the role string
+ROLES: List[str] = ["user", "bot"]
+_ROLE_CODES: Dict[str, int] = {role: code for code, role in enumerate(ROLES)}
+_roles_lock = threading.Lock()
+
+
+def _role_code(role: str) -> int:
+    code = _ROLE_CODES.get(role)
+    if code is None:
+        with _roles_lock:
+            code = _ROLE_CODES.setdefault(role, len(ROLES))
+            if code == len(ROLES):
+                ROLES.append(role)
+    return code
+
+
 class Session:
     """
     Represents a user session.
+
+    Uses __slots__ (no per-instance __dict__). Conversation history is a
+    fixed-capacity ring buffer of (role code, message, timestamp) tuples, so a
+    long-lived session never holds more than HISTORY_CAPACITY turns.
     """
-    def __init__(self, session_id: str):
+    __slots__ = ("session_id", "created_at", "last_active", "data", "history",
+                 "expected_input", "version", "ended")
+
+    def __init__(self, session_id: str, history_capacity: int = None):
         """
         Initializes a new session.
 
         Args:
             session_id (str): The unique ID of the session.
+            history_capacity (int, optional): Turns kept in the history ring buffer.
+                Defaults to SESSION_HISTORY_SIZE or 50.
         """
         self.session_id: str = session_id
         self.created_at: float = time.time()
-        self.last_active: float = time.time()
+        self.last_active: float = self.created_at
         self.data: Dict[str, Any] = {}
-        self.conversation_history: List[Dict[str, Any]] = []
+        self.history: Deque[Tuple[int, str, float]] = deque(maxlen=history_capacity or HISTORY_CAPACITY)
         self.expected_input: Optional[str] = None
+        self.version: int = 0        # store version this session was loaded at
+        self.ended: bool = False     # ended this turn; don't write it back
+
+    @property
+    def conversation_history(self) -> List[Dict[str, Any]]:
+        """The retained history as role/message/timestamp dicts."""
+        return [{"role": ROLES[code], "message": message, "timestamp": ts}
+                for code, message, ts in self.history]
+
+    def to_state(self) -> Dict[str, Any]:
+        """
+        Serializable form of the session (short keys keep stored payloads small).
+
+        Returns:
+            Dict[str, Any]: The session state.
+        """
+        return {
+            "c": self.created_at,
+            "a": self.last_active,
+            "d": self.data,
+            "h": [[ROLES[code], message, ts] for code, message, ts in self.history],
+            "e": self.expected_input,
+        }
+
+    @classmethod
+    def from_state(cls, session_id: str, state: Dict[str, Any], version: int = 0) -> "Session":
+        """
+        Rebuilds a session from to_state() output.
+
+        Args:
+            session_id (str): The session ID.
+            state (Dict[str, Any]): The stored state.
+            version (int, optional): The store version it was loaded at.
+
+        Returns:
+            Session: The session object.
+        """
+        session = cls(session_id)
+        session.created_at = state["c"]
+        session.last_active = state["a"]
+        session.data = state["d"]
+        session.history.extend((_role_code(role), message, ts) for role, message, ts in state["h"])
+        session.expected_input = state["e"]
+        session.version = version
+        return session
 
     def update_activity(self):
         """
@@ -65,11 +143,7 @@ class Session:
         if not isinstance(message, str):
             logger.warning(f"Attempted to add non-string message to history: {type(message)}")
             message = str(message)
-        self.conversation_history.append({
-            "role": role,
-            "message": message,
-            "timestamp": time.time()
-        })
+        self.history.append((_role_code(role), message, time.time()))
         self.update_activity()
 
     def get_history(self, max_messages: int = 10) -> List[Dict[str, Any]]:
@@ -83,9 +157,10 @@ class Session:
             List[Dict[str, Any]]: The session's conversation history.
         """
         self.update_activity()
+        history = self.conversation_history
         if max_messages <= 0:
-            return self.conversation_history
-        return self.conversation_history[-max_messages:]
+            return history
+        return history[-max_messages:]
 
     def set_expected_input(self, expectation: Optional[str]):
         """
@@ -112,20 +187,56 @@ class Session:
 class SessionManager:
     """
     Manages user sessions.
+
+    Sessions live in a SessionStore (see session_store.py): each turn loads
+    the session with get_session and writes it back with save_session, with
+    a version check. The default MemorySessionStore keeps them in process, in
+    LRU order with a cap; a shared store (SQLite, Redis) lets any worker serve
+    any turn. A background sweeper thread purges expired sessions.
     """
-    def __init__(self, session_expiry_seconds: int = 86400):
+    def __init__(self, session_expiry_seconds: int = 86400, max_sessions: int = None,
+                 sweep_interval: float = None, store: Optional[SessionStore] = None):
         """
         Initializes a new session manager.
 
         Args:
             session_expiry_seconds (int, optional): The session expiry time in seconds. Defaults to 86400 (24 hours).
+            max_sessions (int, optional): Cap for the default in-process store.
+                Defaults to SESSION_MAX_SESSIONS or 100000.
+            sweep_interval (float, optional): Seconds between background sweeps. Defaults to
+                a tenth of the expiry, capped at 60 seconds.
+            store (Optional[SessionStore], optional): Session backend. Defaults to a MemorySessionStore.
         """
-        self.sessions: Dict[str, Session] = {}
+        self.store: SessionStore = store if store is not None else MemorySessionStore(max_sessions)
         self.session_expiry_seconds: int = session_expiry_seconds
+        self.sweep_interval: float = sweep_interval or min(60.0, max(session_expiry_seconds / 10, 1.0))
+        self._lock = threading.Lock()
+        self._purged = 0
+        self._sweeper_pid: Optional[int] = None
+
+    def _ensure_sweeper(self):
+        # started lazily (and again after a fork) so every worker process sweeps its own table;
+        # checked again under the lock so concurrent first requests start one thread
+        pid = os.getpid()
+        if self._sweeper_pid == pid:
+            return
+        with self._lock:
+            if self._sweeper_pid != pid:
+                threading.Thread(target=self._sweep_forever, name="session-sweeper", daemon=True).start()
+                self._sweeper_pid = pid
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self._cleanup_expired_sessions()
+            except Exception as e:
+                logger.error(f"Session sweep failed: {e}")
 
     def get_session(self, session_id: Optional[str] = None) -> Session:
         """
-        Gets a session by ID. If no ID is provided, a new session is created.
+        Gets a session by ID. If no ID is provided, or the session is missing
+        or expired, a new session is created; it is stored by save_session.
 
         Args:
             session_id (Optional[str], optional): The ID of the session to get. Defaults to None.
@@ -133,38 +244,53 @@ class SessionManager:
         Returns:
             Session: The session object.
         """
-        self._cleanup_expired_sessions()
+        self._ensure_sweeper()
 
         if not session_id or session_id == "None" or session_id == "null":
             session_id = None
 
-        if session_id and session_id in self.sessions:
+        loaded = self.store.load(session_id) if session_id else None
+        if loaded is not None:
+            version, payload = loaded
             logger.info(f"Reusing existing session: {session_id}")
-            self.sessions[session_id].update_activity()
-            return self.sessions[session_id]
-        else:
-            if session_id:
-                logger.info(f"Session ID '{session_id}' not found or expired, creating new.")
-            
-            new_session_id = str(uuid.uuid4())
-            logger.info(f"Creating new session: {new_session_id}")
-            new_session = Session(new_session_id)
-            self.sessions[new_session_id] = new_session
-            return new_session
+            if self.store.shared:
+                session = Session.from_state(session_id, decode_state(payload), version)
+            else:
+                session = payload
+            session.update_activity()
+            return session
+        if session_id:
+            logger.info(f"Session ID '{session_id}' not found or expired, creating new.")
+        new_session_id = str(uuid.uuid4())
+        logger.info(f"Creating new session: {new_session_id}")
+        return Session(new_session_id)
+
+    def save_session(self, session: Session):
+        """
+        Writes a session back to the store at the end of a turn.
+
+        Args:
+            session (Session): The session to save.
+
+        Raises:
+            SessionConflict: If another request saved the session since it was loaded.
+        """
+        if session.ended:
+            return
+        payload = encode_state(session.to_state()) if self.store.shared else session
+        if not self.store.save(session.session_id, payload, session.version, self.session_expiry_seconds):
+            raise SessionConflict(f"Session {session.session_id} was modified concurrently")
+        session.version += 1
 
     def _cleanup_expired_sessions(self):
         """
-        Cleans up expired sessions.
+        Purges expired sessions from the store.
         """
-        current_time = time.time()
-        expired_ids = [
-            sid for sid, session_obj in self.sessions.items()
-            if (current_time - session_obj.last_active) > self.session_expiry_seconds
-        ]
-        for sid in list(expired_ids):
-            if sid in self.sessions:
-                logger.info(f"Session {sid} expired, removing.")
-                del self.sessions[sid]
+        purged = self.store.purge_expired()
+        if purged:
+            logger.info(f"Purged {purged} expired session(s).")
+            with self._lock:
+                self._purged += purged
 
     def end_session(self, session_id: str):
         """
@@ -173,6 +299,15 @@ class SessionManager:
         Args:
             session_id (str): The ID of the session to end.
         """
-        if session_id in self.sessions:
-            logger.info(f"Ending session: {session_id}")
-            del self.sessions[session_id]
+        logger.info(f"Ending session: {session_id}")
+        self.store.delete(session_id)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Sessions purged by the sweeper, plus the store's own counters (live
+        sessions and evictions by cause for the in-process store).
+        """
+        with self._lock:
+            stats = {"store": type(self.store).__name__, "evicted_expired": self._purged}
+        stats.update(self.store.stats())
+        return stats
@@ -0,0 +1,288 @@
+# chat_service/session_store.py
+#
+# Session storage behind SessionManager. It loads each session from a store
+# at the start of a turn and writes it back at the end with a version check
+# (optimistic concurrency). The default store keeps sessions in process
+# memory; with SESSION_STORE=sqlite or redis they are shared, so
+# slot-filling conversations survive being routed to a different worker or
+# replica.
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# payloads above this many bytes are zlib-compressed
+COMPRESS_OVER = 512
+
+
+class SessionConflict(Exception):
+    """Raised when a session was changed by another request since it was loaded."""
+
+
+def encode_state(state: Dict[str, Any]) -> bytes:
+    """Compact JSON, zlib-compressed when large; the first byte tags the format."""
+    raw = json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(raw) > COMPRESS_OVER:
+        return b"z" + zlib.compress(raw, 6)
+    return b"j" + raw
+
+
+def decode_state(blob: bytes) -> Dict[str, Any]:
+    blob = bytes(blob)
+    tag, body = blob[:1], blob[1:]
+    if tag == b"z":
+        body = zlib.decompress(body)
+    return json.loads(body.decode("utf-8"))
+
+
+class SessionStore:
+    """
+    Interface for session backends. Versions start at 1 for a stored
+    session; version 0 means "not stored yet".
+
+    Shared stores hold encoded state (encode_state) and do disk or network
+    I/O. A process-local store (shared = False) holds the Session objects
+    themselves and never blocks.
+    """
+    shared = True
+
+    def load(self, session_id: str) -> Optional[Tuple[int, bytes]]:
+        """
+        Loads a live session.
+
+        Args:
+            session_id (str): The session ID.
+
+        Returns:
+            Optional[Tuple[int, bytes]]: (version, encoded state), or None if missing or expired.
+        """
+        raise NotImplementedError
+
+    def save(self, session_id: str, blob: bytes, version: int, ttl: float) -> bool:
+        """
+        Writes a session if it is still at `version` (compare-and-set).
+
+        Args:
+            session_id (str): The session ID.
+            blob (bytes): Encoded state.
+            version (int): The version that was loaded (0 for a new session).
+            ttl (float): Seconds until the session expires.
+
+        Returns:
+            bool: False if another writer got there first.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Removes expired sessions, for backends without native TTL."""
+        return 0
+
+    def stats(self) -> Dict[str, int]:
+        """Backend-specific counters, merged into SessionManager.stats()."""
+        return {}
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Process-local store, the default. Sessions are kept in an OrderedDict in
+    least-recently-used order: a load or save moves a session to the end and
+    extends its expiry, so expired sessions collect at the front and are
+    purged by popping from there (amortized O(1), never a full scan). The
+    number of sessions is capped with LRU eviction.
+
+    Concurrent turns of one session share the Session object, as they always
+    have in process, so their saves do not conflict.
+    """
+    shared = False
+
+    def __init__(self, max_sessions: int = None):
+        """
+        Initializes the store.
+
+        Args:
+            max_sessions (int, optional): Sessions kept before the least recently used is evicted.
+                Defaults to SESSION_MAX_SESSIONS or 100000.
+        """
+        self.max_sessions: int = max_sessions or int(os.getenv("SESSION_MAX_SESSIONS", 100000))
+        # session ID -> (version, ttl, expires, session)
+        self._entries: "OrderedDict[str, Tuple[int, float, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._evicted = {"expired": 0, "capacity": 0}
+
+    def load(self, session_id: str) -> Optional[Tuple[int, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            version, ttl, expires, session = entry
+            if expires <= now:
+                del self._entries[session_id]
+                self._evicted["expired"] += 1
+                return None
+            self._entries[session_id] = (version, ttl, now + ttl, session)
+            self._entries.move_to_end(session_id)
+            return version, session
+
+    def save(self, session_id: str, session: Any, version: int, ttl: float) -> bool:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if (entry[0] if entry is not None else 0) != version:
+                return False
+            self._entries[session_id] = (version + 1, ttl, time.time() + ttl, session)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+                self._evicted["capacity"] += 1
+            return True
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        purged = 0
+        with self._lock:
+            # everything after the first live session was used more recently
+            while self._entries:
+                session_id, (_, _, expires, _) = next(iter(self._entries.items()))
+                if expires > now:
+                    break
+                del self._entries[session_id]
+                purged += 1
+            self._evicted["expired"] += purged
+        return purged
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"active": len(self._entries), "max_sessions": self.max_sessions,
+                    "evicted_expired": self._evicted["expired"],
+                    "evicted_capacity": self._evicted["capacity"]}
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Embedded store in one SQLite file: shared by every worker on the host
+    (WAL mode allows concurrent readers with one writer).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, version INTEGER NOT NULL,"
+            " expires REAL NOT NULL, state BLOB NOT NULL)"
+        )
+        self._conn().execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions(expires)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread (and per process after a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, session_id: str) -> Optional[Tuple[int, bytes]]:
+        row = self._conn().execute(
+            "SELECT version, state FROM sessions WHERE id = ? AND expires > ?",
+            (session_id, time.time()),
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def save(self, session_id: str, blob: bytes, version: int, ttl: float) -> bool:
+        conn = self._conn()
+        expires = time.time() + ttl
+        if version == 0:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO sessions (id, version, expires, state) VALUES (?, 1, ?, ?)",
+                (session_id, expires, blob),
+            )
+        else:
+            cur = conn.execute(
+                "UPDATE sessions SET version = version + 1, expires = ?, state = ?"
+                " WHERE id = ? AND version = ?",
+                (expires, blob, session_id, version),
+            )
+        return cur.rowcount == 1
+
+    def delete(self, session_id: str):
+        self._conn().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def purge_expired(self) -> int:
+        return self._conn().execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),)).rowcount
+
+
+# compare-and-set in one round trip: write only if the stored version matches
+_REDIS_CAS = """
+local cur = redis.call('HGET', KEYS[1], 'v')
+if (not cur and ARGV[1] == '0') or cur == ARGV[1] then
+    redis.call('HSET', KEYS[1], 'v', tonumber(ARGV[1]) + 1, 's', ARGV[2])
+    redis.call('PEXPIRE', KEYS[1], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Store for any Redis-protocol server (Redis, Valkey, KeyDB, or a local
+    stand-in such as fakeredis in tests). Each session is a hash holding
+    version and state, with a native per-key TTL.
+    """
+    def __init__(self, url: str = None, client=None, prefix: str = "chat:session:"):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("SESSION_STORE=redis needs the 'redis' package") from e
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self.client = client
+        self.prefix = prefix
+        self._cas = client.register_script(_REDIS_CAS)
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def load(self, session_id: str) -> Optional[Tuple[int, bytes]]:
+        version, blob = self.client.hmget(self._key(session_id), "v", "s")
+        return (int(version), blob) if version is not None and blob is not None else None
+
+    def save(self, session_id: str, blob: bytes, version: int, ttl: float) -> bool:
+        return bool(self._cas(keys=[self._key(session_id)], args=[version, blob, int(ttl * 1000)]))
+
+    def delete(self, session_id: str):
+        self.client.delete(self._key(session_id))
+
+
+def store_from_env() -> SessionStore:
+    """
+    Builds the store named by SESSION_STORE: "memory" (default, process-local),
+    "sqlite" (SESSION_STORE_PATH) or "redis" (SESSION_REDIS_URL).
+    """
+    kind = os.getenv("SESSION_STORE", "memory").lower()
+    if kind == "sqlite":
+        path = os.getenv("SESSION_STORE_PATH", os.path.join(tempfile.gettempdir(), "chat_sessions.sqlite3"))
+        return SQLiteSessionStore(path)
+    if kind == "redis":
+        return RedisSessionStore(os.getenv("SESSION_REDIS_URL"))
+    return MemorySessionStore()
@@ -0,0 +1,48 @@
+# chat_service/single_flight.py
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSingleFlight:
+    """
+    Collapses concurrent identical downstream calls into one request.
+
+    The first coroutine to call do() with a key starts the call; coroutines
+    arriving with the same key while it is in flight await the same task and
+    share its result (or exception). Nothing is kept once the call finishes,
+    so this only removes duplicate work during bursts; it is not a cache.
+    Results are shared objects and must be treated as read-only.
+    """
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._stats = {"calls": 0, "executions": 0, "collapsed": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Awaits fn() unless an identical call is already in flight.
+
+        Args:
+            key (Hashable): Identifies identical calls.
+            fn (Callable[[], Awaitable]): Starts the call.
+
+        Returns:
+            Any: The shared result.
+        """
+        self._stats["calls"] += 1
+        task = self._calls.get(key)
+        if task is not None:
+            self._stats["collapsed"] += 1
+        else:
+            self._stats["executions"] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _t: self._calls.pop(key, None))
+        # shield: one caller giving up must not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats, in_flight=len(self._calls))
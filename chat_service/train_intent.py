@@ -0,0 +1,191 @@
+# chat_service/train_intent.py
+#
+# Fits the small intent head loaded by IntentClassifier and benchmarks it
+# against the prototype scorer.
+#
+#   python train_intent.py train --examples intent_examples.jsonl --samples ../samples.json
+#   python train_intent.py bench --examples intent_examples.jsonl
+#
+# The head is multinomial logistic regression on the (normalized) MiniLM
+# sentence embeddings: one weight matrix and bias, a few KB on disk.
+#
+# The two scorers are on different scales (max cosine similarity vs softmax
+# probability), so each has its own fallback threshold. The head's threshold
+# is saved in the artifact and used by IntentClassifier when the head loads.
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path: sys.path.insert(0, ROOT)  # for common/
+
+from intent_classifier import IntentClassifier, DEFAULT_HEAD_PATH
+from lexicon import LexicalIntentMatcher
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_EXAMPLES = os.path.join(HERE, "intent_examples.jsonl")
+
+
+def load_examples(paths: List[str]) -> List[Tuple[str, str]]:
+    """(text, intent) pairs from JSONL files of {"text", "intent"} records."""
+    examples = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    examples.append((rec["text"], rec["intent"]))
+    return examples
+
+
+def mine_samples(path: str) -> List[Tuple[str, str]]:
+    """
+    Weakly labels the questions in samples.json with the lexical matcher,
+    keeping only those it classifies unambiguously. At runtime the lexicon
+    answers these messages before the model runs, so they are used as
+    training data only and never held out for evaluation.
+    """
+    with open(path, encoding="utf-8") as f:
+        samples = json.load(f)
+    matcher = LexicalIntentMatcher()
+    mined = []
+    for group in samples.values():
+        for item in group:
+            intent = matcher.match(item["question"])
+            if intent:
+                mined.append((item["question"], intent))
+    return mined
+
+
+def split(examples, holdout: float, seed: int):
+    """Stratified train/holdout split."""
+    rng = np.random.default_rng(seed)
+    by_intent: Dict[str, List[Tuple[str, str]]] = {}
+    for ex in examples:
+        by_intent.setdefault(ex[1], []).append(ex)
+    train, test = [], []
+    for group in by_intent.values():
+        order = rng.permutation(len(group))
+        n_test = int(round(len(group) * holdout))
+        test += [group[i] for i in order[:n_test]]
+        train += [group[i] for i in order[n_test:]]
+    return train, test
+
+
+def fit_head(X: np.ndarray, y: np.ndarray, n_classes: int,
+             epochs: int = 500, lr: float = 1.0, l2: float = 1e-3):
+    """Full-batch gradient descent on softmax cross-entropy with L2."""
+    n, d = X.shape
+    W = np.zeros((d, n_classes), np.float32)
+    b = np.zeros(n_classes, np.float32)
+    Y = np.eye(n_classes, dtype=np.float32)[y]
+    for _ in range(epochs):
+        logits = X @ W + b
+        logits -= logits.max(axis=1, keepdims=True)
+        P = np.exp(logits)
+        P /= P.sum(axis=1, keepdims=True)
+        G = (P - Y) / n
+        W -= lr * (X.T @ G + l2 * W)
+        b -= lr * G.sum(axis=0)
+    return W, b
+
+
+def evaluate(clf: IntentClassifier, examples, use_head: bool, threshold: float) -> Dict[str, float]:
+    """Accuracy, fallback rate and per-call latency for one scorer (no lexicon, no Perplexity)."""
+    texts = [t for t, _ in examples]
+    labels = [i for _, i in examples]
+    scorer = clf.head_scores if use_head else clf.prototype_scores
+
+    emb = clf._encode(texts)
+    scores = scorer(emb)
+    best = scores.argmax(axis=1)
+    predicted = [clf.intent_names[i] for i in best]
+    top = scores[np.arange(len(best)), best]
+
+    # per-call latency: one uncached embedding + scoring, as predict() does on a miss
+    timings = []
+    for text in texts:
+        start = time.perf_counter()
+        scorer(clf._encode([text]))
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+
+    return {
+        "accuracy":      round(float(np.mean([p == l for p, l in zip(predicted, labels)])), 4),
+        "threshold":     threshold,
+        "fallback_rate": round(float(np.mean(top < threshold)), 4),
+        "p50_ms":        round(statistics.median(timings), 3),
+        "p95_ms":        round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and benchmark the intent head")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("train", "bench"):
+        p = sub.add_parser(name)
+        p.add_argument("--examples", action="append", help="labelled JSONL (repeatable)")
+        p.add_argument("--samples", help="samples.json to mine weak labels from")
+        p.add_argument("--holdout", type=float, default=0.2, help="share held out for evaluation")
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--proto-threshold", type=float, default=0.5,
+                       help="fallback below this max cosine similarity (prototypes)")
+        p.add_argument("--head-threshold", type=float,
+                       help="fallback below this softmax probability (head); "
+                            "default 0.5 for train, the artifact's value for bench")
+        p.add_argument("--head", default=DEFAULT_HEAD_PATH, help="head artifact to write / read")
+    train_p = sub.choices["train"]
+    train_p.add_argument("--epochs", type=int, default=500)
+    train_p.add_argument("--lr", type=float, default=1.0)
+    train_p.add_argument("--l2", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    examples = load_examples(args.examples or [DEFAULT_EXAMPLES])
+    train, test = split(examples, args.holdout, args.seed)
+    if args.samples:
+        mined = mine_samples(args.samples)
+        examples += mined
+        train += mined
+
+    # head_path="" keeps any existing artifact out of the prototype baseline
+    clf = IntentClassifier(threshold=args.proto_threshold, cache_size=0, head_path="")
+    unknown = {i for _, i in examples} - set(clf.intent_names)
+    if unknown:
+        parser.error(f"unknown intents in examples: {sorted(unknown)}")
+
+    if args.command == "train":
+        X = clf._encode([t for t, _ in train])
+        y = np.array([clf.intent_names.index(i) for _, i in train])
+        W, b = fit_head(X, y, len(clf.intent_names), args.epochs, args.lr, args.l2)
+        if args.head_threshold is None:
+            args.head_threshold = 0.5
+        np.savez_compressed(args.head, W=W, b=b, intents=np.array(clf.intent_names),
+                            threshold=np.float32(args.head_threshold))
+        print(f"Trained on {len(train)} examples; wrote {args.head} ({os.path.getsize(args.head)} bytes)")
+        clf.head = (W, b)
+        clf.head_threshold = args.head_threshold
+    else:
+        clf.load_head(args.head)
+        if clf.head is None:
+            parser.error(f"no usable head at {args.head}; run 'train' first")
+        if args.head_threshold is not None:
+            clf.head_threshold = args.head_threshold
+
+    eval_set = test or train
+    report = {
+        "examples": {"train": len(train), "eval": len(eval_set)},
+        "prototypes": evaluate(clf, eval_set, use_head=False, threshold=clf.threshold),
+        "head": evaluate(clf, eval_set, use_head=True, threshold=clf.head_threshold),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+# common/metrics.py
+#
+# Prometheus text-format metrics without a client library, shared by the
+# three services: counters and histograms updated in place, plus values
+# read from existing stats() methods at scrape time. init_app() adds
+# per-route request latency and GET /metrics to a Flask app; the chat
+# service's ASGI app does the same itself, and chat_metrics.py adds the
+# chat pipeline's counters.
+#
+# Every finished tracing span is also observed into span_duration_seconds,
+# so per-intent handler latency (span="intent:product_search"), FAISS search
+# ("retriever.faiss"), CrossEncoder reranking ("retriever.rerank") and each
+# order query ("query.get_latest_orders") come from the same
+# instrumentation as the traces.
+#
+# Metrics are kept per process. With several gunicorn workers, set
+# METRICS_DIR to a directory they share: each process then writes its values
+# to <METRICS_DIR>/<pid>.json (every METRICS_FLUSH_SECONDS, and when it
+# answers a scrape), and /metrics merges the files, so any worker returns the
+# same totals. Counters and histograms are summed, including those of workers
+# that have exited; collected values (cache sizes, process RSS and CPU) are
+# reported per live worker with a pid label. The directory should be emptied
+# before the server starts.
+
+import os
+import json
+import glob
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Sequence, Tuple
+
+from common import tracing
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; fine enough at the low end for sub-millisecond routing stages
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: Dict[str, "_Metric"] = {}
+_registry_lock = threading.Lock()
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 1))
+_IMPORT_PID = os.getpid()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        # registering a name again replaces the earlier metric
+        with _registry_lock:
+            _registry[name] = self
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def values(self) -> list:
+        """This process's (label values, value) pairs, sorted."""
+        raise NotImplementedError
+
+    def merge(self, into: Dict[Tuple, object], key: Tuple, value):
+        """Adds another worker's value for one label set into a merged dict."""
+        into[key] = into.get(key, 0) + value
+
+    def samples(self, values=None, label_names=None) -> Iterable[str]:
+        label_names = self.label_names if label_names is None else label_names
+        for key, value in self.values() if values is None else values:
+            yield f"{self.name}{_labels(label_names, key)} {_number(value)}"
+
+    def render(self, values=None, label_names=None) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples(values, label_names))
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, per label set."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if METRICS_DIR and _writer_pid != os.getpid():
+            _start_writer()
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [per-bucket counts (last one is +Inf), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        if METRICS_DIR and _writer_pid != os.getpid():
+            _start_writer()
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][idx] += 1
+            entry[1] += value
+
+    def values(self):
+        with self._lock:
+            return sorted((key, [list(counts), total]) for key, (counts, total) in self._values.items())
+
+    def merge(self, into, key, value):
+        counts, total = value
+        entry = into.get(key)
+        if entry is None:
+            into[key] = [list(counts), total]
+        else:
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+
+    def samples(self, values=None, label_names=None):
+        label_names = self.label_names if label_names is None else label_names
+        for key, (counts, total) in self.values() if values is None else values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(label_names, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(label_names, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(label_names, key)} {cumulative}"
+
+
+class Collected(_Metric):
+    """
+    Values read at scrape time from a callback returning (label values, value)
+    pairs, for counters and gauges the code already keeps (cache stats,
+    HTTP pool counters, process memory).
+    """
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], Iterable[Tuple[Sequence, float]]],
+                 labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self.fn = fn
+
+    def values(self):
+        try:
+            return [(tuple(key), value) for key, value in self.fn()]
+        except Exception:
+            return []
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    if not METRICS_DIR:
+        return "\n".join(m.render() for m in metrics) + "\n"
+    merged = _merge_workers()
+    out = []
+    for m in metrics:
+        values = sorted(merged.get(m.name, {}).items())
+        if isinstance(m, Collected):
+            out.append(m.render(values, m.label_names + ("pid",)))
+        else:
+            out.append(m.render(values))
+    return "\n".join(out) + "\n"
+
+
+# ─── Workers ──────────────────────────────────────────────────────────────────
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def _start_writer():
+    """
+    Starts this process's snapshot writer. Started lazily (and again after a
+    fork), so each gunicorn worker gets its own; values inherited from the
+    parent are dropped first, since the parent reports them itself.
+    """
+    global _writer_pid
+    with _writer_lock:
+        if _writer_pid == os.getpid():
+            return
+        if _writer_pid is not None or os.getpid() != _IMPORT_PID:
+            with _registry_lock:
+                inherited = list(_registry.values())
+            for m in inherited:
+                m._lock = threading.Lock()
+                if hasattr(m, "_values"):
+                    m._values = {}
+        _writer_pid = os.getpid()
+        threading.Thread(target=_write_periodically, name="metrics-writer", daemon=True).start()
+
+
+def _write_periodically():
+    pid = os.getpid()
+    while _writer_pid == pid:
+        time.sleep(FLUSH_SECONDS)
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+
+def write_snapshot():
+    """Writes this process's values to <METRICS_DIR>/<pid>.json, atomically."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    snapshot = {"pid": os.getpid(), "metrics": {m.name: m.values() for m in metrics}}
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with open(path + ".partial", "w") as f:
+        json.dump(snapshot, f)
+    os.replace(path + ".partial", path)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge_workers() -> Dict[str, Dict[Tuple, object]]:
+    """Every worker's snapshot merged per metric: {name: {label values: value}}."""
+    if _writer_pid != os.getpid():
+        _start_writer()
+    write_snapshot()
+    with _registry_lock:
+        registry = dict(_registry)
+    merged: Dict[str, Dict[Tuple, object]] = {}
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        pid = snapshot["pid"]
+        alive = pid == os.getpid() or _alive(pid)
+        for name, values in snapshot["metrics"].items():
+            metric = registry.get(name)
+            if metric is None:
+                continue
+            into = merged.setdefault(name, {})
+            for key, value in values:
+                if isinstance(metric, Collected):
+                    if alive:
+                        into[tuple(key) + (pid,)] = value
+                else:
+                    metric.merge(into, tuple(key), value)
+    return merged
+
+
+# ─── Process ──────────────────────────────────────────────────────────────────
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_START_TIME = time.time()
+
+
+def resident_memory_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        import resource  # peak RSS, where /proc is unavailable
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+Collected("process_resident_memory_bytes", "Resident memory size in bytes.", "gauge",
+          lambda: [((), resident_memory_bytes())])
+Collected("process_cpu_seconds_total", "User and system CPU time spent in seconds.", "counter",
+          lambda: [((), round(sum(os.times()[:2]), 3))])
+Collected("process_start_time_seconds", "Start time of the process since the epoch in seconds.", "gauge",
+          lambda: [((), round(_START_TIME, 3))])
+
+# ─── Requests and spans ───────────────────────────────────────────────────────
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency by route.",
+                            ["method", "route", "status"])
+SPAN_SECONDS = Histogram("span_duration_seconds", "Duration of traced stages by span name.", ["span"])
+
+tracing.observe(lambda name, seconds: SPAN_SECONDS.observe(seconds, span=name))
+
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    REQUEST_SECONDS.observe(seconds, method=method, route=route, status=status)
+
+
+def init_app(app):
+    """Times every request by route and serves GET /metrics."""
+    # imported here: asgi_app.py uses this module without Flask
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_latency(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def prometheus_metrics():
+        """
+        Prometheus metrics.
+        ---
+        responses:
+          200:
+            description: Request and per-span latency histograms, service counters and process RSS.
+        """
+        return Response(render(), mimetype=CONTENT_TYPE)
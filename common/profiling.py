@@ -0,0 +1,361 @@
+# common/profiling.py
+#
+# On-demand profiling of a live process, off unless PROFILING_ENABLED=1.
+# init_app() adds the /debug/profile endpoints to a Flask app; the chat
+# service's ASGI app serves them through handle() and handle_artifact().
+#
+#   cpu     wall-clock stack sampling of every thread (sys._current_frames)
+#           for N seconds. Collapsed stacks ("folded", for flamegraph.pl or
+#           speedscope) or a text table of the hottest functions ("top").
+#   memory  tracemalloc for N seconds. The allocations that grew in that
+#           window ("top"), or the raw snapshot ("snapshot", read it with
+#           tracemalloc.Snapshot.load).
+#
+# Neither needs extra packages, and nothing runs until a profile is
+# requested: the sampler is a thread that exists only while a CPU profile
+# runs, and tracemalloc is stopped again afterwards (unless it was already
+# on, e.g. via PYTHONTRACEMALLOC). Only one profile runs per process at a
+# time, durations are capped at PROFILING_MAX_SECONDS, and when
+# PROFILING_TOKEN is set requests must send it in X-Profiling-Token.
+#
+# A profile can also run in the background and be written to PROFILING_DIR.
+# This is for a single-threaded worker that cannot serve traffic while it
+# is busy answering the profile request. The artifact is then fetched by
+# name, from any worker on the host.
+
+import os
+import re
+import sys
+import hmac
+import time
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple, Union
+
+ENABLED = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes", "on")
+TOKEN = os.getenv("PROFILING_TOKEN", "")
+TOKEN_HEADER = "X-Profiling-Token"
+MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", 60))
+ARTIFACT_DIR = os.getenv("PROFILING_DIR", os.path.join(tempfile.gettempdir(), "profiles"))
+
+KINDS = {"cpu": ("folded", "top"), "memory": ("top", "snapshot")}
+EXTENSIONS = {"folded": "folded", "top": "txt", "snapshot": "tracemalloc"}
+ARTIFACT_RE = re.compile(r"^[\w.-]+$")
+
+# frames a thread sits in while it has nothing to do; left out of CPU
+# profiles unless idle=1 is passed
+IDLE_FRAMES = {
+    ("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"),
+    ("socket.py", "accept"), ("thread.py", "_worker"), ("socketserver.py", "serve_forever"),
+}
+
+_busy = threading.Lock()
+
+
+class ProfileBusy(Exception):
+    """Another profile is already running in this process."""
+
+
+class Artifact(NamedTuple):
+    filename: str
+    mimetype: str
+    body: bytes
+
+
+def authorized(headers: Mapping[str, str]) -> bool:
+    """True if profiling is on and the request carries the token (when one is set)."""
+    if not ENABLED:
+        return False
+    return not TOKEN or hmac.compare_digest(headers.get(TOKEN_HEADER, ""), TOKEN)
+
+
+def options(kind: str, args: Mapping[str, str]) -> Dict:
+    """Validated profile options from query arguments; raises ValueError."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown profile '{kind}', expected one of {sorted(KINDS)}")
+    fmt = args.get("format") or KINDS[kind][0]
+    if fmt not in KINDS[kind]:
+        raise ValueError(f"Invalid format '{fmt}' for {kind}, expected one of {list(KINDS[kind])}")
+    seconds = float(args.get("seconds", 10))
+    if not 0 < seconds <= MAX_SECONDS:
+        raise ValueError(f"seconds must be in (0, {MAX_SECONDS:g}]")
+    opts = {"kind": kind, "format": fmt, "seconds": seconds, "limit": int(args.get("limit", 40))}
+    if kind == "cpu":
+        opts["interval"] = min(max(float(args.get("interval", 0.005)), 0.001), 1.0)
+        opts["idle"] = args.get("idle", "0").lower() in ("1", "true", "yes")
+    else:
+        opts["frames"] = min(max(int(args.get("frames", 10)), 1), 100)
+        opts["group"] = "traceback" if args.get("group") == "traceback" else "lineno"
+    return opts
+
+
+# ─── CPU ──────────────────────────────────────────────────────────────────────
+def _short(path: str) -> str:
+    """A module path relative to its sys.path entry, e.g. faiss/__init__.py."""
+    for root in sorted((p for p in sys.path if p), key=len, reverse=True):
+        if path.startswith(root.rstrip(os.sep) + os.sep):
+            return path[len(root.rstrip(os.sep)) + 1:]
+    return path
+
+
+def sample_cpu(seconds: float, interval: float, idle: bool = False) -> Tuple[Counter, int]:
+    """
+    Samples every other thread's stack each `interval` seconds.
+
+    Returns:
+        Tuple[Counter, int]: Collapsed stacks ("thread;outer;...;leaf") with
+        their sample counts, and the number of sampling rounds.
+    """
+    me = threading.get_ident()
+    stacks: Counter = Counter()
+    labels: Dict = {}
+    rounds = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            leaf = frame.f_code
+            if not idle and (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = f"{code.co_name} ({_short(code.co_filename)}:{code.co_firstlineno})"
+                stack.append(label)
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(stack))] += 1
+        rounds += 1
+        time.sleep(interval)
+    return stacks, rounds
+
+
+def folded(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def top_functions(stacks: Counter, rounds: int, interval: float, limit: int) -> str:
+    """The functions with the most samples, by self time (leaf) and total time (anywhere on the stack)."""
+    own: Counter = Counter()
+    total: Counter = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")[1:]
+        if not frames:
+            continue
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    samples = sum(stacks.values()) or 1
+    lines = [f"{samples} samples over {rounds} rounds every {interval * 1000:g} ms", "",
+             f"{'self%':>7} {'total%':>7}  function"]
+    ranked = sorted(total, key=lambda f: (own[f], total[f]), reverse=True)[:limit]
+    for frame in ranked:
+        lines.append(f"{own[frame] * 100 / samples:>7.1f} {total[frame] * 100 / samples:>7.1f}  {frame}")
+    return "\n".join(lines) + "\n"
+
+
+# ─── Memory ───────────────────────────────────────────────────────────────────
+def trace_allocations(seconds: float, frames: int) -> Tuple[tracemalloc.Snapshot, tracemalloc.Snapshot]:
+    """Snapshots taken `seconds` apart, with tracemalloc on in between."""
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(frames)
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    return before.filter_traces(ignore), after.filter_traces(ignore)
+
+
+def allocation_report(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, group: str, limit: int) -> str:
+    stats = after.compare_to(before, group)
+    grown = sum(s.size_diff for s in stats)
+    lines = [f"{grown / 1024:+.1f} KiB in {sum(s.count_diff for s in stats):+d} blocks "
+             f"over the window, top {limit} by growth", ""]
+    for stat in stats[:limit]:
+        if group == "traceback":
+            lines.append(f"{stat.size_diff / 1024:+.1f} KiB, {stat.count_diff:+d} blocks")
+            lines.extend(f"    {line}" for line in stat.traceback.format())
+        else:
+            lines.append(str(stat))
+    return "\n".join(lines) + "\n"
+
+
+# ─── Capture ──────────────────────────────────────────────────────────────────
+def _filename(service: str, opts: Dict) -> str:
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    return f"{service}-{opts['kind']}-{os.getpid()}-{stamp}.{EXTENSIONS[opts['format']]}"
+
+
+def _run(filename: str, opts: Dict) -> Artifact:
+    if opts["kind"] == "cpu":
+        stacks, rounds = sample_cpu(opts["seconds"], opts["interval"], opts["idle"])
+        text = folded(stacks) if opts["format"] == "folded" else \
+            top_functions(stacks, rounds, opts["interval"], opts["limit"])
+        return Artifact(filename, "text/plain; charset=utf-8", text.encode())
+
+    before, after = trace_allocations(opts["seconds"], opts["frames"])
+    if opts["format"] == "snapshot":
+        with tempfile.NamedTemporaryFile(suffix=".tracemalloc") as f:
+            after.dump(f.name)
+            return Artifact(filename, "application/octet-stream", f.read())
+    text = allocation_report(before, after, opts["group"], opts["limit"])
+    return Artifact(filename, "text/plain; charset=utf-8", text.encode())
+
+
+def capture(service: str, opts: Dict) -> Artifact:
+    """Runs a profile in the calling thread (blocking for its duration)."""
+    if not _busy.acquire(blocking=False):
+        raise ProfileBusy("A profile is already running in this process")
+    try:
+        return _run(_filename(service, opts), opts)
+    finally:
+        _busy.release()
+
+
+def capture_in_background(service: str, opts: Dict) -> str:
+    """Starts a profile on a thread, saved under ARTIFACT_DIR when done; returns its file name."""
+    if not _busy.acquire(blocking=False):
+        raise ProfileBusy("A profile is already running in this process")
+    filename = _filename(service, opts)
+
+    def run():
+        try:
+            artifact = _run(filename, opts)
+            os.makedirs(ARTIFACT_DIR, exist_ok=True)
+            partial = os.path.join(ARTIFACT_DIR, f".{filename}.part")
+            with open(partial, "wb") as f:
+                f.write(artifact.body)
+            os.replace(partial, os.path.join(ARTIFACT_DIR, filename))
+        finally:
+            _busy.release()
+
+    threading.Thread(target=run, name="profiler", daemon=True).start()
+    return filename
+
+
+def read_artifact(name: str) -> Optional[bytes]:
+    """A finished background artifact, or None if it does not exist (yet)."""
+    if not ARTIFACT_RE.match(name) or name.startswith("."):
+        return None
+    try:
+        with open(os.path.join(ARTIFACT_DIR, name), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def handle(service: str, kind: str, args: Mapping[str, str],
+           headers: Mapping[str, str]) -> Tuple[int, Union[Dict, Artifact]]:
+    """
+    Serves a profile request for either web framework.
+
+    Returns:
+        Tuple[int, Union[Dict, Artifact]]: The status and an artifact to send
+        as a download, or a JSON payload. The JSON is an error, or for
+        background=1 the name of the artifact to fetch later. Disabled or
+        unauthorized requests get 404, as if the endpoint did not exist.
+    """
+    if not authorized(headers):
+        return 404, {"error": "Not found"}
+    try:
+        opts = options(kind, args)
+        if args.get("background", "0").lower() in ("1", "true", "yes"):
+            name = capture_in_background(service, opts)
+            return 202, {"artifact": name, "pid": os.getpid(), "ready_in_seconds": opts["seconds"],
+                         "url": f"/debug/profile/artifacts/{name}"}
+        return 200, capture(service, opts)
+    except ValueError as e:
+        return 400, {"error": str(e)}
+    except ProfileBusy as e:
+        return 409, {"error": str(e)}
+
+
+def handle_artifact(name: str, headers: Mapping[str, str]) -> Tuple[int, Union[Dict, Artifact]]:
+    """Serves a finished background artifact."""
+    if not authorized(headers):
+        return 404, {"error": "Not found"}
+    body = read_artifact(name)
+    if body is None:
+        return 404, {"error": f"No artifact '{name}' (yet)"}
+    mimetype = "application/octet-stream" if name.endswith(".tracemalloc") else "text/plain; charset=utf-8"
+    return 200, Artifact(name, mimetype, body)
+
+
+def download_headers(artifact: Artifact) -> Dict[str, str]:
+    return {"Content-Disposition": f'attachment; filename="{artifact.filename}"'}
+
+
+# ─── Flask ────────────────────────────────────────────────────────────────────
+def init_app(app, service: str):
+    """Adds GET /debug/profile/<kind> and GET /debug/profile/artifacts/<name>."""
+    from flask import Response, jsonify, request
+
+    def respond(status, result):
+        if isinstance(result, Artifact):
+            return Response(result.body, status=status, mimetype=result.mimetype,
+                            headers=download_headers(result))
+        return jsonify(result), status
+
+    @app.route("/debug/profile/<kind>", methods=["GET"])
+    def profile(kind):
+        """
+        CPU or allocation profile of this process (needs PROFILING_ENABLED=1).
+        ---
+        parameters:
+          - name: kind
+            in: path
+            type: string
+            required: true
+            description: cpu or memory.
+          - name: seconds
+            in: query
+            type: number
+            description: How long to profile (default 10, at most PROFILING_MAX_SECONDS).
+          - name: format
+            in: query
+            type: string
+            description: folded or top for cpu; top or snapshot for memory.
+          - name: background
+            in: query
+            type: boolean
+            description: Return at once and save the artifact under PROFILING_DIR.
+        responses:
+          200:
+            description: The profile, as a file download.
+          202:
+            description: Background profile started; the artifact's name and URL.
+          404:
+            description: Profiling is disabled.
+          409:
+            description: A profile is already running in this process.
+        """
+        return respond(*handle(service, kind, request.args, request.headers))
+
+    @app.route("/debug/profile/artifacts/<name>", methods=["GET"])
+    def profile_artifact(name):
+        """
+        A background profile saved under PROFILING_DIR.
+        ---
+        parameters:
+          - name: name
+            in: path
+            type: string
+            required: true
+        responses:
+          200:
+            description: The profile, as a file download.
+          404:
+            description: Not (yet) written, or profiling is disabled.
+        """
+        return respond(*handle_artifact(name, request.headers))
@@ -0,0 +1,253 @@
+# common/tracing.py
+#
+# Request tracing shared by chat_service, product_service and
+# order_service. Each request gets a request ID (taken from an incoming
+# X-Request-ID header or generated) and records timed spans in a context
+# variable, so they follow the request across awaits and into executors.
+#
+# chat_service forwards the ID on its downstream calls (outgoing_headers)
+# and folds the Server-Timing header each downstream returns into its own
+# trace as child spans of the call (record_server_timing). The product and
+# order services trace every request with init_app(), which adopts the
+# caller's ID and reports their stages in that Server-Timing header.
+#
+# Finished traces are written as JSON lines when TRACE_EXPORT is set
+# ("stdout" or a file path), for a log shipper / collector to pick up.
+
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+REQUEST_ID_HEADER = "X-Request-ID"
+SERVER_TIMING_HEADER = "Server-Timing"
+
+_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+_parent: contextvars.ContextVar = contextvars.ContextVar("trace_parent", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+class Trace:
+    """The spans recorded for one request."""
+    def __init__(self, service: str, request_id: Optional[str] = None):
+        self.service = service
+        self.request_id = request_id or new_request_id()
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._token = None
+
+    def add(self, name: str, start: float, duration: Optional[float] = None,
+            parent: Optional[int] = None, **attrs) -> Dict[str, Any]:
+        """
+        Records a span.
+
+        Args:
+            name (str): Stage name.
+            start (float): time.perf_counter() when the stage began.
+            duration (Optional[float]): Seconds spent; None for a span still open.
+            parent (Optional[int]): ID of the enclosing span.
+            **attrs: Extra fields stored with the span.
+
+        Returns:
+            Dict[str, Any]: The span record.
+        """
+        entry = {
+            "name": name,
+            "parent": parent,
+            "start_ms": round((start - self.started) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3) if duration is not None else None,
+            **attrs,
+        }
+        with self._lock:
+            entry["id"] = len(self.spans) + 1
+            self.spans.append(entry)
+        return entry
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        duration = self.duration if self.duration is not None else time.perf_counter() - self.started
+        return {
+            "request_id": self.request_id,
+            "service": self.service,
+            "timestamp": round(self.timestamp, 6),
+            "duration_ms": round(duration * 1000, 3),
+            "spans": spans,
+        }
+
+    def server_timing(self) -> str:
+        """The spans as a Server-Timing header value (names made token-safe)."""
+        with self._lock:
+            spans = list(self.spans)
+        entries = [
+            f"{_token(s['name'])};dur={s['duration_ms']}"
+            for s in spans if s["duration_ms"] is not None and not s.get("remote")
+        ]
+        if self.duration is not None:
+            entries.append(f"total;dur={round(self.duration * 1000, 3)}")
+        return ", ".join(entries)
+
+
+def _token(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-._" else "." for c in name)
+
+
+def current() -> Optional[Trace]:
+    return _trace.get()
+
+
+def start(service: str, request_id: Optional[str] = None) -> Trace:
+    """Begins a trace for the current request (task or thread)."""
+    trace = Trace(service, request_id)
+    trace._token = _trace.set(trace)
+    return trace
+
+
+def finish(trace: Trace):
+    """Ends the trace, detaches it from the context and exports it."""
+    trace.duration = time.perf_counter() - trace.started
+    try:
+        _trace.reset(trace._token)
+    except ValueError:
+        # finished from a different context than it was started in
+        _trace.set(None)
+    _exporter.export(trace)
+
+
+_observers = []
+
+
+def observe(callback):
+    """Registers callback(name, seconds), called for every finished local span (e.g. by metrics)."""
+    _observers.append(callback)
+
+
+def _notify(name: str, seconds: float):
+    for callback in _observers:
+        callback(name, seconds)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Times the enclosed block as a span of the current trace and yields its
+    record (to add attributes to); a no-op outside a traced request. Spans
+    opened inside become its children.
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield {}
+        return
+    started = time.perf_counter()
+    entry = trace.add(name, started, parent=_parent.get(), **attrs)
+    token = _parent.set(entry["id"])
+    try:
+        yield entry
+    finally:
+        _parent.reset(token)
+        elapsed = time.perf_counter() - started
+        entry["duration_ms"] = round(elapsed * 1000, 3)
+        _notify(name, elapsed)
+
+
+def record(name: str, start: float, duration: float, **attrs):
+    """Adds an already-timed stage to the current trace, if any."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, start, duration, parent=_parent.get(), **attrs)
+        _notify(name, duration)
+
+
+def outgoing_headers(headers: Optional[Dict[str, str]] = None) -> Optional[Dict[str, str]]:
+    """Adds the current request ID to headers for a downstream call."""
+    trace = _trace.get()
+    if trace is None:
+        return headers
+    return {**(headers or {}), REQUEST_ID_HEADER: trace.request_id}
+
+
+def record_server_timing(header: Optional[str], start: float, prefix: str):
+    """
+    Folds a downstream Server-Timing header into the current trace as
+    remote spans (their offsets inside the downstream call are unknown,
+    so they are placed at the start of the call).
+    """
+    trace = _trace.get()
+    if trace is None or not header:
+        return
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        dur = None
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    dur = float(value)
+                except ValueError:
+                    pass
+        if name and dur is not None:
+            trace.add(f"{prefix}.{name}", start, dur / 1000, parent=_parent.get(), remote=True)
+
+
+# ─── Export ────────────────────────────────────────────────────────────────────
+class JsonLinesExporter:
+    """Writes each finished trace as one JSON line to stdout or a file."""
+    def __init__(self, target: Optional[str]):
+        self.target = target
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        if not self.target or self.target == "off":
+            return
+        line = json.dumps(trace.to_dict(), separators=(",", ":"))
+        with self._lock:
+            if self.target == "stdout":
+                sys.stdout.write(line + "\n")
+                sys.stdout.flush()
+            else:
+                with open(self.target, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+
+
+_exporter = JsonLinesExporter(os.getenv("TRACE_EXPORT"))
+
+
+def init_app(app, service: str):
+    """
+    Traces every request to the Flask app: adopts the caller's X-Request-ID
+    (or generates one) and returns both it and the recorded spans, as a
+    Server-Timing header, on the response.
+    """
+    # imported here: chat_service's ASGI app uses this module without Flask
+    from flask import g, request
+
+    @app.before_request
+    def _start_trace():
+        g.trace = start(service, request.headers.get(REQUEST_ID_HEADER))
+
+    @app.after_request
+    def _trace_headers(response):
+        trace = g.pop("trace", None)
+        if trace is not None:
+            finish(trace)
+            response.headers[REQUEST_ID_HEADER] = trace.request_id
+            response.headers[SERVER_TIMING_HEADER] = trace.server_timing()
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        # after_request is skipped when a view raises
+        trace = g.pop("trace", None)
+        if trace is not None:
+            finish(trace)
@@ -0,0 +1,143 @@
+# mock_api/load_test.py
+#
+# Load generator for the order API. By default it starts the FastAPI mock API
+# in-process (uvicorn on a free local port) and drives it from a thread pool
+# with keep-alive sessions; pass --url to target any running order service
+# instead (e.g. the Flask one on :8001).
+#
+#   python mock_api/load_test.py --concurrency 16 --duration 20
+#   python mock_api/load_test.py --url http://localhost:8001 --concurrency 8
+
+import os
+import sys
+import time
+import json
+import random
+import socket
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+DEFAULT_CUSTOMERS = [37077, 36086, 35081, 26306, 50454, 41577, 53639, 41066, 39242, 44741]
+
+# (name, path template, relative weight)
+SCENARIOS = [
+    ("customer",          "/data/customer/{customer_id}",                  10),
+    ("priority",          "/data/order-priority/High",                      2),
+    ("category",          "/data/product-category/Fashion",                 1),
+    ("high_profit_top5",  "/data/high-profit-products?limit=5",             4),
+    ("sales_by_category", "/data/total-sales-by-category",                  2),
+    ("profit_by_gender",  "/data/profit-by-gender",                         2),
+    ("shipping_summary",  "/data/shipping-cost-summary",                    2),
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_server():
+    """Runs mock_api in a background uvicorn server; returns (url, customer_ids)."""
+    import uvicorn
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import mock_api
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(mock_api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("mock_api did not start within 30s")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", [int(c) for c in mock_api.engine.customer_ids()]
+
+
+def run(url: str, customers, concurrency: int, duration: float, scenarios=SCENARIOS):
+    names   = [s[0] for s in scenarios]
+    paths   = {s[0]: s[1] for s in scenarios}
+    weights = [s[2] for s in scenarios]
+
+    latencies = defaultdict(list)
+    errors    = defaultdict(int)
+    lock      = threading.Lock()
+    stop_at   = time.perf_counter() + duration
+
+    def worker(seed: int):
+        rng  = random.Random(seed)
+        sess = requests.Session()
+        local_lat, local_err = defaultdict(list), defaultdict(int)
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, weights)[0]
+            path = paths[name].format(customer_id=rng.choice(customers))
+            t0 = time.perf_counter()
+            try:
+                ok = sess.get(url + path, timeout=30).status_code < 500
+            except requests.RequestException:
+                ok = False
+            local_lat[name].append(time.perf_counter() - t0)
+            if not ok:
+                local_err[name] += 1
+        with lock:
+            for k, v in local_lat.items():
+                latencies[k].extend(v)
+            for k, v in local_err.items():
+                errors[k] += v
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    def summarize(samples, n_err):
+        ms = np.array(samples) * 1000
+        return {
+            "requests": len(samples),
+            "errors":   n_err,
+            "rps":      round(len(samples) / elapsed, 1),
+            "p50_ms":   round(float(np.percentile(ms, 50)), 2),
+            "p95_ms":   round(float(np.percentile(ms, 95)), 2),
+            "p99_ms":   round(float(np.percentile(ms, 99)), 2),
+            "max_ms":   round(float(ms.max()), 2),
+        }
+
+    report = {name: summarize(latencies[name], errors[name]) for name in names if latencies[name]}
+    all_samples = [x for v in latencies.values() for x in v]
+    if all_samples:
+        report["TOTAL"] = summarize(all_samples, sum(errors.values()))
+    return report
+
+
+def print_report(report):
+    print(f"{'endpoint':<20}{'reqs':>8}{'errs':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, r in report.items():
+        print(f"{name:<20}{r['requests']:>8}{r['errors']:>6}{r['rps']:>9}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}")
+    print("(latencies in ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the order API")
+    parser.add_argument("--url", help="target an already running service instead of starting mock_api")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    if args.url:
+        url, customers = args.url.rstrip("/"), DEFAULT_CUSTOMERS
+    else:
+        url, customers = start_local_server()
+
+    print(f"Load testing {url} with {args.concurrency} workers for {args.duration:.0f}s")
+    report = run(url, customers, args.concurrency, args.duration)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
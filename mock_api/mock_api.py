@@ -1,7 +1,16 @@
 # mock_api/mock_api.py
 import os
-import pandas as pd
-from fastapi import FastAPI
+import sys
+from typing import Optional
+
+from fastapi import FastAPI, Response
+from fastapi.concurrency import run_in_threadpool
+
+# The columnar order store and query engine live with the order service;
+# share them rather than loading a second private copy of the CSV.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../order_service")))
+from order_store import load_orders
+from order_engine import OrderQueryEngine
 
 # Point at the real CSV (inside Docker/container or local)
 DATASET_PATH = os.environ.get(
@@ -9,70 +18,81 @@ DATASET_PATH = os.environ.get(
     os.path.abspath(os.path.join(os.path.dirname(__file__),
                                  "../data/Order_Data_Dataset.csv"))
 )
-df = pd.read_csv(DATASET_PATH, on_bad_lines="skip")
-df.fillna("", inplace=True)
+engine = OrderQueryEngine(load_orders(DATASET_PATH))
 
 app = FastAPI(
     title="E-Commerce Order Dataset API",
     description="Expose order analytics endpoints for the e-commerce assistant",
 )
 
+# Handlers are async so they never occupy a threadpool slot while idle.
+# Anything that materialises rows (pandas -> dicts) is CPU work and is
+# offloaded with run_in_threadpool so it can't stall the event loop;
+# precomputed aggregates are returned inline.
+
 @app.get("/data")
-def get_all_data():
-    return df.to_dict(orient="records")
+async def get_all_data():
+    return await run_in_threadpool(engine.all_data)
 
 @app.get("/data/customer/{customer_id}")
-def get_customer_data(customer_id: int):
-    filtered = df[df["Customer_Id"] == customer_id]
-    if filtered.empty:
-        return {"error": f"No data found for Customer ID {customer_id}"}
-    return filtered.to_dict(orient="records")
+async def get_customer_data(customer_id: int):
+    return await run_in_threadpool(engine.customer_data, customer_id)
 
 @app.get("/data/product-category/{category}")
-def get_product_category_data(category: str):
-    filtered = df[df["Product_Category"]
-                  .str.contains(category, case=False, na=False)]
-    if filtered.empty:
-        return {"error": f"No data for category '{category}'"}
-    return filtered.to_dict(orient="records")
+async def get_product_category_data(category: str):
+    return await run_in_threadpool(engine.product_category_data, category)
+
+@app.get("/data/customer/{customer_id}/latest")
+async def get_latest_orders(customer_id: int, response: Response, n: int = 1):
+    response.headers["X-Total-Count"] = str(engine.customer_order_count(customer_id))
+    return await run_in_threadpool(engine.latest_orders, customer_id, n)
+
+@app.get("/data/customers")
+async def get_customers_orders(ids: str = "", n: Optional[int] = None):
+    customer_ids = [i for i in ids.split(",") if i.strip()]
+    return await run_in_threadpool(engine.customers_orders, customer_ids, n)
 
 @app.get("/data/order-priority/{priority}")
-def get_orders_by_priority(priority: str):
-    filtered = df[df["Order_Priority"]
-                  .str.contains(priority, case=False, na=False)]
-    if filtered.empty:
-        return {"error": f"No orders with priority '{priority}'"}
-    return filtered.to_dict(orient="records")
+async def get_orders_by_priority(priority: str,
+                                 limit: Optional[int] = None,
+                                 sort: Optional[str] = None):
+    return await run_in_threadpool(engine.orders_by_priority, priority, limit=limit, sort=sort)
+
+@app.get("/data/orders/by-id")
+async def get_orders_by_id(ids: str = ""):
+    order_ids = [i for i in ids.split(",") if i.strip()]
+    return await run_in_threadpool(engine.orders_by_id, order_ids)
+
+@app.get("/data/orders/date-range")
+async def get_orders_in_date_range(start: Optional[str] = None,
+                                   end: Optional[str] = None,
+                                   limit: Optional[int] = None):
+    return await run_in_threadpool(engine.orders_in_date_range, start, end, limit=limit)
+
+@app.get("/data/sales/{period}")
+async def sales_by_period(period: str,
+                          start: Optional[str] = None,
+                          end: Optional[str] = None):
+    return engine.sales_by_period(period, start, end)
 
 @app.get("/data/total-sales-by-category")
-def total_sales_by_category():
-    summary = (
-        df.groupby("Product_Category")["Sales"]
-          .sum()
-          .reset_index()
-    )
-    return summary.to_dict(orient="records")
+async def total_sales_by_category():
+    return engine.total_sales_by_category()
 
 @app.get("/data/high-profit-products")
-def high_profit_products(min_profit: float = 100.0):
-    filtered = df[df["Profit"] > min_profit]
-    if filtered.empty:
-        return {"error": f"No products with profit > {min_profit}"}
-    return filtered.to_dict(orient="records")
+async def high_profit_products(min_profit: float = 100.0,
+                               limit: Optional[int] = None,
+                               sort: str = "desc",
+                               category: Optional[str] = None):
+    return await run_in_threadpool(
+        engine.high_profit_products,
+        min_profit=min_profit, limit=limit, sort=sort, category=category,
+    )
 
 @app.get("/data/shipping-cost-summary")
-def shipping_cost_summary():
-    return {
-        "average_shipping_cost": df["Shipping_Cost"].mean(),
-        "min_shipping_cost": df["Shipping_Cost"].min(),
-        "max_shipping_cost": df["Shipping_Cost"].max()
-    }
+async def shipping_cost_summary():
+    return engine.shipping_cost_summary()
 
 @app.get("/data/profit-by-gender")
-def profit_by_gender():
-    summary = (
-        df.groupby("Gender")["Profit"]
-          .sum()
-          .reset_index()
-    )
-    return summary.to_dict(orient="records")
+async def profit_by_gender():
+    return engine.profit_by_gender()
@@ -2,9 +2,9 @@
 
 import os, sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-if ROOT not in sys.path: sys.path.insert(0, ROOT)
+if ROOT not in sys.path: sys.path.insert(0, ROOT)  # for common/ and mock_api/
 
-from flask import Flask, jsonify, make_response
+from flask import Flask, jsonify, make_response, request
 from flask_restful import Resource, Api
 from flasgger import Swagger
 
@@ -13,22 +13,35 @@ from mock_api_client import (
     get_customer_data,
     get_product_category_data,
     get_orders_by_priority,
+    get_customer_order_count,
+    get_latest_orders,
+    get_customers_orders,
+    get_orders_by_id,
+    get_orders_in_date_range,
+    sales_by_period,
     total_sales_by_category,
     high_profit_products,
     shipping_cost_summary,
     profit_by_gender,
 )
+from common import tracing
+from common import metrics
+from common import profiling
 
 app = Flask(__name__)
 api = Api(app)
 swagger = Swagger(app)
+tracing.init_app(app, "order_service")
+metrics.init_app(app)
+profiling.init_app(app, "order_service")
 
 def _maybe_error(resp):
     # if the client library returned an error dict, wrap it with 400
     if isinstance(resp, dict) and "error" in resp:
         return make_response(jsonify(resp), 400)
     # otherwise it's pure data (list or dict) — jsonify it
-    return jsonify(resp)
+    with tracing.span("serialize"):
+        return jsonify(resp)
 
 class Data(Resource):
     def get(self):
@@ -44,7 +57,44 @@ class ProductCategory(Resource):
 
 class OrderPriority(Resource):
     def get(self, priority):
-        return _maybe_error(get_orders_by_priority(priority))
+        return _maybe_error(get_orders_by_priority(
+            priority,
+            limit=request.args.get("limit", type=int),
+            sort=request.args.get("sort"),
+        ))
+
+class LatestOrders(Resource):
+    def get(self, customer_id):
+        resp = _maybe_error(get_latest_orders(customer_id, request.args.get("n", 1, type=int)))
+        # total number of orders so callers can say "you have N orders"
+        resp.headers["X-Total-Count"] = str(get_customer_order_count(customer_id))
+        return resp
+
+class CustomersOrders(Resource):
+    def get(self):
+        ids = [i for i in request.args.get("ids", "").split(",") if i.strip()]
+        return _maybe_error(get_customers_orders(ids, request.args.get("n", type=int)))
+
+class OrdersById(Resource):
+    def get(self):
+        ids = [i for i in request.args.get("ids", "").split(",") if i.strip()]
+        return _maybe_error(get_orders_by_id(ids))
+
+class OrdersByDateRange(Resource):
+    def get(self):
+        return _maybe_error(get_orders_in_date_range(
+            start=request.args.get("start"),
+            end=request.args.get("end"),
+            limit=request.args.get("limit", type=int),
+        ))
+
+class SalesByPeriod(Resource):
+    def get(self, period):
+        return _maybe_error(sales_by_period(
+            period,
+            start=request.args.get("start"),
+            end=request.args.get("end"),
+        ))
 
 class TotalSalesByCategory(Resource):
     def get(self):
@@ -52,7 +102,12 @@ class TotalSalesByCategory(Resource):
 
 class HighProfitProducts(Resource):
     def get(self):
-        return _maybe_error(high_profit_products())
+        return _maybe_error(high_profit_products(
+            min_profit=request.args.get("min_profit", 100.0, type=float),
+            limit=request.args.get("limit", type=int),
+            sort=request.args.get("sort", "desc"),
+            category=request.args.get("category"),
+        ))
 
 class ShippingCostSummary(Resource):
     def get(self):
@@ -65,7 +120,12 @@ class ProfitByGender(Resource):
 api.add_resource(Data,                   "/data")
 api.add_resource(Customer,               "/data/customer/<int:customer_id>")
 api.add_resource(ProductCategory,        "/data/product-category/<string:category>")
+api.add_resource(LatestOrders,           "/data/customer/<int:customer_id>/latest")
+api.add_resource(CustomersOrders,        "/data/customers")
 api.add_resource(OrderPriority,          "/data/order-priority/<string:priority>")
+api.add_resource(OrdersById,             "/data/orders/by-id")
+api.add_resource(OrdersByDateRange,      "/data/orders/date-range")
+api.add_resource(SalesByPeriod,          "/data/sales/<string:period>")
 api.add_resource(TotalSalesByCategory,   "/data/total-sales-by-category")
 api.add_resource(HighProfitProducts,     "/data/high-profit-products")
 api.add_resource(ShippingCostSummary,    "/data/shipping-cost-summary")
@@ -1,61 +1,80 @@
 # mock_api_client.py
 
 import os
-import pandas as pd
+import functools
 
-# Load dataset once
+from order_store import load_orders
+from order_engine import OrderQueryEngine
+from common import tracing
+
+# Map the columnar order store once (built from the CSV on first use);
+# the arrays are read-only and shared with every other worker. All queries
+# go through the same indexed engine the mock API uses.
 DATASET_PATH = os.environ.get("DATA_PATH", "/data/Order_Data_Dataset.csv")
-_df = pd.read_csv(DATASET_PATH)
-_df.fillna("", inplace=True)
+engine = OrderQueryEngine(load_orders(DATASET_PATH))
 
-# coerce numeric columns
-for col in ["Sales", "Profit", "Shipping_Cost"]:
-    _df[col] = pd.to_numeric(_df[col], errors="coerce").fillna(0.0)
+def _traced(fn):
+    # each query is a "query.<name>" span of the request's trace
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with tracing.span(f"query.{fn.__name__}"):
+            return fn(*args, **kwargs)
+    return wrapper
 
+@_traced
 def get_all_data():
-    return _df.to_dict(orient="records")
+    return engine.all_data()
 
+@_traced
 def get_customer_data(customer_id: int):
-    filtered = _df[_df["Customer_Id"] == customer_id]
-    if filtered.empty:
-        return {"error": f"No data found for Customer ID {customer_id}"}
-    return filtered.to_dict(orient="records")
+    return engine.customer_data(customer_id)
 
+@_traced
 def get_product_category_data(category: str):
-    filt = _df[_df["Product_Category"].str.contains(category, case=False, na=False)]
-    if filt.empty:
-        return {"error": f"No data found for Product Category '{category}'"}
-    return filt.to_dict(orient="records")
+    return engine.product_category_data(category)
+
+@_traced
+def get_orders_by_priority(priority: str, limit: int = None, sort: str = None):
+    return engine.orders_by_priority(priority, limit=limit, sort=sort)
+
+@_traced
+def get_customer_order_count(customer_id: int):
+    return engine.customer_order_count(customer_id)
+
+@_traced
+def get_latest_orders(customer_id: int, n: int = 1):
+    return engine.latest_orders(customer_id, n)
 
-def get_orders_by_priority(priority: str):
-    filt = _df[_df["Order_Priority"].str.contains(priority, case=False, na=False)]
-    if filt.empty:
-        return {"error": f"No data found for Order Priority '{priority}'"}
-    return filt.to_dict(orient="records")
+@_traced
+def get_customers_orders(customer_ids, n: int = None):
+    return engine.customers_orders(customer_ids, n)
 
+@_traced
+def get_orders_by_id(order_ids):
+    return engine.orders_by_id(order_ids)
+
+@_traced
+def get_orders_in_date_range(start: str = None, end: str = None, limit: int = None):
+    return engine.orders_in_date_range(start, end, limit=limit)
+
+@_traced
+def sales_by_period(period: str, start: str = None, end: str = None):
+    return engine.sales_by_period(period, start, end)
+
+@_traced
 def total_sales_by_category():
-    summary = (
-        _df.groupby("Product_Category", as_index=False)["Sales"]
-           .sum()
-    )
-    return summary.to_dict(orient="records")
-
-def high_profit_products(min_profit: float = 100.0):
-    filt = _df[_df["Profit"] > min_profit]
-    if filt.empty:
-        return {"error": f"No products found with profit > {min_profit}"}
-    return filt.to_dict(orient="records")
+    return engine.total_sales_by_category()
+
+@_traced
+def high_profit_products(min_profit: float = 100.0, limit: int = None,
+                         sort: str = "desc", category: str = None):
+    return engine.high_profit_products(min_profit=min_profit, limit=limit,
+                                       sort=sort, category=category)
 
+@_traced
 def shipping_cost_summary():
-    return {
-        "average_shipping_cost": _df["Shipping_Cost"].mean(),
-        "min_shipping_cost":     _df["Shipping_Cost"].min(),
-        "max_shipping_cost":     _df["Shipping_Cost"].max(),
-    }
+    return engine.shipping_cost_summary()
 
+@_traced
 def profit_by_gender():
-    summary = (
-        _df.groupby("Gender", as_index=False)["Profit"]
-           .sum()
-    )
-    return summary.to_dict(orient="records")
+    return engine.profit_by_gender()
@@ -0,0 +1,312 @@
+# order_service/order_engine.py
+#
+# Indexed query engine over the order dataset, shared by the Flask order
+# service (through mock_api_client) and the FastAPI mock API.
+#
+# All indexes are built once from the read-only columnar store:
+#   - customer index: row positions grouped by Customer_Id (newest order
+#     first), looked up with a binary search over the distinct ids
+#   - date index: row positions sorted by Order_Date, so date ranges are two
+#     binary searches plus a slice
+#   - postings per category / priority code, so substring filters only touch
+#     the dictionary and then the matching rows
+#   - ascending profit index for threshold + top-N queries
+#   - precomputed aggregates and daily / monthly sales buckets (the data
+#     never changes after load)
+
+import numpy as np
+import pandas as pd
+
+from order_store import records
+
+
+PERIODS = {"daily": "D", "monthly": "M"}
+
+# every order record carries its row position under this name
+ID_COLUMN = "Order_Id"
+
+
+def _grouped_rows(keys: np.ndarray, rows: np.ndarray = None):
+    """
+    Returns (distinct_keys, offsets, rows) where rows[offsets[i]:offsets[i+1]]
+    are the positions holding distinct_keys[i]. Within a key, rows keep the
+    order of the given permutation (original row order by default).
+    """
+    if rows is None:
+        rows = np.arange(len(keys))
+    rows = rows[np.argsort(keys[rows], kind="stable")]
+    distinct, starts = np.unique(keys[rows], return_index=True)
+    offsets = np.append(starts, len(rows))
+    return distinct, offsets, rows
+
+
+def _parse_day(value):
+    """YYYY-MM-DD -> numpy datetime64[ns]; None passes through."""
+    if value in (None, ""):
+        return None
+    return np.datetime64(pd.Timestamp(value).normalize().to_datetime64(), "ns")
+
+
+class _PeriodBuckets:
+    """Sales / profit / order counts per calendar period, sorted by period."""
+
+    def __init__(self, df: pd.DataFrame, freq: str):
+        dates  = df["Order_Date"]
+        valid  = dates.notna().to_numpy()
+        period = dates[valid].dt.to_period(freq)
+        grouped = (
+            df.loc[valid, ["Sales", "Profit"]]
+              .astype("float64")
+              .groupby(period.to_numpy())
+              .agg(orders=("Sales", "size"), Sales=("Sales", "sum"), Profit=("Profit", "sum"))
+              .sort_index()
+        )
+        self.starts = grouped.index.to_timestamp().to_numpy().astype("datetime64[ns]")
+        self.labels = [str(p) for p in grouped.index]
+        self.orders = grouped["orders"].to_numpy()
+        self.sales  = grouped["Sales"].round(2).to_numpy()
+        self.profit = grouped["Profit"].round(2).to_numpy()
+
+    def between(self, start=None, end=None) -> list:
+        lo = 0 if start is None else np.searchsorted(self.starts, start, side="left")
+        hi = len(self.starts) if end is None else np.searchsorted(self.starts, end, side="right")
+        return [
+            {"period": self.labels[i], "orders": int(self.orders[i]),
+             "Sales": float(self.sales[i]), "Profit": float(self.profit[i])}
+            for i in range(lo, hi)
+        ]
+
+
+class _Postings:
+    """Row positions per dictionary code of a categorical column."""
+
+    def __init__(self, column: pd.Series):
+        self.categories = [str(c) for c in column.cat.categories]
+        codes = column.cat.codes.to_numpy()
+        self.codes, self.offsets, self.rows = _grouped_rows(codes)
+
+    def matching(self, needle: str) -> np.ndarray:
+        """Rows whose value contains needle (case-insensitive), in row order."""
+        needle = needle.lower()
+        wanted = {i for i, c in enumerate(self.categories) if needle in c.lower()}
+        parts = [
+            self.rows[self.offsets[i]:self.offsets[i + 1]]
+            for i, code in enumerate(self.codes) if code in wanted
+        ]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+
+class OrderQueryEngine:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+
+        # NaT sorts last, so valid dates occupy the first _dated_rows slots
+        dates = df["Order_Date"].to_numpy()
+        self._date_order  = np.argsort(dates, kind="stable")
+        self._date_sorted = dates[self._date_order]
+        self._dated_rows  = int((~np.isnat(dates)).sum())
+
+        newest = np.concatenate([self._date_order[:self._dated_rows][::-1],
+                                 self._date_order[self._dated_rows:]])
+        self._recency_rank = np.empty(len(newest), dtype=np.int64)
+        self._recency_rank[newest] = np.arange(len(newest))
+
+        self._customer_ids, self._customer_offsets, self._customer_rows = \
+            _grouped_rows(df["Customer_Id"].to_numpy(), newest)
+        self._category = _Postings(df["Product_Category"])
+        self._priority = _Postings(df["Order_Priority"])
+
+        profit = df["Profit"].to_numpy()
+        self._profit_order  = np.argsort(profit, kind="stable")
+        self._profit_sorted = profit[self._profit_order]
+
+        # totals are summed in float64: float32 holds only ~7 digits, too few for cents on large sums
+        self._sales_by_category = records(
+            df[["Product_Category", "Sales"]].astype({"Sales": "float64"})
+              .groupby("Product_Category", as_index=False, observed=True)["Sales"].sum().round(2)
+        )
+        self._profit_by_gender = records(
+            df[["Gender", "Profit"]].astype({"Profit": "float64"})
+              .groupby("Gender", as_index=False, observed=True)["Profit"].sum().round(2)
+        )
+        self._buckets = {name: _PeriodBuckets(df, freq) for name, freq in PERIODS.items()}
+
+        shipping = df["Shipping_Cost"]
+        self._shipping_summary = {
+            "average_shipping_cost": round(float(shipping.mean()), 2),
+            "min_shipping_cost":     round(float(shipping.min()), 2),
+            "max_shipping_cost":     round(float(shipping.max()), 2),
+        }
+
+    def _rows(self, rows: np.ndarray) -> list:
+        return records(self.df, rows, id_column=ID_COLUMN)
+
+    def _customer_slice(self, customer_id: int):
+        i = np.searchsorted(self._customer_ids, customer_id)
+        if i == len(self._customer_ids) or self._customer_ids[i] != customer_id:
+            return None
+        return self._customer_rows[self._customer_offsets[i]:self._customer_offsets[i + 1]]
+
+    def customer_ids(self) -> np.ndarray:
+        return self._customer_ids
+
+    def all_data(self):
+        return records(self.df, id_column=ID_COLUMN)
+
+    def orders_by_id(self, order_ids):
+        """
+        Orders by Order_Id, in the order given. IDs are row positions in the
+        order store, so they stay valid for as long as the dataset does.
+        """
+        try:
+            rows = np.asarray([int(i) for i in order_ids], dtype=np.int64)
+        except (TypeError, ValueError):
+            return {"error": f"Invalid order IDs {order_ids!r}, must be integers"}
+        if len(rows) == 0:
+            return {"error": "No order IDs given"}
+        bad = rows[(rows < 0) | (rows >= len(self.df))]
+        if len(bad):
+            return {"error": f"Unknown order IDs {bad.tolist()}"}
+        return self._rows(rows)
+
+    def customer_data(self, customer_id: int):
+        """All orders of a customer, newest first."""
+        rows = self._customer_slice(customer_id)
+        if rows is None:
+            return {"error": f"No data found for Customer ID {customer_id}"}
+        return self._rows(rows)
+
+    def customer_order_count(self, customer_id: int) -> int:
+        rows = self._customer_slice(customer_id)
+        return 0 if rows is None else len(rows)
+
+    def latest_orders(self, customer_id: int, n: int = 1):
+        """The n most recent orders of a customer; n=1 is a constant-time lookup."""
+        if n < 1:
+            return {"error": f"Invalid n {n}, must be a positive integer"}
+        rows = self._customer_slice(customer_id)
+        if rows is None:
+            return {"error": f"No data found for Customer ID {customer_id}"}
+        return self._rows(rows[:n])
+
+    def customers_orders(self, customer_ids, n: int = None):
+        """
+        Orders of many customers in one pass: {customer_id: {"orders": [...],
+        "total": count}}, newest first, or only the n most recent with n.
+        The ids are looked up with one vectorised binary search and the rows
+        serialized together; unknown customers have no entry.
+        """
+        try:
+            ids = np.unique(np.asarray([int(i) for i in customer_ids], dtype=np.int64))
+        except (TypeError, ValueError):
+            return {"error": f"Invalid customer IDs {customer_ids!r}, must be integers"}
+        if len(ids) == 0:
+            return {"error": "No customer IDs given"}
+        if n is not None and n < 1:
+            return {"error": f"Invalid n {n}, must be a positive integer"}
+
+        pos = np.searchsorted(self._customer_ids, ids)
+        found = pos < len(self._customer_ids)
+        found[found] = self._customer_ids[pos[found]] == ids[found]
+        ids, pos = ids[found], pos[found]
+
+        starts = self._customer_offsets[pos]
+        totals = self._customer_offsets[pos + 1] - starts
+        counts = totals if n is None else np.minimum(totals, n)
+        rows = np.concatenate(
+            [self._customer_rows[s:s + c] for s, c in zip(starts, counts)]
+        ) if len(ids) else np.empty(0, dtype=np.int64)
+        orders = self._rows(rows)
+
+        result, at = {}, 0
+        for cid, count, total in zip(ids.tolist(), counts.tolist(), totals.tolist()):
+            result[str(cid)] = {"orders": orders[at:at + count], "total": total}
+            at += count
+        return result
+
+    def orders_in_date_range(self, start: str = None, end: str = None, limit: int = None):
+        """Orders with start <= Order_Date <= end (inclusive days), oldest first."""
+        try:
+            lo_day, hi_day = _parse_day(start), _parse_day(end)
+        except ValueError:
+            return {"error": f"Invalid date range '{start}'..'{end}', expected YYYY-MM-DD"}
+        if limit is not None and limit < 1:
+            return {"error": f"Invalid limit {limit}, must be a positive integer"}
+
+        dated = self._date_sorted[:self._dated_rows]
+        lo = 0 if lo_day is None else np.searchsorted(dated, lo_day, side="left")
+        hi = self._dated_rows if hi_day is None else \
+            np.searchsorted(dated, hi_day + np.timedelta64(1, "D"), side="left")
+        rows = self._date_order[lo:hi]
+        if limit is not None:
+            rows = rows[:limit]
+        if len(rows) == 0:
+            return {"error": f"No orders found between {start or 'the beginning'} and {end or 'now'}"}
+        return self._rows(rows)
+
+    def sales_by_period(self, period: str, start: str = None, end: str = None):
+        """Order count, sales and profit per day or month between start and end."""
+        if period not in self._buckets:
+            return {"error": f"Invalid period '{period}', expected one of {sorted(self._buckets)}"}
+        try:
+            lo_day, hi_day = _parse_day(start), _parse_day(end)
+        except ValueError:
+            return {"error": f"Invalid date range '{start}'..'{end}', expected YYYY-MM-DD"}
+        if period == "monthly" and lo_day is not None:
+            # a month bucket is included if the range starts inside it
+            lo_day = lo_day.astype("datetime64[M]").astype("datetime64[ns]")
+        return self._buckets[period].between(lo_day, hi_day)
+
+    def product_category_data(self, category: str):
+        rows = self._category.matching(category)
+        if len(rows) == 0:
+            return {"error": f"No data found for Product Category '{category}'"}
+        return self._rows(rows)
+
+    def orders_by_priority(self, priority: str, limit: int = None, sort: str = None):
+        """
+        Orders whose priority contains the given text. sort="recent" returns
+        them newest first (via the date index) so limit yields the latest N.
+        """
+        if sort not in (None, "recent"):
+            return {"error": f"Invalid sort '{sort}', expected 'recent'"}
+        if limit is not None and limit < 1:
+            return {"error": f"Invalid limit {limit}, must be a positive integer"}
+        rows = self._priority.matching(priority)
+        if sort == "recent":
+            rows = rows[np.argsort(self._recency_rank[rows], kind="stable")]
+        if limit is not None:
+            rows = rows[:limit]
+        if len(rows) == 0:
+            return {"error": f"No data found for Order Priority '{priority}'"}
+        return self._rows(rows)
+
+    def total_sales_by_category(self):
+        return self._sales_by_category
+
+    def high_profit_products(self, min_profit: float = 100.0, limit: int = None,
+                             sort: str = "desc", category: str = None):
+        if sort not in ("asc", "desc"):
+            return {"error": f"Invalid sort '{sort}', expected 'asc' or 'desc'"}
+        if limit is not None and limit < 1:
+            return {"error": f"Invalid limit {limit}, must be a positive integer"}
+
+        start = np.searchsorted(self._profit_sorted, min_profit, side="right")
+        rows  = self._profit_order[start:]
+        if sort == "desc":
+            rows = rows[::-1]
+        if category:
+            rows = rows[np.isin(rows, self._category.matching(category))]
+        if limit is not None:
+            rows = rows[:limit]
+        if len(rows) == 0:
+            return {"error": f"No products found with profit > {min_profit}"}
+        return self._rows(rows)
+
+    def shipping_cost_summary(self):
+        return self._shipping_summary
+
+    def profit_by_gender(self):
+        return self._profit_by_gender
@@ -0,0 +1,373 @@
+# order_service/order_store.py
+#
+# Columnar, memory-mappable copy of the order dataset.
+#
+# The CSV is converted once into a directory of .npy files: numeric columns
+# are stored as-is and string columns are dictionary-encoded (small integer
+# codes + a JSON list of distinct values). Every process then maps the files
+# read-only, so all gunicorn workers and the mock API share the same page
+# cache instead of each holding a private pandas copy.
+#
+# store_path is a symlink to a versioned directory (<store_path>.<version>)
+# and a rebuild publishes a new version by swapping the link atomically, so
+# a reader always finds a complete store.
+#
+# Store layout:
+#   manifest.json        column order, kinds and the source CSV fingerprint
+#   <col>.npy            numeric / datetime column
+#   <col>.codes.npy      dictionary codes for a string column
+#   <col>.dict.json      distinct values for a string column
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 4
+
+# superseded store versions are removed once they are this old, which leaves
+# readers that resolved the old link plenty of time to finish mapping it
+STORE_GRACE_SECONDS = 60
+
+# Load-time schema: column -> (dtype, value used for missing entries).
+# A fill of None keeps the entry missing (NaN / NaT), which is served as null;
+# so is the -1 filled into missing integer ids.
+# Columns not listed here are inferred: numeric stays numeric, anything else
+# becomes a category.
+ORDER_SCHEMA = {
+    "Order_Date":          ("datetime64[ns]", None),
+    "Time":                ("category",       ""),
+    "Aging":               ("float32",        None),
+    "Customer_Id":         ("int32",          -1),
+    "Gender":              ("category",       ""),
+    "Device_Type":         ("category",       ""),
+    "Customer_Login_type": ("category",       ""),
+    "Product_Category":    ("category",       ""),
+    "Product":             ("category",       ""),
+    "Sales":               ("float32",        0.0),
+    "Quantity":            ("float32",        None),
+    "Discount":            ("float32",        None),
+    "Profit":              ("float32",        0.0),
+    "Shipping_Cost":       ("float32",        0.0),
+    "Order_Priority":      ("category",       ""),
+    "Payment_method":      ("category",       ""),
+}
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def default_store_path(csv_path: str) -> str:
+    return os.environ.get("ORDER_STORE_PATH", os.path.splitext(csv_path)[0] + ".store")
+
+
+def _fingerprint(csv_path: str) -> dict:
+    st = os.stat(csv_path)
+    return {"size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+def _codes_dtype(n: int):
+    for dt in (np.int8, np.int16, np.int32):
+        if n <= np.iinfo(dt).max:
+            return dt
+    return np.int64
+
+
+def _file_name(col: str) -> str:
+    # column names are used as file names; keep them filesystem-safe
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in col)
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Coerces a raw CSV frame to ORDER_SCHEMA: categories for low-cardinality
+    strings, int32 ids, float32 money and a parsed datetime64 Order_Date.
+    Missing values are filled per column as the schema says.
+    """
+    out = {}
+    for col in df.columns:
+        dtype, fill = ORDER_SCHEMA.get(col, (None, None))
+        series = df[col]
+        if dtype is None:
+            dtype = series.dtype if pd.api.types.is_numeric_dtype(series) else "category"
+            fill  = None if dtype != "category" else ""
+
+        if dtype == "category":
+            series = series.astype(object).where(series.notna(), fill).astype(str)
+            series = series.astype("category")
+        elif str(dtype).startswith("datetime64"):
+            series = pd.to_datetime(series, format=DATE_FORMAT, errors="coerce")
+            if fill is not None:
+                series = series.fillna(pd.Timestamp(fill))
+        else:
+            series = pd.to_numeric(series, errors="coerce")
+            if fill is not None:
+                series = series.fillna(fill)
+            series = series.astype(dtype)
+        out[col] = series
+    return pd.DataFrame(out)
+
+
+def build_store(csv_path: str, store_path: str) -> str:
+    """
+    Converts the order CSV into a columnar store at store_path.
+    The store is written to a temp directory, renamed to a new version and
+    published by pointing the store_path symlink at it (see _publish), so
+    readers and concurrent builders (e.g. several workers starting at once)
+    never see a half-written or missing store.
+    """
+    logger.info(f"Building order store {store_path} from {csv_path}")
+    df = apply_schema(pd.read_csv(csv_path, on_bad_lines="skip"))
+
+    tmp_path = f"{store_path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = []
+    for col in df.columns:
+        fname  = _file_name(col)
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            np.save(os.path.join(tmp_path, f"{fname}.codes.npy"),
+                    codes.astype(_codes_dtype(len(series.cat.categories))))
+            with open(os.path.join(tmp_path, f"{fname}.dict.json"), "w") as f:
+                json.dump([str(c) for c in series.cat.categories], f)
+            columns.append({"name": col, "file": fname, "kind": "string"})
+        else:
+            values = series.to_numpy()
+            np.save(os.path.join(tmp_path, f"{fname}.npy"), values)
+            columns.append({"name": col, "file": fname, "kind": "numeric"})
+
+    manifest = {
+        "version": STORE_VERSION,
+        "rows":    len(df),
+        "source":  _fingerprint(csv_path),
+        "columns": columns,
+    }
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    # versions are named by publish time, so pruning never touches a build in progress
+    version_path = f"{store_path}.{time.time_ns()}-{os.getpid()}"
+    os.rename(tmp_path, version_path)
+    _publish(version_path, store_path)
+    logger.info(f"Order store ready: {len(df)} rows, {len(columns)} columns")
+    return store_path
+
+
+def _publish(version_path: str, store_path: str):
+    """
+    Points the store_path symlink at version_path with an atomic rename, then
+    prunes versions older than STORE_GRACE_SECONDS. Processes that already
+    mapped an old version keep its files until they exit.
+    """
+    if os.path.isdir(store_path) and not os.path.islink(store_path):
+        # a store from before versioning: a plain directory can't be replaced
+        # by a link atomically, so move it aside first (one-off migration)
+        legacy = f"{store_path}.old-{os.getpid()}"
+        os.rename(store_path, legacy)
+        shutil.rmtree(legacy, ignore_errors=True)
+
+    link_path = f"{store_path}.link-{os.getpid()}"
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.symlink(os.path.basename(version_path), link_path)
+    os.replace(link_path, store_path)
+    _prune_versions(store_path)
+
+
+def _prune_versions(store_path: str):
+    """Removes old store versions other than the published one (including ones lost to a concurrent build)."""
+    parent, name = os.path.split(os.path.abspath(store_path))
+    current = os.path.basename(os.path.realpath(store_path))
+    cutoff  = time.time_ns() - STORE_GRACE_SECONDS * 10**9
+    for entry in os.listdir(parent):
+        stamp, _, pid = entry[len(name) + 1:].partition("-")
+        if (entry.startswith(f"{name}.") and entry != current and stamp.isdigit() and pid.isdigit()
+                and int(stamp) < cutoff):
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+
+def _read_manifest(store_path: str):
+    try:
+        with open(os.path.join(store_path, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(csv_path: str, store_path: str) -> bool:
+    manifest = _read_manifest(store_path)
+    if not manifest or manifest.get("version") != STORE_VERSION:
+        return False
+    if not os.path.exists(csv_path):
+        # store shipped without its CSV; trust it
+        return True
+    return manifest.get("source") == _fingerprint(csv_path)
+
+
+def load_store(store_path: str) -> pd.DataFrame:
+    """
+    Maps a columnar store read-only and wraps it in a DataFrame without
+    copying: numeric columns are np.memmap views and string columns are
+    Categoricals whose codes point straight at the mapped file.
+    """
+    return _load_version(os.path.realpath(store_path))
+
+
+def _load_version(version_path: str) -> pd.DataFrame:
+    manifest = _read_manifest(version_path)
+    if manifest is None:
+        raise FileNotFoundError(f"No order store at {version_path}")
+
+    data = {}
+    for col in manifest["columns"]:
+        base = os.path.join(version_path, col["file"])
+        if col["kind"] == "numeric":
+            data[col["name"]] = np.load(f"{base}.npy", mmap_mode="r")
+        else:
+            codes = np.load(f"{base}.codes.npy", mmap_mode="r")
+            with open(f"{base}.dict.json") as f:
+                uniques = json.load(f)
+            data[col["name"]] = pd.Categorical.from_codes(codes, categories=uniques, validate=False)
+    return pd.DataFrame(data, copy=False)
+
+
+def load_orders(csv_path: str, store_path: str = None) -> pd.DataFrame:
+    """
+    Returns the order dataset backed by the columnar store, (re)building the
+    store first if it is missing or older than the CSV.
+    """
+    store_path = store_path or default_store_path(csv_path)
+    if not is_fresh(csv_path, store_path):
+        build_store(csv_path, store_path)
+    return load_store(store_path)
+
+
+def _short_floats(arr: np.ndarray) -> np.ndarray:
+    """
+    float32 -> float64 via the shortest decimal that reads back as the same
+    float32: 98.4 stays 98.4, not 98.40000153. Same result as str() of each
+    value, but vectorized: each pass rounds the values still left to one
+    more significant digit, and money needs only a handful of passes.
+    """
+    wide = arr.astype(np.float64)
+    out = wide.copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(wide)))
+    finite = np.isfinite(magnitude)  # zeros, NaN and inf are exact already
+    # powers of ten are exact in float64 up to 1e22; the rare values too
+    # small or large for that go through str()
+    outside = finite & ((magnitude < -14) | (magnitude > 22))
+    out[outside] = arr[outside].astype(str).astype(np.float64)
+    todo = np.flatnonzero(finite & ~outside)
+    for digits in range(1, 10):
+        if not len(todo):
+            break
+        # decimals to keep; scale by exact powers of ten so the rounding is exact
+        places = digits - 1 - magnitude[todo]
+        scale = 10.0 ** np.abs(places)
+        values = wide[todo]
+        rounded = np.where(places >= 0, np.round(values * scale) / scale, np.round(values / scale) * scale)
+        hit = rounded.astype(np.float32) == arr[todo]
+        out[todo[hit]] = rounded[hit]
+        todo = todo[~hit]
+    return out
+
+
+def _column_values(series: pd.Series, rows=None, missing=None) -> list:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = np.asarray(series.cat.categories, dtype=object)
+        codes = series.cat.codes.to_numpy()
+        if rows is not None:
+            codes = codes[rows]
+        values = categories[codes]
+        values[codes < 0] = None
+        return values.tolist()
+    arr = series.to_numpy()
+    if rows is not None:
+        arr = arr[rows]
+    if np.issubdtype(arr.dtype, np.datetime64):
+        missing = np.isnat(arr)
+        values = np.datetime_as_string(arr, unit="D").astype(object)
+        values[missing] = None
+        return values.tolist()
+    if arr.dtype == np.float32:
+        # stored as float32; widened only for the rows being served
+        arr = _short_floats(arr)
+    if arr.dtype.kind == "f" and np.isnan(arr).any():
+        values = arr.astype(object)
+        values[np.isnan(arr)] = None
+        return values.tolist()
+    if missing is not None and (arr == missing).any():
+        values = arr.astype(object)
+        values[arr == missing] = None
+        return values.tolist()
+    return arr.tolist()
+
+
+def _missing_sentinel(col: str):
+    dtype, fill = ORDER_SCHEMA.get(col, (None, None))
+    return fill if dtype is not None and dtype.startswith("int") else None
+
+
+def records(frame: pd.DataFrame, rows=None, id_column: str = None) -> list:
+    """
+    Converts a (filtered) order frame to JSON-ready dicts: dates are served
+    as YYYY-MM-DD strings, float32 values keep their short decimal form and
+    missing values (including the -1 of a missing Customer_Id) become None
+    so the payload stays valid JSON.
+    rows optionally selects row positions, gathering straight from the
+    column arrays instead of building an intermediate frame.
+    id_column, if given, adds each record's row position under that name.
+    """
+    columns = list(frame.columns)
+    values  = [_column_values(frame[col], rows, _missing_sentinel(col)) for col in columns]
+    if id_column:
+        columns.insert(0, id_column)
+        values.insert(0, range(len(frame)) if rows is None else np.asarray(rows).tolist())
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def memory_report(csv_path: str) -> pd.DataFrame:
+    """
+    Per-column memory of the legacy load (read_csv + fillna("")) next to the
+    typed schema, in bytes. The store keeps the typed dtypes as they are, so
+    typed_bytes is also what a loaded store maps.
+    """
+    legacy = pd.read_csv(csv_path, on_bad_lines="skip")
+    typed  = apply_schema(legacy.copy())
+    legacy = legacy.fillna("")
+    report = pd.DataFrame({
+        "legacy_dtype": legacy.dtypes.astype(str),
+        "legacy_bytes": legacy.memory_usage(index=False, deep=True),
+        "typed_dtype":  typed.dtypes.astype(str),
+        "typed_bytes":  typed.memory_usage(index=False, deep=True),
+    })
+    report.loc["TOTAL", ["legacy_bytes", "typed_bytes"]] = report[["legacy_bytes", "typed_bytes"]].sum()
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the columnar order store")
+    parser.add_argument("--csv", default=os.environ.get("DATA_PATH", "/data/Order_Data_Dataset.csv"))
+    parser.add_argument("--out", default=None, help="store directory (default: next to the CSV)")
+    parser.add_argument("--report", action="store_true", help="print a memory report before/after the schema")
+    args = parser.parse_args()
+
+    if args.report:
+        report = memory_report(args.csv)
+        report.to_string(sys.stdout)
+        legacy, typed = report.loc["TOTAL", ["legacy_bytes", "typed_bytes"]]
+        print(f"\n\nlegacy {legacy / 2**20:.2f} MiB -> typed {typed / 2**20:.2f} MiB "
+              f"({legacy / max(typed, 1):.1f}x smaller)")
+    else:
+        build_store(args.csv, args.out or default_store_path(args.csv))
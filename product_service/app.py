@@ -1,22 +1,102 @@
-from flask import Flask, jsonify, request
+import os, sys
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path: sys.path.insert(0, ROOT)  # for common/
+
+from flask import Flask, jsonify, make_response, request
 from flask_restful import Resource, Api
 from flasgger import Swagger
 from product_retriever import ProductRetriever
 from cachetools import TTLCache
+from single_flight import SingleFlight
+from common import tracing
+from common import metrics
+from common import profiling
+import threading
 import logging
-import os
 
 app = Flask(__name__)
 api = Api(app)
 swagger = Swagger(app)
+tracing.init_app(app, "product_service")
+metrics.init_app(app)
+profiling.init_app(app, "product_service")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize the product retriever
 retriever = ProductRetriever()
 
-# Cache for frequently requested queries
+# Cache for frequently requested queries (TTLCache is not thread-safe)
 cache = TTLCache(maxsize=1000, ttl=300)
+cache_lock = threading.Lock()
+
+# Identical searches arriving together share one FAISS + CrossEncoder pass
+search_flight = SingleFlight()
+
+# Queries accepted by one /search/batch call, and the largest top_k
+SEARCH_BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", 256))
+SEARCH_MAX_TOP_K = 100
+
+search_cache_lookups = metrics.Counter(
+    "search_cache_lookups_total", "Product search cache lookups, by result.", ["result"])
+metrics.Collected("search_cache_entries", "Responses held in the search cache.", "gauge",
+                  lambda: [((), len(cache))])
+metrics.Collected("search_single_flight_total", "Searches through single-flight, by outcome.", "counter",
+                  lambda: [((outcome,), search_flight.stats()[outcome]) for outcome in ("executions", "collapsed")],
+                  ["outcome"])
+
+def search_options(data):
+    """(top_k, min_rating) from a search request body; raises ValueError if either is invalid."""
+    top_k = data.get('top_k', 5)
+    min_rating = data.get('min_rating', 4.0)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or not 1 <= top_k <= SEARCH_MAX_TOP_K:
+        raise ValueError(f"top_k must be an integer between 1 and {SEARCH_MAX_TOP_K}")
+    if isinstance(min_rating, bool) or not isinstance(min_rating, (int, float)) or not 0 <= min_rating <= 5:
+        raise ValueError("min_rating must be a number between 0 and 5")
+    return top_k, min_rating
+
+def run_search(query, top_k, min_rating):
+    """Runs the retriever and serializes its results, caching the response."""
+    logger.info(f"Processing search query: {query}")
+    with tracing.span("retriever.search"):
+        results = retriever.search(
+            query=query,
+            top_k=top_k,
+            min_rating=min_rating
+        )
+
+    response = []
+    for item in results:
+        if hasattr(item, "to_dict"):
+            # Product instance
+            response.append(item.to_dict())
+        elif isinstance(item, dict):
+            # Already a dict
+            response.append(item)
+        else:
+            # Fallback: try its __dict__
+            try:
+                response.append(item.__dict__)
+            except Exception:
+                # As last resort, string‑ify
+                response.append({"value": str(item)})
+
+    # retriever.search returns [] on internal errors, so only cache hits
+    if response:
+        with cache_lock:
+            cache[f"{query}-{top_k}-{min_rating}"] = response
+    return response
+
+def run_search_batch(queries, top_k, min_rating):
+    """Runs one retriever pass over several queries, caching each non-empty result."""
+    logger.info(f"Processing {len(queries)} batched search queries")
+    with tracing.span("retriever.search_batch", queries=len(queries)):
+        results = retriever.search_batch(queries, top_k=top_k, min_rating=min_rating)
+    with cache_lock:
+        for query, response in zip(queries, results):
+            if response:
+                cache[f"{query}-{top_k}-{min_rating}"] = response
+    return results
 
 class Health(Resource):
     def get(self):
@@ -52,50 +132,96 @@ class ProductSearch(Resource):
           200:
             description: Returns a list of products matching the search query.
           400:
-            description: Missing query parameter.
+            description: Missing query parameter, or invalid top_k / min_rating.
         """
         data = request.json
         if not data or 'query' not in data:
-            return jsonify({"error": "Missing query parameter"}), 400
+            return make_response(jsonify({"error": "Missing query parameter"}), 400)
+        try:
+            top_k, min_rating = search_options(data)
+        except ValueError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
         
         try:
             query = data.get('query')
-            top_k = data.get('top_k', 5)
-            min_rating = data.get('min_rating', 4.0)
             
             cache_key = f"{query}-{top_k}-{min_rating}"
             
-            if cache_key in cache:
+            with tracing.span("cache") as span, cache_lock:
+                cached = cache.get(cache_key)
+                span["hit"] = cached is not None
+            search_cache_lookups.inc(result="hit" if cached is not None else "miss")
+            if cached is not None:
                 logger.info(f"Cache hit for query: {query}")
-                return jsonify(cache[cache_key])
-            
-            logger.info(f"Processing search query: {query}")
-            results = retriever.search(
-                query=query,
-                top_k=top_k,
-                min_rating=min_rating
-            )
-            
-            response = []
-            for item in results:
-                if hasattr(item, "to_dict"):
-                    # Product instance
-                    response.append(item.to_dict())
-                elif isinstance(item, dict):
-                    # Already a dict
-                    response.append(item)
-                else:
-                    # Fallback: try its __dict__
-                    try:
-                        response.append(item.__dict__)
-                    except Exception:
-                        # As last resort, string‑ify
-                        response.append({"value": str(item)})
+                return jsonify(cached)
 
+            with tracing.span("search"):
+                response = search_flight.do(cache_key, run_search, query, top_k, min_rating)
             return jsonify(response)
         except Exception as e:
             logger.exception("Error during product search")
-            return jsonify({"error": "Internal server error"}), 500
+            return make_response(jsonify({"error": "Internal server error"}), 500)
+
+class ProductSearchBatch(Resource):
+    def post(self):
+        """
+        Batched product search endpoint.
+        ---
+        parameters:
+          - name: queries
+            in: body
+            type: array
+            items:
+              type: string
+            required: true
+            description: The search queries.
+          - name: top_k
+            in: body
+            type: integer
+            description: The number of results per query (default: 5).
+          - name: min_rating
+            in: body
+            type: number
+            description: The minimum rating for the results (default: 4.0).
+        responses:
+          200:
+            description: Returns one list of products per query, in the order given, under "results".
+          400:
+            description: Missing or invalid queries, top_k or min_rating.
+          413:
+            description: More than SEARCH_BATCH_MAX queries.
+        """
+        data = request.json
+        queries = data.get('queries') if isinstance(data, dict) else None
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            return make_response(jsonify({"error": "Missing or invalid queries parameter"}), 400)
+        if len(queries) > SEARCH_BATCH_MAX:
+            return make_response(jsonify({"error": f"Too many queries, at most {SEARCH_BATCH_MAX} per batch"}), 413)
+        try:
+            top_k, min_rating = search_options(data)
+        except ValueError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+
+        try:
+            # cached queries are answered directly; the rest share one retriever pass
+            results = {}
+            with tracing.span("cache", queries=len(queries)) as span, cache_lock:
+                for query in queries:
+                    cached = cache.get(f"{query}-{top_k}-{min_rating}")
+                    if cached is not None:
+                        results[query] = cached
+                span["hits"] = len(results)
+            for query in queries:
+                search_cache_lookups.inc(result="hit" if query in results else "miss")
+
+            misses = [q for q in dict.fromkeys(queries) if q not in results]
+            if misses:
+                with tracing.span("search"):
+                    results.update(zip(misses, run_search_batch(misses, top_k, min_rating)))
+            return jsonify({"results": [results[q] for q in queries]})
+        except Exception as e:
+            logger.exception("Error during batched product search")
+            return make_response(jsonify({"error": "Internal server error"}), 500)
 
 class Product(Resource):
     def get(self, asin):
@@ -116,16 +242,29 @@ class Product(Resource):
         """
         product = retriever.get_by_asin(asin)
         if not product:
-            return jsonify({"error": "Product not found"}), 404
+            return make_response(jsonify({"error": "Product not found"}), 404)
         try:
             return jsonify(product.to_dict())
         except Exception as e:
             logger.exception("Error during get product")
-            return jsonify({"error": "Internal server error"}), 500
+            return make_response(jsonify({"error": "Internal server error"}), 500)
+
+class SingleFlightStats(Resource):
+    def get(self):
+        """
+        Request coalescing statistics for product search.
+        ---
+        responses:
+          200:
+            description: Searches received, executed and collapsed into an in-flight search.
+        """
+        return jsonify(search_flight.stats())
 
 api.add_resource(Health, '/health')
 api.add_resource(ProductSearch, '/search')
+api.add_resource(ProductSearchBatch, '/search/batch')
 api.add_resource(Product, '/product/<string:asin>')
+api.add_resource(SingleFlightStats, '/stats/single-flight')
 
 @app.errorhandler(400)
 def bad_request(error):
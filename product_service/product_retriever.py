@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
 import os
 import json
+import time
 from langchain_community.vectorstores.faiss import FAISS
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from pydantic import BaseModel, Field
@@ -8,6 +10,8 @@ from typing import List, Optional, Dict, Any
 from sentence_transformers import CrossEncoder
 import logging
 
+from common import tracing
+
 logger = logging.getLogger(__name__)
 
 class Product(BaseModel):
@@ -107,72 +111,111 @@ class ProductRetriever:
         """
         Perform a semantic + reranked search, falling back to keyword matching.
         """
+        return self.search_batch([query], top_k=top_k, min_rating=min_rating)[0]
+
+    def search_batch(self, queries: List[str], top_k=5, min_rating=4.0) -> List[List[Dict[str, Any]]]:
+        """
+        Searches several queries at once and returns one result list per
+        query. The queries are embedded in one encoder pass, looked up in FAISS
+        one vector at a time and reranked with one CrossEncoder pass over all
+        (query, title) pairs; a query left without candidates falls back to
+        keyword matching on its own. If the shared pass fails, each query is
+        retried alone, so one bad query costs only its own results.
+        """
+        if self.df.empty:
+            logger.error("Product DataFrame is empty, cannot perform search")
+            return [[] for _ in queries]
+        if not queries:
+            return []
         try:
-            if self.df.empty:
-                logger.error("Product DataFrame is empty, cannot perform search")
-                return []
-
-            query_lower = query.lower()
-
-            # 1) FAISS semantic search (k×3 candidates)
-            logger.info(f"Performing FAISS semantic search for: '{query}'")
-            docs = self.index.similarity_search(query, k=top_k * 3)
-            asins = [doc.metadata["asin"] for doc in docs]
-
-            # Filter by rating
-            candidates = self.df[
-                (self.df["parent_asin"].isin(asins)) &
-                (self.df["average_rating"] >= min_rating)
-            ]
-
-            # 2) Rerank via CrossEncoder
-            if not candidates.empty:
-                logger.info(f"Reranking {len(candidates)} FAISS candidates")
-                titles = candidates["title"].fillna("").tolist()
-                pairs  = list(zip([query] * len(titles), titles))
+            return self._search_batch(queries, top_k, min_rating)
+        except Exception as e:
+            if len(queries) == 1:
+                logger.error(f"Error during dynamic search for {queries[0]!r}: {e}")
+                return [[]]
+            logger.error(f"Batched search over {len(queries)} queries failed, searching one by one: {e}")
+            return [self.search_batch([query], top_k, min_rating)[0] for query in queries]
+
+    def _search_batch(self, queries: List[str], top_k: int, min_rating: float) -> List[List[Dict[str, Any]]]:
+        # 1) FAISS semantic search (k×3 candidates per query); the queries
+        # are embedded separately so model time and index time are traced apart
+        logger.info(f"Performing FAISS semantic search for {len(queries)} queries: {queries[:3]}")
+        with tracing.span("retriever.encode", queries=len(queries)):
+            vectors = np.asarray(self.encoder.embed_documents(list(queries)), dtype="float32")
+        with tracing.span("retriever.faiss", k=top_k * 3, queries=len(queries)):
+            asin_lists = self._nearest_asins(vectors, top_k * 3)
+
+        # Filter by rating
+        with tracing.span("retriever.filter"):
+            rated = self.df[self.df["average_rating"] >= min_rating]
+            candidate_sets = [rated[rated["parent_asin"].isin(asins)] for asins in asin_lists]
+
+        # 2) Rerank via CrossEncoder, all queries in one pass
+        pairs = [
+            (query, title)
+            for query, candidates in zip(queries, candidate_sets)
+            for title in candidates["title"].fillna("").tolist()
+        ]
+        scores = []
+        if pairs:
+            logger.info(f"Reranking {len(pairs)} FAISS candidates")
+            with tracing.span("retriever.rerank", pairs=len(pairs)):
                 scores = self.reranker.predict(pairs)
-                candidates = candidates.assign(_score=scores)
-                candidates = candidates.sort_values("_score", ascending=False).head(top_k)
-
-                return [
-                    Product(
-                        asin=row["parent_asin"],
-                        title=row["title"],
-                        price=float(row["price"]),
-                        rating=float(row["average_rating"]),
-                        categories=self._parse_list(row["categories"]),
-                        features=self._parse_list(row["features"]),
-                        description=(str(row["description"]) if not pd.isna(row["description"]) else None)
-                    ).to_dict()
-                    for _, row in candidates.iterrows()
-                ]
-
-            # 3) Fallback to simple keyword match in titles
-            logger.info("FAISS returned no candidates above rating threshold, falling back to keyword search")
-            keywords = query_lower.split()
-            results = []
-            for _, row in self.df.iterrows():
-                title = str(row["title"]).lower() if not pd.isna(row["title"]) else ""
-                if all(term in title for term in keywords) and float(row["average_rating"]) >= min_rating:
-                    results.append(Product(
-                        asin=row["parent_asin"],
-                        title=row["title"],
-                        price=float(row["price"]),
-                        rating=float(row["average_rating"]),
-                        categories=self._parse_list(row["categories"]),
-                        features=self._parse_list(row["features"]),
-                        description=(str(row["description"]) if not pd.isna(row["description"]) else None)
-                    ).to_dict())
-                    if len(results) >= top_k:
-                        break
-
-            logger.info(f"Keyword search found {len(results)} results")
-            return results
 
-        except Exception as e:
-            logger.error(f"Error during dynamic search for '{query}': {e}")
-            return []
-    
+        results, at = [], 0
+        for query, candidates in zip(queries, candidate_sets):
+            query_scores = scores[at:at + len(candidates)]
+            at += len(candidates)
+            try:
+                if candidates.empty:
+                    results.append(self._keyword_search(query, top_k, min_rating))
+                    continue
+                ranked = candidates.assign(_score=query_scores)
+                ranked = ranked.sort_values("_score", ascending=False).head(top_k)
+                with tracing.span("retriever.build"):
+                    results.append([self._product(row).to_dict() for _, row in ranked.iterrows()])
+            except Exception as e:
+                logger.error(f"Error building results for {query!r}: {e}")
+                results.append([])
+        return results
+
+    def _nearest_asins(self, vectors: np.ndarray, k: int) -> List[List[str]]:
+        """The ASINs of the k nearest documents for each row of vectors."""
+        # one public vector search per query; the costly part, embedding the
+        # queries, is still done in a single batch by the caller
+        return [
+            [doc.metadata["asin"] for doc, _ in self.index.similarity_search_with_score_by_vector(vector.tolist(), k=k)]
+            for vector in vectors
+        ]
+
+    def _keyword_search(self, query: str, top_k: int, min_rating: float):
+        """Simple keyword match in titles, for queries FAISS found nothing for."""
+        logger.info("FAISS returned no candidates above rating threshold, falling back to keyword search")
+        started = time.perf_counter()
+        keywords = query.lower().split()
+        results = []
+        for _, row in self.df.iterrows():
+            title = str(row["title"]).lower() if not pd.isna(row["title"]) else ""
+            if all(term in title for term in keywords) and float(row["average_rating"]) >= min_rating:
+                results.append(self._product(row).to_dict())
+                if len(results) >= top_k:
+                    break
+
+        tracing.record("retriever.keyword_fallback", started, time.perf_counter() - started)
+        logger.info(f"Keyword search found {len(results)} results")
+        return results
+
+    def _product(self, row) -> Product:
+        return Product(
+            asin=row["parent_asin"],
+            title=row["title"],
+            price=float(row["price"]),
+            rating=float(row["average_rating"]),
+            categories=self._parse_list(row["categories"]),
+            features=self._parse_list(row["features"]),
+            description=(str(row["description"]) if not pd.isna(row["description"]) else None)
+        )
+
     def get_by_asin(self, asin: str):
         if self.df.empty:
             logger.error("Product DataFrame is empty, cannot get product by ASIN")
@@ -3,9 +3,23 @@ import requests
 import json
 import os
 import sys
+import zlib
+import tempfile
+import importlib.util
+from unittest import mock
+
+import numpy as np
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fixtures import write_catalog, write_orders
+from offline_bench import load_service, serve, start_perplexity_stub
+from replay import start_product_stub
+
+HAS_ENCODER = importlib.util.find_spec("sentence_transformers") is not None
+HAS_FASTAPI = importlib.util.find_spec("fastapi") is not None
 
 class TestChatService(unittest.TestCase):
     def setUp(self):
@@ -176,6 +190,230 @@ class TestChatService(unittest.TestCase):
             self.assertTrue("sorry" in data['response'].lower() or "unavailable" in data['response'].lower())
         except:
             pass
-        
+
+
+class FakeSentenceTransformer:
+    """Hashed bag of words: deterministic, and no model download."""
+    def __init__(self, model_name=None, **kwargs):
+        pass
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(texts, str)
+        vecs = np.zeros((1 if single else len(texts), 64), dtype=np.float32)
+        for row, text in enumerate([texts] if single else texts):
+            for word in text.lower().split():
+                vecs[row, zlib.crc32(word.encode()) % 64] += 1
+        if normalize_embeddings:
+            vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        return vecs[0] if single else vecs
+
+
+_downstreams = {}
+
+
+def downstreams():
+    """Order service, product stub and Perplexity stub over synthetic data, started once per run."""
+    if not _downstreams:
+        tmp = tempfile.TemporaryDirectory()
+        orders_path = os.path.join(tmp.name, "Order_Data_Dataset.csv")
+        catalog_path = os.path.join(tmp.name, "Product_Information_Dataset.csv")
+        orders = write_orders(orders_path, 2000, customers=100, seed=0)
+        catalog = write_catalog(catalog_path, 200, seed=0)
+        with mock.patch.dict(os.environ):
+            order_app = load_service("order_service", {"DATA_PATH": orders_path, "TRACE_EXPORT": "off"})
+        _downstreams.update({
+            "tmp": tmp,
+            "customer": orders["customer_ids"][0],
+            "query": catalog["queries"][0],
+            "env": {
+                "ORDER_SERVICE_URL": serve(order_app.app),
+                "PRODUCT_SERVICE_URL": start_product_stub(catalog_path, 0),
+                "PERPLEXITY_API_KEY": "test",
+                "PERPLEXITY_BASE_URL": start_perplexity_stub(0),
+                "TRACE_EXPORT": "off",
+                "CHAT_BATCH_MAX_MESSAGES": "20",
+            },
+        })
+    return _downstreams
+
+
+def load_chat(module):
+    with mock.patch.dict(os.environ), \
+            mock.patch("sentence_transformers.SentenceTransformer", FakeSentenceTransformer):
+        return load_service("chat_service", downstreams()["env"], module=module)
+
+
+class ChatServiceChecks:
+    """Checks run against both chat apps, the Flask one and the FastAPI one."""
+
+    def post(self, path, body, headers=None):
+        """Returns (status, JSON or text body, headers)."""
+        raise NotImplementedError
+
+    def chat(self, message, session_id=None):
+        status, data, _ = self.post("/chat", {"message": message, "session_id": session_id})
+        self.assertEqual(status, 200)
+        return data
+
+    def conversations(self):
+        customer = str(downstreams()["customer"])
+        return {
+            "last": ["What are the details of my last order?", customer],
+            "specific": ["What is the status of my car body covers?", customer, "the more recent one"],
+            "products": [downstreams()["query"]],
+        }
+
+    def test_order_conversation(self):
+        first, customer = self.conversations()["last"]
+        reply = self.chat(first)
+        self.assertIn("customer id", reply["response"].lower())
+        answer = self.chat(customer, reply["session_id"])
+        self.assertEqual(answer["session_id"], reply["session_id"])
+        self.assertIn("Most recent", answer["response"])
+        # the slot was filled, so the same message is now just a message
+        self.assertNotIn("Most recent", self.chat(customer, reply["session_id"])["response"])
+
+    def test_chat_batch_runs_conversations_in_rounds(self):
+        conversations = self.conversations()
+        # interleaved, the way an evaluation set would send them
+        messages = [{"message": conversations[label][turn], "session_id": label}
+                    for turn in range(3) for label in conversations if turn < len(conversations[label])]
+        messages.append({"message": "hello"})
+        status, data, _ = self.post("/chat/batch", {"messages": messages, "timing": True})
+        self.assertEqual(status, 200)
+        results = data["results"]
+        self.assertEqual(len(results), len(messages))
+        self.assertTrue(all(r["status"] == 200 for r in results))
+
+        by_label = {}
+        for item, result in zip(messages, results):
+            by_label.setdefault(item.get("session_id"), []).append(result)
+        self.assertEqual([r["route"] for r in by_label["last"]],
+                         ["intent:last_order", "slot:customer_id_for_last_order"])
+        self.assertEqual([r["route"] for r in by_label["specific"]],
+                         ["intent:specific_order", "slot:customer_id_for_specific_order",
+                          "slot:which_specific_order"])
+        self.assertEqual(by_label["products"][0]["route"], "intent:product_search")
+        self.assertEqual(by_label[None][0]["route"], "command")
+        for label in ("last", "specific"):
+            self.assertEqual(len({r["session_id"] for r in by_label[label]}), 1)
+
+        rounds = [s for s in data["timing"]["spans"] if s["name"] == "batch.round"]
+        self.assertEqual([(s["round"], s["messages"]) for s in rounds], [(1, 4), (2, 2), (3, 1)])
+
+        # the same conversations one /chat call at a time give the same answers
+        for label, turns in conversations.items():
+            session_id = None
+            for turn, (message, result) in enumerate(zip(turns, by_label[label])):
+                reply = self.chat(message, session_id)
+                session_id = reply["session_id"]
+                if turn or label == "products":
+                    self.assertEqual(reply["response"], result["response"])
+
+    def test_chat_batch_validation(self):
+        status, _, _ = self.post("/chat/batch", {"messages": []})
+        self.assertEqual(status, 400)
+        status, _, _ = self.post("/chat/batch", {"messages": [{"message": "hello"}] * 21})
+        self.assertEqual(status, 413)
+        status, data, _ = self.post("/chat/batch", {"messages": [{"message": " "}, {"message": "hello"}]})
+        self.assertEqual(status, 200)
+        self.assertEqual([r["status"] for r in data["results"]], [400, 200])
+
+    def test_chat_stream(self):
+        status, body, headers = self.post("/chat/stream", {"message": downstreams()["query"]})
+        self.assertEqual(status, 200)
+        self.assertTrue(headers["Content-Type"].startswith("text/event-stream"))
+        events = [block.split("\n", 1) for block in body.strip().split("\n\n")]
+        names = [event[0] for event in events]
+        self.assertEqual(names[0], "event: session")
+        self.assertIn("event: products", names)
+        self.assertIn("event: insight", names)
+        self.assertEqual(names[-1], "event: done")
+        done = json.loads(events[-1][1][len("data: "):])
+        self.assertEqual(done["response"], self.chat(downstreams()["query"])["response"])
+
+    def test_request_id_and_timing(self):
+        status, data, headers = self.post("/chat", {"message": "hello", "timing": True},
+                                          headers={"X-Request-ID": "test-request-1"})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["X-Request-ID"], "test-request-1")
+        self.assertEqual(data["timing"]["request_id"], "test-request-1")
+        self.assertIn("route", [s["name"] for s in data["timing"]["spans"]])
+
+
+@unittest.skipUnless(HAS_ENCODER, "needs sentence_transformers")
+class TestChatServiceInProcess(ChatServiceChecks, unittest.TestCase):
+    """The Flask chat app against in-process downstreams, through Flask's test client."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.service = load_chat("app")
+        cls.client = cls.service.app.test_client()
+
+    def post(self, path, body, headers=None):
+        response = self.client.post(path, json=body, headers=headers or {})
+        data = response.get_data(as_text=True)
+        return response.status_code, response.get_json() if response.is_json else data, response.headers
+
+    def get_json(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_cache_stats_count_repeated_insights(self):
+        self.assertEqual(self.get_json("/stats/cache")["store"], "MemoryStore")
+        self.chat(downstreams()["query"])
+        before = self.get_json("/stats/cache")
+        self.chat(downstreams()["query"])
+        after = self.get_json("/stats/cache")
+        self.assertGreater(after["hits"], before["hits"])
+        self.assertEqual(after["misses"], before["misses"])
+
+    def test_intent_stats_count_lexical_matches(self):
+        before = self.get_json("/stats/intent")
+        reply = self.chat("profit by gender")
+        self.assertIn("session_id", reply)
+        after = self.get_json("/stats/intent")
+        self.assertEqual(after["lexical"], before["lexical"] + 1)
+        self.assertEqual(after["queries"], before["queries"] + 1)
+
+    def test_router_stats_record_stages(self):
+        before = self.get_json("/stats/router").get("intent:profit_by_gender", {"count": 0})
+        self.chat("profit by gender")
+        after = self.get_json("/stats/router")
+        self.assertEqual(after["intent:profit_by_gender"]["count"], before["count"] + 1)
+        self.assertIn("route", after)
+
+    def test_metrics_endpoint(self):
+        self.chat("hello")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertIn('route="/chat"', text)
+        self.assertIn("# TYPE", text)
+
+
+@unittest.skipUnless(HAS_ENCODER and HAS_FASTAPI, "needs sentence_transformers and fastapi")
+class TestChatServiceAsgiInProcess(ChatServiceChecks, unittest.TestCase):
+    """The FastAPI chat app against the same downstreams, through FastAPI's test client."""
+
+    @classmethod
+    def setUpClass(cls):
+        from fastapi.testclient import TestClient
+        cls.service = load_chat("asgi_app")
+        # entered, the client keeps one event loop for every request, like a server would
+        cls.client = TestClient(cls.service.app).__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+
+    def post(self, path, body, headers=None):
+        response = self.client.post(path, json=body, headers=headers or {})
+        if response.headers.get("Content-Type", "").startswith("application/json"):
+            return response.status_code, response.json(), response.headers
+        return response.status_code, response.text, response.headers
+
+
 if __name__ == '__main__':
     unittest.main()
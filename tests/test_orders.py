@@ -3,9 +3,18 @@ import requests
 import json
 import os
 import sys
+import csv
+import tempfile
+from unittest import mock
+
+import numpy as np
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fixtures import write_orders
+from offline_bench import load_service
 
 class TestOrderService(unittest.TestCase):
     def setUp(self):
@@ -136,5 +145,198 @@ class TestOrderService(unittest.TestCase):
         except:
             pass
 
+class TestOrderStore(unittest.TestCase):
+    """The columnar store keeps the typed schema and serves short decimals."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.order_store = load_service("order_service", {}, module="order_store")
+
+    def test_store_keeps_float32_and_serves_short_decimals(self):
+        path = os.path.join(self.tmp.name, "Order_Data_Dataset.csv")
+        write_orders(path, 500, customers=50, seed=1)
+        frame = self.order_store.load_orders(path, os.path.join(self.tmp.name, "orders.store"))
+        for col in ("Sales", "Profit", "Shipping_Cost"):
+            self.assertEqual(frame[col].dtype, np.float32)
+        report = self.order_store.memory_report(path)
+        self.assertEqual(report.loc["TOTAL", "typed_bytes"],
+                         frame.memory_usage(index=False, deep=True).sum())
+
+        served = self.order_store.records(frame)
+        with open(path) as f:
+            source = list(csv.DictReader(f))
+        for col in ("Sales", "Profit", "Discount", "Shipping_Cost"):
+            self.assertEqual([r[col] for r in served], [float(r[col]) for r in source])
+
+    def test_short_floats_match_str(self):
+        rng = np.random.default_rng(0)
+        values = (rng.standard_normal(5000) * 10.0 ** rng.integers(-30, 30, 5000)).astype(np.float32)
+        values = np.concatenate([values, np.array([0, 98.4, np.nan, np.inf, 1e-45, 3.4e38], dtype=np.float32)])
+        short = self.order_store._short_floats(values)
+        expected = [float(str(v)) for v in values]
+        self.assertEqual([v for v in short.tolist() if v == v], [v for v in expected if v == v])
+
+class TestWorkerMetrics(unittest.TestCase):
+    """With METRICS_DIR set, /metrics reports the totals of every gunicorn worker."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        with mock.patch.dict(os.environ):
+            self.metrics = load_service("common", {"METRICS_DIR": self.tmp.name,
+                                                   "METRICS_FLUSH_SECONDS": "60"}, module="metrics")
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_forked_workers_are_summed_once(self):
+        queries = self.metrics.Counter("order_queries_total", "Order queries.", ["name"])
+        seconds = self.metrics.Histogram("order_query_seconds", "Order query latency.")
+        queries.inc(2, name="latest")
+        seconds.observe(0.002)
+        # a preloaded app forks its workers after import, as gunicorn --preload does
+        pid = os.fork()
+        if pid == 0:
+            try:
+                queries.inc(3, name="latest")
+                seconds.observe(0.2)
+                self.metrics.write_snapshot()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        text = self.metrics.render()
+        self.assertIn('order_queries_total{name="latest"} 5', text)
+        self.assertIn('order_query_seconds_count 2', text)
+        self.assertIn('order_query_seconds_bucket{le="0.0025"} 1', text)
+        # per-process values only for workers still running
+        self.assertIn(f'process_resident_memory_bytes{{pid="{os.getpid()}"}}', text)
+        self.assertNotIn(f'pid="{pid}"', text)
+
+class TestOrderServiceInProcess(unittest.TestCase):
+    """The order service app over a synthetic order table, through Flask's test client."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.tmp.name, "Order_Data_Dataset.csv")
+        cls.orders = write_orders(path, 3000, customers=200, seed=0)
+        env = {"DATA_PATH": path, "TRACE_EXPORT": "off", "PROFILING_ENABLED": "1",
+               "PROFILING_DIR": os.path.join(cls.tmp.name, "profiles")}
+        with mock.patch.dict(os.environ):
+            cls.service = load_service("order_service", env)
+        cls.client = cls.service.app.test_client()
+        cls.customer = cls.orders["customer_ids"][0]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def get(self, path, **params):
+        return self.client.get(path, query_string=params)
+
+    def test_high_profit_products_top_n(self):
+        response = self.get("/data/high-profit-products", min_profit=50, limit=5, sort="desc")
+        self.assertEqual(response.status_code, 200)
+        profits = [d["Profit"] for d in response.get_json()]
+        self.assertEqual(len(profits), 5)
+        self.assertEqual(profits, sorted(profits, reverse=True))
+        self.assertTrue(all(p > 50 for p in profits))
+
+        ascending = [d["Profit"] for d in self.get("/data/high-profit-products", min_profit=50, sort="asc").get_json()]
+        self.assertEqual(ascending, sorted(ascending))
+        self.assertEqual(ascending[-5:][::-1], profits)
+        self.assertEqual(self.get("/data/high-profit-products", limit=0).status_code, 400)
+        self.assertEqual(self.get("/data/high-profit-products", sort="sideways").status_code, 400)
+
+    def test_order_priority_limit(self):
+        response = self.get("/data/order-priority/High", sort="recent", limit=3)
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(len(data), 3)
+        self.assertTrue(all(d["Order_Priority"] == "High" for d in data))
+        self.assertEqual(self.get("/data/order-priority/High", limit=0).status_code, 400)
+        self.assertEqual(self.get("/data/order-priority/High", limit=-2).status_code, 400)
+
+    def test_latest_orders_endpoint(self):
+        everything = self.get(f"/data/customer/{self.customer}").get_json()
+        response = self.get(f"/data/customer/{self.customer}/latest", n=2)
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(len(data), 2)
+        self.assertEqual(int(response.headers["X-Total-Count"]), len(everything))
+        dates = [(d["Order_Date"], d["Time"]) for d in data]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        self.assertEqual(dates[0], max((d["Order_Date"], d["Time"]) for d in everything))
+        self.assertEqual(self.get(f"/data/customer/{self.customer}/latest", n=0).status_code, 400)
+
+    def test_date_range_and_monthly_sales_endpoints(self):
+        response = self.get("/data/orders/date-range", start="2018-01-01", end="2018-01-31")
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertTrue(data)
+        self.assertTrue(all("2018-01-01" <= d["Order_Date"] <= "2018-01-31" for d in data))
+
+        response = self.get("/data/sales/monthly", start="2018-01-01", end="2018-01-31")
+        self.assertEqual(response.status_code, 200)
+        monthly = response.get_json()
+        self.assertEqual([m["period"] for m in monthly], ["2018-01"])
+        self.assertAlmostEqual(monthly[0]["Sales"], sum(d["Sales"] for d in data), places=2)
+        self.assertEqual(self.get("/data/sales/hourly").status_code, 400)
+        self.assertEqual(self.get("/data/orders/date-range", start="2018-13-45").status_code, 400)
+
+    def test_orders_by_id_endpoint(self):
+        ids = [o["Order_Id"] for o in self.get("/data/order-priority/High", limit=3).get_json()]
+        response = self.get("/data/orders/by-id", ids=",".join(map(str, ids[::-1])))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([o["Order_Id"] for o in response.get_json()], ids[::-1])
+        self.assertEqual(self.get("/data/orders/by-id", ids="abc").status_code, 400)
+        self.assertEqual(self.get("/data/orders/by-id", ids="99999999").status_code, 400)
+
+    def test_customers_orders_endpoint(self):
+        other = self.orders["customer_ids"][1]
+        response = self.get("/data/customers", ids=f"{self.customer},{other},99999999", n=1)
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(set(data), {str(self.customer), str(other)})
+        for cid in (self.customer, other):
+            latest = self.get(f"/data/customer/{cid}/latest")
+            self.assertEqual(data[str(cid)]["orders"], latest.get_json())
+            self.assertEqual(data[str(cid)]["total"], int(latest.headers["X-Total-Count"]))
+
+        everything = self.get("/data/customers", ids=str(self.customer)).get_json()[str(self.customer)]
+        self.assertEqual(len(everything["orders"]), everything["total"])
+        self.assertEqual(self.get("/data/customers", ids="x").status_code, 400)
+        self.assertEqual(self.get("/data/customers").status_code, 400)
+
+    def test_missing_values_serialize_as_null(self):
+        data = self.get("/data").get_json()
+        self.assertEqual(len(data), 3000)
+        self.assertTrue(all(isinstance(d["Customer_Id"], int) for d in data))
+        self.assertNotIn("NaN", self.get("/data").get_data(as_text=True))
+
+    def test_request_id_and_server_timing(self):
+        response = self.client.get("/data/total-sales-by-category", headers={"X-Request-ID": "test-trace-2"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.get("X-Request-ID"), "test-trace-2")
+        self.assertIn("total;dur=", response.headers.get("Server-Timing", ""))
+        self.assertIn("query.total_sales_by_category", response.headers.get("Server-Timing", ""))
+
+    def test_metrics_endpoint(self):
+        self.get("/data/total-sales-by-category")
+        response = self.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertIn('route="/data/total-sales-by-category"', text)
+        self.assertIn('span="query.total_sales_by_category"', text)
+        self.assertIn("process_resident_memory_bytes", text)
+
+    def test_profile_endpoint(self):
+        response = self.get("/debug/profile/cpu", seconds=0.2, format="top")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment; filename="order_service-cpu-', response.headers["Content-Disposition"])
+        self.assertIn("samples over", response.get_data(as_text=True))
+        self.assertEqual(self.get("/debug/profile/disk").status_code, 400)
+        self.assertEqual(self.get("/debug/profile/artifacts/missing.txt").status_code, 404)
+
 if __name__ == '__main__':
     unittest.main()
@@ -58,7 +58,7 @@ class TestPerformance(unittest.TestCase):
                 avg_time = statistics.mean(response_times)
                 median_time = statistics.median(response_times)
                 min_time = min(response_times)
-                max_time = statistics.max(response_times)
+                max_time = max(response_times)
             
                 print("\nPerformance Results (Product Search):")
                 print(f"Average response time: {avg_time:.2f}s")
@@ -174,7 +174,7 @@ class TestPerformance(unittest.TestCase):
                 avg_time = statistics.mean(response_times)
                 median_time = statistics.median(response_times)
                 min_time = min(response_times)
-                max_time = statistics.max(response_times)
+                max_time = max(response_times)
             
                 print("\nPerformance Results (Order Service):")
                 print(f"Average response time: {avg_time:.2f}s")
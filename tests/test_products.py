@@ -3,9 +3,24 @@ import requests
 import json
 import os
 import sys
+import time
+import zlib
+import tempfile
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fixtures import write_catalog
+from offline_bench import load_service
+
+HAS_RETRIEVER_DEPS = all(importlib.util.find_spec(name) is not None
+                         for name in ("langchain_community", "faiss", "sentence_transformers"))
 
 class TestProductService(unittest.TestCase):
     def setUp(self):
@@ -129,5 +144,148 @@ class TestProductService(unittest.TestCase):
             # This exception is expected if the service is truly unavailable
             print(f"✅ Product service handled service unavailable error")
 
+def _words(text):
+    return set(text.lower().split())
+
+
+class FakeEmbeddings:
+    """Hashed bag of words: deterministic, and no model download."""
+    def __init__(self, model_name=None, **kwargs):
+        pass
+
+    def _vector(self, text):
+        vec = np.zeros(64, dtype=np.float32)
+        for word in _words(text):
+            vec[zlib.crc32(word.encode()) % 64] += 1
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    def __call__(self, text):
+        return self.embed_query(text)
+
+
+class FakeCrossEncoder:
+    """Scores a (query, title) pair by the words they share."""
+    def __init__(self, model_name=None, **kwargs):
+        pass
+
+    def predict(self, pairs):
+        return np.array([len(_words(q) & _words(t)) for q, t in pairs], dtype=np.float32)
+
+
+@unittest.skipUnless(HAS_RETRIEVER_DEPS, "needs langchain_community, faiss and sentence_transformers")
+class TestProductServiceInProcess(unittest.TestCase):
+    """The product service app over a synthetic catalog (real FAISS, fake models)."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.tmp.name, "Product_Information_Dataset.csv")
+        cls.catalog = write_catalog(path, 300, seed=0)
+        env = {"DATA_PATH": path, "FAISS_INDEX_PATH": os.path.join(cls.tmp.name, "faiss_index"),
+               "TRACE_EXPORT": "off", "SEARCH_BATCH_MAX": "8"}
+        with mock.patch.dict(os.environ), \
+                mock.patch("langchain_community.embeddings.HuggingFaceEmbeddings", FakeEmbeddings), \
+                mock.patch("sentence_transformers.CrossEncoder", FakeCrossEncoder):
+            cls.service = load_service("product_service", env)
+        cls.client = cls.service.app.test_client()
+        cls.queries = cls.catalog["queries"][:4]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        with self.service.cache_lock:
+            self.service.cache.clear()
+
+    def search(self, query, top_k=3):
+        response = self.client.post("/search", json={"query": query, "top_k": top_k})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def search_batch(self, body):
+        return self.client.post("/search/batch", json=body)
+
+    def test_search_endpoint(self):
+        results = self.search(self.queries[0])
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(p["rating"] >= 4.0 for p in results))
+        self.assertTrue(all(_words(self.queries[0]) & _words(p["title"]) for p in results))
+
+    def test_batch_search_endpoint(self):
+        queries = self.queries + [self.queries[0]]
+        response = self.search_batch({"queries": queries, "top_k": 3})
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()["results"]
+        self.assertEqual(len(results), len(queries))
+        self.assertEqual(results[0], results[-1])
+        with self.service.cache_lock:
+            self.service.cache.clear()
+        for query, batched in zip(queries, results):
+            self.assertEqual([p["asin"] for p in batched],
+                             [p["asin"] for p in self.search(query)])
+
+    def test_batch_search_validation(self):
+        self.assertEqual(self.search_batch({"queries": "guitar"}).status_code, 400)
+        self.assertEqual(self.search_batch({"queries": ["guitar", 3]}).status_code, 400)
+        self.assertEqual(self.search_batch({"queries": ["guitar"], "top_k": "5"}).status_code, 400)
+        self.assertEqual(self.search_batch({"queries": ["guitar"], "top_k": 0}).status_code, 400)
+        self.assertEqual(self.search_batch({"queries": ["guitar"], "min_rating": 9}).status_code, 400)
+        self.assertEqual(self.search_batch({"queries": ["guitar"] * 9}).status_code, 413)
+        self.assertEqual(self.client.post("/search", json={"query": "guitar", "top_k": "5"}).status_code, 400)
+
+    def test_batch_search_isolates_failing_queries(self):
+        expected = [[p["asin"] for p in self.search(q)] for q in self.queries]
+        with self.service.cache_lock:
+            self.service.cache.clear()
+        retriever = self.service.retriever
+        real_predict = retriever.reranker.predict
+
+        def predict(pairs):
+            queries = {q for q, _ in pairs}
+            if len(queries) > 1 or self.queries[1] in queries:
+                raise RuntimeError("reranker failed")
+            return real_predict(pairs)
+
+        with mock.patch.object(retriever.reranker, "predict", predict):
+            response = self.search_batch({"queries": self.queries, "top_k": 3})
+        self.assertEqual(response.status_code, 200)
+        results = [[p["asin"] for p in r] for r in response.get_json()["results"]]
+        self.assertEqual(results[1], [])
+        self.assertEqual(results[:1] + results[2:], expected[:1] + expected[2:])
+
+    def test_concurrent_identical_searches_coalesce(self):
+        retriever = self.service.retriever
+        real_predict = retriever.reranker.predict
+
+        def slow_predict(pairs):
+            time.sleep(0.2)  # keep the first search in flight while the others arrive
+            return real_predict(pairs)
+
+        payload = {"query": self.queries[2], "top_k": 3}
+        before = self.client.get("/stats/single-flight").get_json()
+        with mock.patch.object(retriever.reranker, "predict", slow_predict), \
+                ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(
+                lambda _: self.service.app.test_client().post("/search", json=payload), range(8)))
+        self.assertTrue(all(r.status_code == 200 for r in responses))
+        self.assertTrue(all(r.get_json() == responses[0].get_json() for r in responses))
+        after = self.client.get("/stats/single-flight").get_json()
+        self.assertEqual(after["executions"] - before["executions"], 1)
+
+    def test_metrics_endpoint(self):
+        self.search(self.queries[3])
+        text = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_bucket{method="POST",route="/search"', text)
+        self.assertIn('search_cache_lookups_total{result="miss"}', text)
+        self.assertIn('span_duration_seconds_count{span="retriever.faiss"}', text)
+
 if __name__ == '__main__':
     unittest.main()
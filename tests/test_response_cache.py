@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chat_service"))
+
+from response_cache import DiskStore, ResponseCache, _PromptIndex
+
+
+def _embedder(texts):
+    # one axis per leading word, so prompts that start alike are near-duplicates
+    vocab = ["shipping", "returns", "warranty", "payment"]
+    return [[1.0 if t.split()[0] == w else 0.0 for w in vocab] + [0.1] for t in texts]
+
+
+class TestDiskStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = DiskStore(os.path.join(self.tmp.name, "cache.sqlite3"), maxsize=40)
+
+    def tearDown(self):
+        self.store._db.close()
+        self.tmp.cleanup()
+
+    def test_evicts_least_recently_used_in_batches(self):
+        self.assertEqual(self.store.evict_every, 2)
+        for i in range(41):
+            self.store.set(f"k{i}", {"i": i})
+        # 41 rows: the next check is on the 42nd insert
+        self.assertEqual(len(self.store), 41)
+        self.store.get("k0")
+        self.store.set("k41", {"i": 41})
+        self.assertEqual(len(self.store), 40)
+        self.assertIsNotNone(self.store.get("k0"))
+        self.assertIsNone(self.store.get("k1"))
+        self.assertIsNone(self.store.get("k2"))
+        self.assertEqual(self.store.get("k41"), {"i": 41})
+
+
+class TestPromptIndex(unittest.TestCase):
+    def test_reuses_rows_least_recently_added_first(self):
+        index = _PromptIndex(2)
+        index.add("a", "sonar", np.array([1.0, 0.0], dtype=np.float32))
+        index.add("b", "sonar", np.array([0.0, 1.0], dtype=np.float32))
+        index.add("c", "sonar", np.array([0.6, 0.8], dtype=np.float32))
+        self.assertEqual(len(index), 2)
+        key, score = index.nearest(np.array([1.0, 0.0], dtype=np.float32), "sonar")
+        self.assertEqual(key, "c")
+        self.assertAlmostEqual(score, 0.6, places=6)
+
+    def test_filters_by_model_and_frees_rows(self):
+        index = _PromptIndex(4)
+        index.add("a", "sonar", np.array([1.0, 0.0], dtype=np.float32))
+        index.add("b", "sonar-pro", np.array([0.0, 1.0], dtype=np.float32))
+        self.assertEqual(index.nearest(np.array([1.0, 0.0], dtype=np.float32), "sonar-pro")[0], "b")
+        index.remove("b")
+        self.assertEqual(index.nearest(np.array([1.0, 0.0], dtype=np.float32), "sonar-pro"), (None, 0.0))
+        self.assertEqual(index.nearest(np.array([0.0, 1.0], dtype=np.float32), "other"), (None, 0.0))
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_exact_and_semantic_hits(self):
+        cache = ResponseCache(similarity_threshold=0.9, embedder=_embedder, max_index=8)
+        cache.put("shipping to  Canada", "sonar", {"content": "ca"}, elapsed=1.5)
+        self.assertEqual(cache.lookup("shipping to Canada", "sonar"), {"content": "ca"})
+        self.assertEqual(cache.lookup("shipping times for Canada", "sonar"), {"content": "ca"})
+        self.assertIsNone(cache.lookup("returns policy", "sonar"))
+        self.assertIsNone(cache.lookup("shipping to Canada", "sonar-pro"))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["semantic_hits"], stats["misses"]), (1, 1, 2))
+        self.assertEqual(stats["saved_seconds"], 3.0)
+        self.assertEqual(stats["indexed_prompts"], 1)
+
+    def test_expired_entries_leave_the_index(self):
+        cache = ResponseCache(ttl=-1, similarity_threshold=0.9, embedder=_embedder)
+        cache.put("warranty terms", "sonar", {"content": "w"})
+        self.assertIsNone(cache.lookup("warranty terms", "sonar"))
+        self.assertEqual(cache.stats()["indexed_prompts"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chat_service"))
+
+import session_manager
+import session_store
+from session_manager import Session, SessionManager
+from session_store import RedisSessionStore, SessionConflict, SQLiteSessionStore
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+class TestSessionManager(unittest.TestCase):
+    def setUp(self):
+        # no background sweeps; the tests call _cleanup_expired_sessions themselves
+        patcher = mock.patch.object(SessionManager, "_ensure_sweeper")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock = Clock()
+        patcher = mock.patch.object(session_store, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _new(self, mgr: SessionManager) -> Session:
+        session = mgr.get_session()
+        mgr.save_session(session)
+        return session
+
+    def test_expired_sessions_are_swept_oldest_first(self):
+        mgr = SessionManager(session_expiry_seconds=60)
+        a, b, c = (self._new(mgr) for _ in range(3))
+        self.clock.now += 30
+        self.assertIs(mgr.get_session(a.session_id), a)  # a now expires 30s after b and c
+        self.clock.now += 40
+        mgr._cleanup_expired_sessions()
+        self.assertIs(mgr.get_session(a.session_id), a)
+        self.assertIsNot(mgr.get_session(b.session_id), b)
+        self.assertEqual(mgr.stats()["evicted_expired"], 2)
+
+        self.clock.now += 61
+        self.assertNotEqual(mgr.get_session(a.session_id).session_id, a.session_id)
+        stats = mgr.stats()
+        self.assertEqual((stats["active"], stats["evicted_expired"]), (0, 3))
+
+    def test_live_sessions_are_capped_least_recently_used_first(self):
+        mgr = SessionManager(max_sessions=2)
+        a = self._new(mgr)
+        b = self._new(mgr)
+        self.assertIs(mgr.get_session(a.session_id), a)
+        c = self._new(mgr)
+        self.assertIs(mgr.get_session(a.session_id), a)
+        self.assertIs(mgr.get_session(c.session_id), c)
+        self.assertIsNot(mgr.get_session(b.session_id), b)
+        stats = mgr.stats()
+        self.assertEqual((stats["active"], stats["evicted_capacity"], stats["evicted_expired"]), (2, 1, 0))
+
+    def test_ended_sessions_are_not_saved(self):
+        mgr = SessionManager()
+        session = self._new(mgr)
+        mgr.end_session(session.session_id)
+        session.ended = True
+        mgr.save_session(session)
+        self.assertEqual(mgr.stats()["active"], 0)
+
+    def test_concurrent_turns_share_the_in_process_session(self):
+        mgr = SessionManager()
+        session = self._new(mgr)
+        first, second = mgr.get_session(session.session_id), mgr.get_session(session.session_id)
+        self.assertIs(first, second)
+        mgr.save_session(first)
+        mgr.save_session(second)
+
+    def test_history_is_a_ring_buffer(self):
+        session = session_manager.Session("s", history_capacity=3)
+        for i in range(5):
+            session.add_to_history("user" if i % 2 == 0 else "bot", f"m{i}")
+        self.assertEqual([h["message"] for h in session.get_history(0)], ["m2", "m3", "m4"])
+        self.assertEqual(session.get_history(1)[0]["role"], "user")
+
+
+class TestSweeperStart(unittest.TestCase):
+    def test_concurrent_first_requests_start_one_sweeper(self):
+        started = []
+
+        class FakeThread:
+            def __init__(self, target, name, daemon):
+                self.name = name
+
+            def start(self):
+                started.append(self.name)
+
+        real_getpid = os.getpid
+
+        def slow_getpid():
+            time.sleep(0.01)  # widen the window between the pid check and the start
+            return real_getpid()
+
+        mgr = SessionManager()
+        barrier = threading.Barrier(8)
+
+        def first_request():
+            barrier.wait()
+            mgr.get_session()
+
+        workers = [threading.Thread(target=first_request) for _ in range(8)]
+        with mock.patch.object(session_manager.threading, "Thread", FakeThread), \
+                mock.patch.object(session_manager.os, "getpid", slow_getpid):
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+        self.assertEqual(started, ["session-sweeper"])
+
+
+class SharedStoreTests:
+    """Round trip and compare-and-set checks run against every shared store."""
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        patcher = mock.patch.object(SessionManager, "_ensure_sweeper")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mgr = SessionManager(session_expiry_seconds=60, store=self.make_store())
+
+    def test_state_round_trips(self):
+        session = self.mgr.get_session()
+        session.add_to_history("user", "where is my order?")
+        session.set_data("customer_id", 42)
+        session.set_expected_input("customer_id_for_specific_order")
+        self.mgr.save_session(session)
+
+        loaded = self.mgr.get_session(session.session_id)
+        self.assertIsNot(loaded, session)
+        self.assertEqual(loaded.version, 1)
+        self.assertEqual(loaded.get_data("customer_id"), 42)
+        self.assertEqual(loaded.get_expected_input(), "customer_id_for_specific_order")
+        self.assertEqual(loaded.get_history()[0]["message"], "where is my order?")
+
+    def test_stale_save_raises_conflict(self):
+        session = self.mgr.get_session()
+        self.mgr.save_session(session)
+        first = self.mgr.get_session(session.session_id)
+        second = self.mgr.get_session(session.session_id)
+        first.add_to_history("user", "first")
+        self.mgr.save_session(first)
+        second.add_to_history("user", "second")
+        with self.assertRaises(SessionConflict):
+            self.mgr.save_session(second)
+        history = self.mgr.get_session(session.session_id).get_history()
+        self.assertEqual([h["message"] for h in history], ["first"])
+
+    def test_racing_creates_conflict(self):
+        session = self.mgr.get_session()
+        twin = Session(session.session_id)
+        self.mgr.save_session(session)
+        with self.assertRaises(SessionConflict):
+            self.mgr.save_session(twin)
+
+    def test_ended_session_is_gone(self):
+        session = self.mgr.get_session()
+        self.mgr.save_session(session)
+        self.mgr.end_session(session.session_id)
+        self.assertNotEqual(self.mgr.get_session(session.session_id).session_id, session.session_id)
+
+
+class TestSQLiteSessionStore(SharedStoreTests, unittest.TestCase):
+    def make_store(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return SQLiteSessionStore(os.path.join(tmp.name, "sessions.sqlite3"))
+
+    def test_expired_sessions_are_purged(self):
+        session = self.mgr.get_session()
+        self.mgr.save_session(session)
+        with mock.patch.object(session_store.time, "time", return_value=time.time() + 61):
+            self.mgr._cleanup_expired_sessions()
+        self.assertEqual(self.mgr.stats()["evicted_expired"], 1)
+        self.assertNotEqual(self.mgr.get_session(session.session_id).session_id, session.session_id)
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class TestRedisSessionStore(SharedStoreTests, unittest.TestCase):
+    def make_store(self):
+        return RedisSessionStore(client=fakeredis.FakeRedis())
+
+
+if __name__ == "__main__":
+    unittest.main()